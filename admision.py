@@ -0,0 +1,238 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from database import MAX_OVERFLOW, POOL_SIZE
+
+# Tokens por segundo y rafaga por cliente (IP). ADMISION_RPS=0 apaga el limite por cliente
+ADMISION_RPS = float(os.getenv("ADMISION_RPS", "50"))
+ADMISION_RAFAGA = float(os.getenv("ADMISION_RAFAGA", "100"))
+# Cubetas que se guardan como maximo; las que se llenaron de nuevo se pueden tirar
+ADMISION_MAX_CLIENTES = int(os.getenv("ADMISION_MAX_CLIENTES", "10000"))
+# 1 = el cliente es el primer IP de X-Forwarded-For (solo detras de un proxy propio)
+ADMISION_CONFIAR_PROXY = os.getenv("ADMISION_CONFIAR_PROXY", "0") == "1"
+# Requests atendiendose a la vez: por defecto lo que da el pool (size + overflow), asi nadie espera
+# un checkout hasta el timeout del pool. 0 apaga el limite global
+ADMISION_CAPACIDAD = int(os.getenv("ADMISION_CAPACIDAD", str(POOL_SIZE + MAX_OVERFLOW)))
+ADMISION_RETRY_AFTER = int(os.getenv("ADMISION_RETRY_AFTER", "1"))
+
+# Carril -> (prioridad, fraccion de la capacidad que puede ocupar, espera maxima en la cola en segundos).
+# alta: login y datos de referencia (chicos y cacheados); baja: exports, bulk y listados grandes,
+# que se cortan rapido para dejar lugar a lo demas
+CARRILES = {
+    "alta": (0, 1.0, 2.0),
+    "normal": (1, 0.8, 0.5),
+    "baja": (2, 0.4, 0.1),
+}
+REFERENCIA = ("/actividades", "/equipamiento", "/instructores", "/turnos")
+LISTADOS_GRANDES = {"/alumnos", "/alumnosclase", "/clases"}
+# Nunca se limitan: si no, no se puede ver el estado justo cuando hace falta
+SIN_LIMITE = {"/metrics", "/internal/limites"}
+
+
+def carril(metodo, path):
+    if path == "/login" or metodo == "GET" and path.startswith(REFERENCIA):
+        return "alta"
+    if path.startswith("/export/") or path.endswith("/bulk") or metodo == "GET" and path in LISTADOS_GRANDES:
+        return "baja"
+    return "normal"
+
+
+######################################################################
+#                            Por cliente                             #
+######################################################################
+
+# Token bucket por cliente: cada request gasta un token, se recargan a `tasa` por segundo hasta `rafaga`
+class LimitePorCliente:
+    def __init__(self, tasa=ADMISION_RPS, rafaga=ADMISION_RAFAGA, maximo=ADMISION_MAX_CLIENTES):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.maximo = maximo
+        self.cubetas = {}
+
+    # Devuelve 0 si hay token, o los segundos hasta que haya uno
+    def tomar(self, cliente, ahora=None):
+        if self.tasa <= 0:
+            return 0
+        ahora = time.monotonic() if ahora is None else ahora
+        tokens, ultimo = self.cubetas.get(cliente, (self.rafaga, ahora))
+        tokens = min(self.rafaga, tokens + (ahora - ultimo) * self.tasa)
+        if tokens < 1:
+            self.cubetas[cliente] = (tokens, ahora)
+            return (1 - tokens) / self.tasa
+        if cliente not in self.cubetas and len(self.cubetas) >= self.maximo:
+            self._purgar(ahora)
+        self.cubetas[cliente] = (tokens - 1, ahora)
+        return 0
+
+    # Una cubeta que ya se recargo entera es igual a no tenerla
+    def _purgar(self, ahora):
+        llena = self.rafaga / self.tasa
+        for cliente, (_, ultimo) in list(self.cubetas.items()):
+            if ahora - ultimo >= llena:
+                del self.cubetas[cliente]
+
+
+######################################################################
+#                            Global                                  #
+######################################################################
+
+# Semaforo con carriles: cada carril puede ocupar hasta su fraccion de la capacidad y, si no hay
+# lugar, espera en su cola hasta su espera maxima. Al liberarse un lugar se despierta primero al de
+# mayor prioridad
+class LimiteGlobal:
+    def __init__(self, capacidad=ADMISION_CAPACIDAD, carriles=CARRILES):
+        self.capacidad = capacidad
+        self.orden = sorted(carriles, key=lambda nombre: carriles[nombre][0])
+        self.limites = {nombre: max(1, math.floor(capacidad * fraccion)) for nombre, (_, fraccion, _) in carriles.items()}
+        self.esperas = {nombre: espera for nombre, (_, _, espera) in carriles.items()}
+        self.colas = {nombre: deque() for nombre in carriles}
+        self.en_uso = 0
+
+    def _hay_prioritarios(self, nombre):
+        for otro in self.orden:
+            if self.colas[otro]:
+                return True
+            if otro == nombre:
+                return False
+        return False
+
+    # True si consiguio lugar; False si se vencio la espera
+    async def entrar(self, nombre):
+        if self.capacidad <= 0:
+            return True
+        if self.en_uso < self.limites[nombre] and not self._hay_prioritarios(nombre):
+            self.en_uso += 1
+            return True
+        if self.esperas[nombre] <= 0:
+            return False
+        cola = self.colas[nombre]
+        lugar = asyncio.get_running_loop().create_future()
+        cola.append(lugar)
+        try:
+            await asyncio.wait_for(lugar, self.esperas[nombre])
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except BaseException:
+            # Cancelado justo despues de recibir el lugar: se devuelve
+            if lugar.done() and not lugar.cancelled():
+                self.salir()
+            raise
+        finally:
+            if not lugar.done() or lugar.cancelled():
+                try:
+                    cola.remove(lugar)
+                except ValueError:
+                    pass
+
+    def salir(self):
+        if self.capacidad <= 0:
+            return
+        self.en_uso -= 1
+        for nombre in self.orden:
+            cola = self.colas[nombre]
+            while cola and self.en_uso < self.limites[nombre]:
+                lugar = cola.popleft()
+                if lugar.done():
+                    continue
+                self.en_uso += 1
+                lugar.set_result(None)
+            if cola:
+                return
+
+    def esperando(self):
+        return {nombre: len(cola) for nombre, cola in self.colas.items()}
+
+
+######################################################################
+#                            Middleware                              #
+######################################################################
+
+class EstadoAdmision:
+    def __init__(self):
+        self.admitidos = {}
+        self.rechazos = {}
+
+    def admitido(self, nombre):
+        self.admitidos[nombre] = self.admitidos.get(nombre, 0) + 1
+
+    def rechazado(self, motivo, nombre):
+        self.rechazos[(motivo, nombre)] = self.rechazos.get((motivo, nombre), 0) + 1
+
+
+def _cliente(scope):
+    if ADMISION_CONFIAR_PROXY:
+        for clave, valor in scope.get("headers", ()):
+            if clave == b"x-forwarded-for":
+                return valor.decode("latin-1").split(",")[0].strip()
+    cliente = scope.get("client")
+    return cliente[0] if cliente else "desconocido"
+
+
+async def _rechazar(send, estado, detalle, retry_after):
+    cuerpo = b'{"detail":"' + detalle.encode() + b'"}'
+    await send({
+        "type": "http.response.start",
+        "status": estado,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(cuerpo)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+# Middleware ASGI: primero el limite por cliente (429) y despues el lugar en el carril (503). Los
+# rechazos se contestan enseguida con Retry-After en vez de quedar esperando el pool. Los preflight
+# de CORS y SIN_LIMITE pasan directo
+class AdmisionRequests:
+    def __init__(self, app, por_cliente=None, global_=None):
+        self.app = app
+        self.por_cliente = por_cliente or limite_por_cliente
+        self.global_ = global_ or limite_global
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in SIN_LIMITE:
+            await self.app(scope, receive, send)
+            return
+        nombre = carril(scope["method"], scope["path"])
+
+        espera = self.por_cliente.tomar(_cliente(scope))
+        if espera:
+            estado_admision.rechazado("cliente", nombre)
+            await _rechazar(send, 429, "Too many requests", max(1, math.ceil(espera)))
+            return
+
+        if not await self.global_.entrar(nombre):
+            estado_admision.rechazado("capacidad", nombre)
+            await _rechazar(send, 503, "Server busy, retry later", ADMISION_RETRY_AFTER)
+            return
+        estado_admision.admitido(nombre)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.global_.salir()
+
+
+limite_por_cliente = LimitePorCliente()
+limite_global = LimiteGlobal()
+estado_admision = EstadoAdmision()
+
+
+def estado_limites():
+    return {
+        "capacidad": limite_global.capacidad,
+        "en_uso": limite_global.en_uso,
+        "limites": limite_global.limites,
+        "esperando": limite_global.esperando(),
+        "admitidos": estado_admision.admitidos,
+        "rechazos": [
+            {"motivo": motivo, "carril": nombre, "cantidad": cantidad}
+            for (motivo, nombre), cantidad in sorted(estado_admision.rechazos.items())
+        ],
+        "por_cliente": {"rps": limite_por_cliente.tasa, "rafaga": limite_por_cliente.rafaga, "clientes": len(limite_por_cliente.cubetas)},
+    }
@@ -0,0 +1,224 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from consultas import CONSULTAS
+from database import get_db
+from metricas import consultas_request
+
+logger = logging.getLogger(__name__)
+
+# 1 = todas las rutas salvo RUTAS_PUBLICAS piden "Authorization: Bearer <token>"
+AUTH_REQUERIDA = os.getenv("AUTH_REQUERIDA", "1") == "1"
+# Clave de firma de los tokens. Sin AUTH_SECRET se genera una por proceso: los tokens dejan de
+# valer al reiniciar y no sirven entre workers
+AUTH_SECRET = os.getenv("AUTH_SECRET", "").encode() or secrets.token_bytes(32)
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", str(8 * 3600)))
+# Tokens ya verificados contra la tabla login: cuantos se guardan y por cuanto tiempo como maximo
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+# Parametros de scrypt (n=2^14, r=8 usa 16 MB por hash) y cuantos hashes corren a la vez en el threadpool
+SCRYPT_N = int(os.getenv("AUTH_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("AUTH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("AUTH_SCRYPT_P", "1"))
+HASHES_EN_PARALELO = int(os.getenv("AUTH_HASHES_EN_PARALELO", str(os.cpu_count() or 1)))
+
+# /docs y /openapi.json no pasan por las dependencias de la app, no hace falta listarlas
+RUTAS_PUBLICAS = {"/login", "/metrics"}
+
+if not os.getenv("AUTH_SECRET"):
+    logger.warning("AUTH_SECRET no esta definido, se usa una clave al azar para este proceso")
+
+
+######################################################################
+#                            Contraseñas                             #
+######################################################################
+
+def _b64(datos):
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode()
+
+
+def _de_b64(texto):
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _scrypt(contraseña, salt, n, r, p):
+    return hashlib.scrypt(contraseña.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
+
+# Formato guardado en login.contraseña: scrypt$n$r$p$salt$hash
+def hashear(contraseña):
+    salt = secrets.token_bytes(16)
+    clave = _scrypt(contraseña, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(clave)}"
+
+
+# Devuelve (valida, hay_que_rehashear). Las contraseñas viejas en texto plano se aceptan una vez
+# y se rehashean en ese mismo login; lo mismo si cambiaron los parametros de scrypt
+def verificar(contraseña, guardada):
+    if not guardada.startswith("scrypt$"):
+        return hmac.compare_digest(contraseña.encode(), guardada.encode()), True
+    try:
+        _, n, r, p, salt, clave = guardada.split("$")
+        n, r, p = int(n), int(r), int(p)
+    except ValueError:
+        return False, False
+    calculada = _scrypt(contraseña, _de_b64(salt), n, r, p)
+    return hmac.compare_digest(calculada, _de_b64(clave)), (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+# Hash de relleno para que un ci inexistente tarde lo mismo que una contraseña incorrecta
+_hash_falso = None
+_semaforo = None
+
+
+# scrypt corre en el threadpool para no frenar el event loop; el semaforo acota hilos y memoria
+async def _en_hilo(funcion, *args):
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(HASHES_EN_PARALELO)
+    async with _semaforo:
+        return await run_in_threadpool(funcion, *args)
+
+
+async def verificar_en_hilo(contraseña, guardada):
+    global _hash_falso
+    if guardada is None:
+        if _hash_falso is None:
+            _hash_falso = await _en_hilo(hashear, secrets.token_hex(8))
+        await _en_hilo(verificar, contraseña, _hash_falso)
+        return False, False
+    return await _en_hilo(verificar, contraseña, guardada)
+
+
+async def hashear_en_hilo(contraseña):
+    return await _en_hilo(hashear, contraseña)
+
+
+######################################################################
+#                            Tokens                                  #
+######################################################################
+
+# Huella de la contraseña guardada: va en el token, asi cambiar la contraseña invalida los tokens viejos
+def huella(guardada):
+    return _b64(hmac.new(AUTH_SECRET, guardada.encode(), hashlib.sha256).digest()[:9])
+
+
+def _firma(cuerpo):
+    return _b64(hmac.new(AUTH_SECRET, cuerpo.encode(), hashlib.sha256).digest())
+
+
+def emitir_token(ci, correo, guardada, ahora=None):
+    expira = int((ahora or time.time()) + AUTH_TOKEN_TTL)
+    datos = {"ci": ci, "correo": correo, "exp": expira, "h": huella(guardada)}
+    cuerpo = _b64(json.dumps(datos, separators=(",", ":")).encode())
+    return f"{cuerpo}.{_firma(cuerpo)}", expira
+
+
+# Firma y vencimiento, sin ir a la base. Devuelve los datos del token o None
+def leer_token(token, ahora=None):
+    cuerpo, _, firma = token.partition(".")
+    if not firma or not hmac.compare_digest(firma, _firma(cuerpo)):
+        return None
+    try:
+        datos = json.loads(_de_b64(cuerpo))
+    except ValueError:
+        return None
+    if datos.get("exp", 0) <= (ahora or time.time()):
+        return None
+    return datos
+
+
+# LRU de tokens ya verificados contra la tabla login. Cada entrada vence con el token o a los
+# AUTH_CACHE_TTL segundos, lo que pase primero, para que un cambio de contraseña se note rapido
+class CacheTokens:
+    def __init__(self, maximo=AUTH_CACHE_MAX, ttl=AUTH_CACHE_TTL):
+        self.maximo = maximo
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.desalojos = 0
+
+    def obtener(self, token, ahora=None):
+        entrada = self.entradas.get(token)
+        if entrada is None:
+            self.misses += 1
+            return None
+        usuario, vence = entrada
+        if vence <= (ahora or time.time()):
+            del self.entradas[token]
+            self.misses += 1
+            return None
+        self.entradas.move_to_end(token)
+        self.hits += 1
+        return usuario
+
+    def guardar(self, token, usuario, expira, ahora=None):
+        self.entradas[token] = (usuario, min(expira, (ahora or time.time()) + self.ttl))
+        self.entradas.move_to_end(token)
+        while len(self.entradas) > self.maximo:
+            self.entradas.popitem(last=False)
+            self.desalojos += 1
+
+    def estado(self):
+        return {
+            "entradas": len(self.entradas),
+            "maximo": self.maximo,
+            "hits": self.hits,
+            "misses": self.misses,
+            "desalojos": self.desalojos,
+        }
+
+
+cache_tokens = CacheTokens()
+
+
+######################################################################
+#                            Dependencia                             #
+######################################################################
+
+def _no_autorizado(detalle):
+    return HTTPException(status_code=401, detail=detalle, headers={"WWW-Authenticate": "Bearer"})
+
+
+# Valida el token del header. Si no esta en la LRU se confirma contra la tabla login (que el
+# usuario exista y la contraseña no haya cambiado); esa lectura no cuenta para el presupuesto
+# de sentencias de la ruta porque con la cache caliente no ocurre
+async def usuario_actual(request: Request, db: AsyncSession = Depends(get_db)):
+    ruta = getattr(request.scope.get("route"), "path", None)
+    if not AUTH_REQUERIDA or ruta in RUTAS_PUBLICAS:
+        return None
+    esquema, _, token = request.headers.get("authorization", "").partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        raise _no_autorizado("Missing bearer token")
+
+    usuario = cache_tokens.obtener(token)
+    if usuario is not None:
+        return usuario
+    datos = leer_token(token)
+    if datos is None:
+        raise _no_autorizado("Invalid or expired token")
+
+    registro = consultas_request.set(None)
+    try:
+        fila = (await db.execute(CONSULTAS["login.por_correo"], {"correo": datos["correo"]})).fetchone()
+    finally:
+        consultas_request.reset(registro)
+    if fila is None or fila.ci != datos["ci"] or not hmac.compare_digest(huella(fila.contraseña), datos["h"]):
+        raise _no_autorizado("Invalid or expired token")
+
+    usuario = {"ci": fila.ci, "correo": fila.correo}
+    cache_tokens.guardar(token, usuario, datos["exp"])
+    return usuario
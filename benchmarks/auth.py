@@ -0,0 +1,141 @@
+# Costo de la autenticacion de auth.py, en proceso sobre una base SQLite temporal:
+#
+#   python benchmarks/auth.py --logins 200 --concurrencia 1 4 16
+#
+# "hash_ms": un scrypt con los parametros de AUTH_SCRYPT_*.
+# "login": logins por segundo a cada concurrencia, y la latencia de un GET liviano que corre a la
+#          par; si scrypt bloqueara el event loop esa latencia subiria hasta el tiempo de un hash.
+# "overhead": microsegundos que agrega la dependencia por request sobre GET /internal/pool (que no
+#             toca la base): sin auth, con el token en la LRU, y con la LRU vacia (firma + SELECT).
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+CI = "12345678"
+CONTRASEÑA = "bench"
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 3)
+
+
+async def medir_logins(client, total, concurrencia):
+    latencias = []
+    pings = []
+    pendientes = iter(range(total))
+    terminado = False
+
+    async def worker():
+        for _ in pendientes:
+            inicio = time.perf_counter()
+            resp = await client.post("/login", json={"ci": CI, "contraseña": CONTRASEÑA})
+            latencias.append(time.perf_counter() - inicio)
+            resp.raise_for_status()
+
+    async def ping():
+        while not terminado:
+            inicio = time.perf_counter()
+            await client.get("/internal/pool")
+            pings.append(time.perf_counter() - inicio)
+            await asyncio.sleep(0.005)
+
+    tarea_ping = asyncio.ensure_future(ping())
+    inicio = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    terminado = True
+    await tarea_ping
+
+    return {
+        "concurrencia": concurrencia,
+        "logins": total,
+        "logins_por_seg": round(total / duracion, 1),
+        "p50_ms": _ms(statistics.median(latencias)),
+        "ping_p50_ms": _ms(statistics.median(pings)),
+        "ping_max_ms": _ms(max(pings)),
+    }
+
+
+async def medir_overhead(client, iteraciones, preparar=None):
+    tiempos = []
+    for _ in range(iteraciones):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        resp = await client.get("/internal/pool")
+        tiempos.append(time.perf_counter() - inicio)
+        resp.raise_for_status()
+    return statistics.median(tiempos)
+
+
+async def correr(args):
+    import auth
+    from database import engine
+    from main import app
+    from migraciones import migrar
+    from models import User
+    from sqlalchemy import insert
+
+    with engine.connect() as conn:
+        migrar(conn)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), {"ci": CI, "correo": "bench@bench.com", "contraseña": auth.hashear(CONTRASEÑA)})
+
+    inicio = time.perf_counter()
+    for _ in range(5):
+        auth.hashear(CONTRASEÑA)
+    informe = {"hash_ms": _ms((time.perf_counter() - inicio) / 5), "scrypt": [auth.SCRYPT_N, auth.SCRYPT_R, auth.SCRYPT_P]}
+
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as client:
+            resp = await client.post("/login", json={"ci": CI, "contraseña": CONTRASEÑA})
+            client.headers["Authorization"] = f"Bearer {resp.json()['token']}"
+            informe["login"] = [await medir_logins(client, args.logins, c) for c in args.concurrencia]
+
+            # Las tres variantes se alternan en varias rondas y queda la mejor mediana de cada una,
+            # asi el ruido de la maquina no se carga a una sola
+            rondas = {"sin_auth": [], "con_cache": [], "sin_cache": []}
+            for _ in range(args.rondas):
+                auth.AUTH_REQUERIDA = False
+                rondas["sin_auth"].append(await medir_overhead(client, args.iteraciones))
+                auth.AUTH_REQUERIDA = True
+                rondas["con_cache"].append(await medir_overhead(client, args.iteraciones))
+                rondas["sin_cache"].append(await medir_overhead(client, args.iteraciones, auth.cache_tokens.entradas.clear))
+            sin_auth, con_cache, sin_cache = (min(rondas[clave]) for clave in ("sin_auth", "con_cache", "sin_cache"))
+    informe["overhead"] = {
+        "sin_auth_us": round(sin_auth * 1_000_000, 1),
+        "token_en_cache_us": round((con_cache - sin_auth) * 1_000_000, 1),
+        "token_sin_cache_us": round((sin_cache - sin_auth) * 1_000_000, 1),
+    }
+    return informe
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--iteraciones", type=int, default=1000)
+    parser.add_argument("--rondas", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(directorio, "auth.db")
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        os.environ.setdefault("AUTH_SECRET", "bench")
+        os.environ.setdefault("ADMISION_RPS", "0")
+        informe = asyncio.run(correr(args))
+    print(json.dumps(informe, indent=2))
+
+
+if __name__ == "__main__":
+    main()
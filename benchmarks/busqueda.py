@@ -0,0 +1,135 @@
+# Latencia de la busqueda de alumnos de busqueda.py sobre una base ya cargada, por ejemplo:
+#
+#   python benchmarks/generar_datos.py --db sqlite:////tmp/escala.db --alumnos 1000000
+#   DATABASE_URL=sqlite:////tmp/escala.db python benchmarks/busqueda.py --consultas 2000
+#
+# "carga_s" y "memoria_mb": armar el indice desde la tabla (la app lo hace al arrancar, en segundo plano).
+# "pausa_max_ms": el mayor tiempo que el event loop estuvo sin atender otra tarea durante esa carga.
+# "indice": p50/p99 de IndiceBusqueda.buscar por tipo de consulta, sacadas de filas reales
+#           (prefijos de nombre, apellido, ci y correo, nombre + apellido, sin resultados).
+# "http": lo mismo de punta a punta por GET /alumnos/search en proceso, con la mezcla de consultas.
+# "escritura_us": guardar + quitar una fila, lo que agregan al indice los handlers de escritura.
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+
+def _percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    return {
+        "p50_ms": round(statistics.median(tiempos) * 1000, 3),
+        "p99_ms": round(tiempos[int(len(tiempos) * 0.99)] * 1000, 3),
+        "max_ms": round(tiempos[-1] * 1000, 3),
+    }
+
+
+def _prefijo(palabra, rnd):
+    return palabra[:rnd.randint(min(2, len(palabra)), len(palabra))]
+
+
+def armar_consultas(filas, cantidad, rnd):
+    muestra = [rnd.choice(filas) for _ in range(cantidad)]
+    return {
+        "nombre": [_prefijo(nombre, rnd) for _, nombre, _, _ in muestra],
+        "apellido": [_prefijo(apellido.split()[-1], rnd) for _, _, apellido, _ in muestra],
+        "ci": [ci[:rnd.randint(4, len(ci))] for ci, _, _, _ in muestra],
+        "correo": [correo[:rnd.randint(8, correo.index("@"))] for _, _, _, correo in muestra],
+        "nombre_apellido": [f"{nombre} {_prefijo(apellido.split()[0], rnd)}" for _, nombre, apellido, _ in muestra],
+        "sin_resultados": [f"zq{rnd.randrange(10_000)}" for _ in muestra],
+    }
+
+
+# Mide cada cuanto vuelve el event loop mientras corre la carga
+async def _pausas(pausas):
+    anterior = time.perf_counter()
+    while True:
+        await asyncio.sleep(0.001)
+        ahora = time.perf_counter()
+        pausas.append(ahora - anterior)
+        anterior = ahora
+
+
+async def correr(args):
+    from busqueda import indice_alumnos
+    from database import AsyncSessionLocal
+    from main import app
+
+    rnd = random.Random(args.semilla)
+    memoria = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pausas = []
+    medidor = asyncio.create_task(_pausas(pausas))
+    inicio = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await indice_alumnos.asegurar(db)
+    carga = time.perf_counter() - inicio
+    medidor.cancel()
+    informe = {
+        "alumnos": len(indice_alumnos),
+        "tokens": len(indice_alumnos.postings),
+        "bitmaps": len(indice_alumnos.mapas),
+        "carga_s": round(carga, 2),
+        "pausa_max_ms": round(max(pausas, default=0) * 1000, 1),
+        # ru_maxrss esta en KB en Linux
+        "memoria_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memoria) / 1024),
+    }
+    if not len(indice_alumnos):
+        sys.exit("La tabla alumnos esta vacia: cargarla antes con benchmarks/generar_datos.py")
+
+    filas = [fila[0] for fila in indice_alumnos.filas if fila is not None]
+    consultas = armar_consultas(filas, args.consultas, rnd)
+    informe["indice"] = {}
+    for tipo, lista in consultas.items():
+        tiempos = []
+        for consulta in lista:
+            antes = time.perf_counter()
+            indice_alumnos.buscar(consulta, args.limit)
+            tiempos.append(time.perf_counter() - antes)
+        informe["indice"][tipo] = _percentiles(tiempos)
+
+    mezcla = [consulta for lista in consultas.values() for consulta in lista]
+    rnd.shuffle(mezcla)
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as client:
+            tiempos = []
+            for consulta in mezcla[:args.consultas]:
+                antes = time.perf_counter()
+                resp = await client.get("/alumnos/search", params={"q": consulta, "limit": args.limit})
+                tiempos.append(time.perf_counter() - antes)
+                resp.raise_for_status()
+    informe["http"] = _percentiles(tiempos)
+
+    tiempos = []
+    for i in range(1000):
+        antes = time.perf_counter()
+        indice_alumnos.guardar(f"b{i:07d}", "Bench", "Escritura Índice", f"bench{i}@bench.com")
+        indice_alumnos.quitar(f"b{i:07d}")
+        tiempos.append(time.perf_counter() - antes)
+    informe["escritura_us"] = round(statistics.median(tiempos) * 1_000_000, 1)
+    return informe
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--consultas", type=int, default=2000, help="Consultas por tipo")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AUTH_REQUERIDA", "0")
+    os.environ.setdefault("ADMISION_RPS", "0")
+    print(json.dumps(asyncio.run(correr(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Benchmark de throughput concurrente contra un servidor ya levantado.
+#
+# Sirve para comparar antes/despues de pasar a la capa async: levantar la API
+# en cada commit y correr
+#
+#   ADMISION_RPS=0 uvicorn main:app
+#   python benchmarks/concurrencia.py --url http://localhost:8000 --ci 12345678 --contraseña secreto --concurrencia 1 10 50
+#
+# ADMISION_RPS=0 en el servidor: todos los requests salen de la misma IP y el limite por
+# cliente de admision.py los cortaria con 429. Las rutas piden token (auth.py): se loguea una
+# vez con --ci/--contraseña de un usuario de la tabla login, como benchmarks/endpoints.py.
+# Cualquier respuesta que no sea 2xx corta el benchmark, para no medir 401 o 429 como si
+# fueran requests servidos.
+#
+# Resultados de la comparacion (SQLite, un worker) en benchmarks/README.md: la
+# sesion sincronica se traba con 50 clientes a la vez; con AsyncSession no. En
+# SQLite el throughput queda plano en los dos casos; la mejora en req/s se
+# espera con MySQL, donde la espera de cada query es de red.
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+ENDPOINTS = [
+    "/actividades",
+    "/equipamiento",
+    "/instructores",
+    "/clases",
+    "/turnos",
+    "/alumnos",
+    "/alumnosclase",
+]
+
+
+async def medir(client, path, concurrencia, total):
+    latencias = []
+    pendientes = iter(range(total))
+
+    async def worker():
+        for _ in pendientes:
+            inicio = time.perf_counter()
+            resp = await client.get(path)
+            latencias.append(time.perf_counter() - inicio)
+            if not 200 <= resp.status_code < 300:
+                raise RuntimeError(f"{path} devolvio {resp.status_code}")
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "endpoint": path,
+        "concurrencia": concurrencia,
+        "requests": total,
+        "req_por_seg": round(total / duracion, 1),
+        "p50_ms": round(statistics.median(latencias) * 1000, 2),
+        "p99_ms": round(latencias[int(len(latencias) * 0.99) - 1] * 1000, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--endpoint", action="append", dest="endpoints")
+    # Usuario de la tabla login; sin --ci no se manda token (servidor con AUTH_REQUERIDA=0)
+    parser.add_argument("--ci")
+    parser.add_argument("--contraseña")
+    args = parser.parse_args()
+
+    limites = httpx.Limits(max_connections=max(args.concurrencia))
+    resultados = []
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=60) as client:
+        if args.ci is not None:
+            resp = await client.post("/login", json={"ci": args.ci, "contraseña": args.contraseña})
+            resp.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {resp.json()['token']}"
+        for path in args.endpoints or ENDPOINTS:
+            for concurrencia in args.concurrencia:
+                resultados.append(await medir(client, path, concurrencia, args.requests))
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
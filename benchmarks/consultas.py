@@ -0,0 +1,70 @@
+# Overhead por request de armar la sentencia vs usar el registro de consultas.py, sin red:
+# SQLite en memoria, una fila, y se mide armar + compilar (o sacar de la cache) + ejecutar.
+#
+#   python benchmarks/consultas.py --iteraciones 20000
+#
+# "orm": db.query(Turnos).filter(...) como hacian antes los handlers de turnos.
+# "text": text("SELECT ...") armado en cada request como el resto de main.py.
+# "registro": CONSULTAS["turnos.por_id"], armada una vez al importar.
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import time as hora
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+from consultas import CONSULTAS
+from models import Base, Turnos
+
+
+def preparar():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Turnos.__table__), {"id": 1, "hora_inicio": hora(8), "hora_fin": hora(10)})
+    return engine
+
+
+def orm(db):
+    return db.query(Turnos).filter(Turnos.id == 1).first()
+
+
+def con_text(db):
+    return db.execute(text("SELECT * FROM turnos WHERE id = :id"), {"id": 1}).fetchone()
+
+
+def registro(db):
+    return db.execute(CONSULTAS["turnos.por_id"], {"id": 1}).fetchone()
+
+
+def medir(funcion, db, iteraciones, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            funcion(db)
+        tiempos.append(time.perf_counter() - inicio)
+    return round(min(tiempos) / iteraciones * 1_000_000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iteraciones", type=int, default=20000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = preparar()
+    resultados = {"iteraciones": args.iteraciones, "us_por_request": {}}
+    with Session(engine) as db:
+        for nombre, funcion in (("orm", orm), ("text", con_text), ("registro", registro)):
+            resultados["us_por_request"][nombre] = medir(funcion, db, args.iteraciones, args.repeticiones)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
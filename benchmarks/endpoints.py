@@ -0,0 +1,466 @@
+# Micro-benchmark de todas las rutas de main.py, en proceso y sin servidor: la app corre sobre
+# httpx.ASGITransport contra una base descartable (SQLite en un archivo temporal por defecto, o
+# una MySQL local vacia con --db) cargada con volumenes configurables.
+#
+#   python benchmarks/endpoints.py --alumnos 5000 --clases 200 --salida antes.json
+#   python benchmarks/endpoints.py --salida despues.json --comparar antes.json
+#
+# Cada ruta tiene un escenario en ESCENARIOS que arma su request numero i. Una ruta nueva sin
+# escenario sale en "sin_escenario" y el benchmark termina con exit 1 hasta que se le agregue uno.
+# Primero se miden las lecturas y despues las escrituras: los DELETE borran lo que crearon los
+# POST de la misma tabla, que no tienen nada colgando y no chocan con las FK.
+#
+# El resto de la configuracion va por las mismas variables de entorno que la app (DB_POOL_SIZE,
+# CACHE_TTL, DB_METRICAS, ...).
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, time as hora
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import httpx
+
+# Filas por executemany al cargar la base
+LOTE_CARGA = 5000
+
+
+######################################################################
+#                            Carga                                   #
+######################################################################
+
+def _insertar(conn, consulta, filas):
+    for inicio in range(0, len(filas), LOTE_CARGA):
+        conn.execute(consulta, filas[inicio:inicio + LOTE_CARGA])
+
+
+def _alumno(ci, i):
+    return {
+        "ci": ci,
+        "nombre": f"Nombre {i}",
+        "apellido": f"Apellido {i}",
+        "telefono": f"09{i % 10_000_000:07d}",
+        "fecha_nacimiento": date(1990 + i % 20, 1 + i % 12, 1 + i % 28),
+        "correo": f"alumno{ci}@bench.com",
+    }
+
+
+# Carga la base con las migraciones de la app y datos al azar (semilla fija). Las inscripciones
+# respetan las reglas de conflictos.py: un alumno no puede estar en dos clases del mismo turno, asi
+# que las que chocan se descartan y la cantidad final puede quedar por debajo de --inscripciones.
+# Los alumnos "libres" no tienen inscripciones: los usan POST /alumnosclase y el bulk
+def sembrar(engine, args, rnd):
+    from sqlalchemy import func, insert, select
+
+    from consultas import CONSULTAS
+    from migraciones import migrar
+    from models import Actividades, Alumnos, Clase, Equipamiento, Turnos, User
+
+    with engine.connect() as conn:
+        migrar(conn)
+        if conn.execute(select(func.count()).select_from(Alumnos)).scalar():
+            raise SystemExit("La base no esta vacia: el benchmark necesita una base descartable")
+
+    libres = args.requests * (1 + args.lote)
+    with engine.begin() as conn:
+        _insertar(conn, CONSULTAS["actividades.insertar"], [
+            {"descripcion": f"Actividad {i}", "costo": float(100 + i)} for i in range(args.actividades)
+        ])
+        actividades = conn.execute(select(Actividades.id)).scalars().all()
+        _insertar(conn, CONSULTAS["equipamiento.insertar"], [
+            {"id_actividad": rnd.choice(actividades), "descripcion": f"Equipo {i}", "costo": float(10 + i)}
+            for i in range(args.equipamiento)
+        ])
+        equipamiento = conn.execute(select(Equipamiento.id)).scalars().all()
+        instructores = [f"4{i:07d}" for i in range(args.instructores)]
+        _insertar(conn, CONSULTAS["instructores.insertar"], [
+            {"ci": ci, "nombre": f"Instructor {i}", "apellido": f"Apellido {i}"} for i, ci in enumerate(instructores)
+        ])
+        turnos_filas = []
+        for _ in range(args.turnos):
+            inicio = rnd.randrange(6 * 60, 21 * 60, 30)
+            fin = inicio + rnd.choice((60, 90))
+            turnos_filas.append({"hora_inicio": hora(*divmod(inicio, 60)), "hora_fin": hora(*divmod(fin, 60))})
+        _insertar(conn, CONSULTAS["turnos.insertar"], turnos_filas)
+        turnos = conn.execute(select(Turnos.id)).scalars().all()
+        _insertar(conn, CONSULTAS["clase.insertar"], [
+            {"ci_instructor": rnd.choice(instructores), "id_actividad": rnd.choice(actividades),
+             "id_turno": rnd.choice(turnos), "dictada": False}
+            for _ in range(args.clases)
+        ])
+        clase_turno = dict(conn.execute(select(Clase.id, Clase.id_turno)).all())
+        clases = sorted(clase_turno)
+        alumnos = [f"5{i:07d}" for i in range(args.alumnos)]
+        alumnos_libres = [f"7{i:07d}" for i in range(libres)]
+        _insertar(conn, CONSULTAS["alumnos.insertar"], [_alumno(ci, i) for i, ci in enumerate(alumnos + alumnos_libres)])
+
+        ocupados = set()
+        inscripciones = []
+        for _ in range(args.inscripciones if alumnos else 0):
+            ci, id_clase = rnd.choice(alumnos), rnd.choice(clases)
+            if (ci, clase_turno[id_clase]) in ocupados:
+                continue
+            ocupados.add((ci, clase_turno[id_clase]))
+            inscripciones.append({"id_clase": id_clase, "ci": ci, "id_equipamiento": rnd.choice(equipamiento), "id_turno": clase_turno[id_clase]})
+        _insertar(conn, CONSULTAS["alumno_clase.insertar"], inscripciones)
+
+        login = {"ci": alumnos[0] if alumnos else alumnos_libres[0], "correo": "bench@bench.com", "contraseña": "bench"}
+        conn.execute(insert(User.__table__), login)
+
+    return {
+        "actividades": actividades,
+        "equipamiento": equipamiento,
+        "instructores": instructores,
+        "turnos": turnos,
+        "clase_turno": clase_turno,
+        "clases": clases,
+        "alumnos": alumnos,
+        "libres": alumnos_libres,
+        "inscripciones": inscripciones,
+        "login": login,
+        "creados": {},
+    }
+
+
+######################################################################
+#                            Escenarios                              #
+######################################################################
+
+# Cada escenario recibe (i, datos, rnd) y devuelve (url, cuerpo). Los que crean filas guardan la
+# respuesta en datos["creados"][ruta] para que el DELETE correspondiente las borre
+
+def _hora(rnd):
+    return f"{rnd.randrange(6, 23):02d}:{rnd.choice((0, 30)):02d}"
+
+
+def _turno_nuevo(i):
+    inicio = 6 * 60 + (i * 30) % (15 * 60)
+    return {"hora_inicio": "%02d:%02d" % divmod(inicio, 60), "hora_fin": "%02d:%02d" % divmod(inicio + 60, 60)}
+
+
+def _clase_nueva(d, rnd, id_turno=None):
+    return {
+        "ci_instructor": rnd.choice(d["instructores"]),
+        "id_actividad": rnd.choice(d["actividades"]),
+        "id_turno": id_turno or rnd.choice(d["turnos"]),
+        "dictada": False,
+    }
+
+
+def _alumno_json(ci, i):
+    alumno = _alumno(ci, i)
+    return {**alumno, "fecha_nacimiento": alumno["fecha_nacimiento"].isoformat()}
+
+
+def _inscripcion(d, i):
+    return d["inscripciones"][i % len(d["inscripciones"])]
+
+
+def _ruta_inscripcion(fila):
+    return f"/alumnosclase/{fila['id_clase']}/{fila['ci']}/{fila['id_equipamiento']}"
+
+
+# POST /alumnosclase usa el alumno libre i; el bulk usa los siguientes, --lote por request
+def _libres_lote(d, i, lote, rnd):
+    inicio = d["requests"] + i * lote
+    return [
+        {"id_clase": rnd.choice(d["clases"]), "ci": ci, "id_equipamiento": rnd.choice(d["equipamiento"])}
+        for ci in d["libres"][inicio:inicio + lote]
+    ]
+
+
+def _creado(d, ruta):
+    creados = d["creados"].get(ruta)
+    if not creados:
+        raise RuntimeError(f"No quedan filas creadas por {ruta} para borrar")
+    return creados.pop()
+
+
+ESCENARIOS = {
+    # Actividades
+    "GET /actividades": lambda i, d, rnd: ("/actividades", None),
+    "GET /actividades/{id}": lambda i, d, rnd: (f"/actividades/{rnd.choice(d['actividades'])}", None),
+    "POST /actividades": lambda i, d, rnd: ("/actividades", {"descripcion": f"Bench {i}", "costo": 50.0}),
+    "PUT /actividades/{id}": lambda i, d, rnd: (
+        f"/actividades/{rnd.choice(d['actividades'])}", {"descripcion": f"Actividad modificada {i}", "costo": 75.0}
+    ),
+    "DELETE /actividades/{id}": lambda i, d, rnd: (f"/actividades/{_creado(d, 'POST /actividades')['id']}", None),
+    # Equipamiento
+    "GET /equipamiento": lambda i, d, rnd: ("/equipamiento", None),
+    "GET /equipamiento/{id}": lambda i, d, rnd: (f"/equipamiento/{rnd.choice(d['equipamiento'])}", None),
+    "POST /equipamiento": lambda i, d, rnd: (
+        "/equipamiento", {"id_actividad": rnd.choice(d["actividades"]), "descripcion": f"Bench {i}", "costo": 5.0}
+    ),
+    "POST /equipamiento/bulk": lambda i, d, rnd: ("/equipamiento/bulk", [
+        {"id_actividad": rnd.choice(d["actividades"]), "descripcion": f"Bulk {i}.{j}", "costo": 5.0} for j in range(d["lote"])
+    ]),
+    "PUT /equipamiento/{id}": lambda i, d, rnd: (
+        f"/equipamiento/{rnd.choice(d['equipamiento'])}",
+        {"id_actividad": rnd.choice(d["actividades"]), "descripcion": f"Equipo modificado {i}", "costo": 7.5},
+    ),
+    "DELETE /equipamiento/{id}": lambda i, d, rnd: (f"/equipamiento/{_creado(d, 'POST /equipamiento')['id']}", None),
+    # Instructores
+    "GET /instructores": lambda i, d, rnd: ("/instructores", None),
+    "GET /instructores/search": lambda i, d, rnd: (f"/instructores/search?q={rnd.choice(['inst', 'apellido 1', d['instructores'][0][:4]])}", None),
+    "GET /instructores/{ci}": lambda i, d, rnd: (f"/instructores/{rnd.choice(d['instructores'])}", None),
+    "POST /instructores": lambda i, d, rnd: (
+        "/instructores", {"ci": f"3{i:07d}", "nombre": f"Bench {i}", "apellido": "Bench"}
+    ),
+    "PUT /instructores/{ci}": lambda i, d, rnd: (
+        lambda ci: (f"/instructores/{ci}", {"ci": ci, "nombre": f"Modificado {i}", "apellido": "Bench"})
+    )(rnd.choice(d["instructores"])),
+    "DELETE /instructores/{ci}": lambda i, d, rnd: (f"/instructores/{_creado(d, 'POST /instructores')['ci']}", None),
+    # Clases
+    "GET /clases": lambda i, d, rnd: ("/clases", None),
+    "GET /clases/{id}": lambda i, d, rnd: (f"/clases/{rnd.choice(d['clases'])}?expand=instructor,actividad,turno", None),
+    "GET /clases/activas": lambda i, d, rnd: (f"/clases/activas?at={_hora(rnd)}", None),
+    "GET /clases/{id}/roster": lambda i, d, rnd: (f"/clases/{rnd.choice(d['clases'])}/roster", None),
+    "POST /clases": lambda i, d, rnd: ("/clases", _clase_nueva(d, rnd)),
+    # Mismo turno que tenia la clase, para no generar conflictos con sus inscriptos
+    "PUT /clases/{id}": lambda i, d, rnd: (
+        lambda id: (f"/clases/{id}", _clase_nueva(d, rnd, d["clase_turno"][id]))
+    )(rnd.choice(d["clases"])),
+    "DELETE /clases/{id}": lambda i, d, rnd: (f"/clases/{_creado(d, 'POST /clases')['id']}", None),
+    # Turnos
+    "GET /turnos": lambda i, d, rnd: ("/turnos", None),
+    "GET /turnos/activos": lambda i, d, rnd: (f"/turnos/activos?at={_hora(rnd)}", None),
+    "GET /turnos/solapados": lambda i, d, rnd: ("/turnos/solapados", None),
+    "GET /turnos/{id}": lambda i, d, rnd: (f"/turnos/{rnd.choice(d['turnos'])}", None),
+    "POST /turnos": lambda i, d, rnd: ("/turnos", _turno_nuevo(i)),
+    "PUT /turnos/{id}": lambda i, d, rnd: (f"/turnos/{rnd.choice(d['turnos'])}", _turno_nuevo(i)),
+    "DELETE /turnos/{id}": lambda i, d, rnd: (f"/turnos/{_creado(d, 'POST /turnos')['id']}", None),
+    # Alumnos
+    "GET /alumnos": lambda i, d, rnd: ("/alumnos", None),
+    "GET /alumnos/search": lambda i, d, rnd: (f"/alumnos/search?q={rnd.choice(['nom', 'apellido 12', 'alumno5', d['alumnos'][-1][:5]])}", None),
+    "GET /alumnos/{ci}/clases": lambda i, d, rnd: (f"/alumnos/{rnd.choice(d['alumnos'] or d['libres'])}/clases", None),
+    "POST /alumnos": lambda i, d, rnd: ("/alumnos", _alumno_json(f"6{i:07d}", i)),
+    "POST /alumnos/bulk": lambda i, d, rnd: ("/alumnos/bulk", [
+        _alumno_json(f"8{i * d['lote'] + j:07d}", j) for j in range(d["lote"])
+    ]),
+    "PUT /alumnos/{ci}": lambda i, d, rnd: (
+        lambda ci: (f"/alumnos/{ci}", _alumno_json(ci, i))
+    )(rnd.choice(d["alumnos"] or d["libres"])),
+    "DELETE /alumnos/{ci}": lambda i, d, rnd: (f"/alumnos/{_creado(d, 'POST /alumnos')['ci']}", None),
+    # Login
+    "POST /login": lambda i, d, rnd: ("/login", {"ci": d["login"]["ci"], "contraseña": d["login"]["contraseña"]}),
+    # Alumnosclase
+    "GET /alumnosclase": lambda i, d, rnd: ("/alumnosclase", None),
+    "POST /alumnosclase": lambda i, d, rnd: ("/alumnosclase", {
+        "id_clase": rnd.choice(d["clases"]), "ci": d["libres"][i], "id_equipamiento": rnd.choice(d["equipamiento"])
+    }),
+    "POST /alumnosclase/bulk": lambda i, d, rnd: ("/alumnosclase/bulk", _libres_lote(d, i, d["lote"], rnd)),
+    # Mueve la inscripcion a si misma: recorre el chequeo de conflictos y el UPDATE sin cambiar los datos
+    "PUT /alumnosclase/{id_clase}/{ci}/{id_equipamiento}": lambda i, d, rnd: (
+        lambda fila: (_ruta_inscripcion(fila), {clave: fila[clave] for clave in ("id_clase", "ci", "id_equipamiento")})
+    )(_inscripcion(d, i)),
+    "DELETE /alumnosclase/{id_clase}/{ci}/{id_equipamiento}": lambda i, d, rnd: (
+        _ruta_inscripcion(_creado(d, "POST /alumnosclase")), None
+    ),
+    # Export e internas
+    "GET /export/{table}": lambda i, d, rnd: ("/export/alumnos?format=ndjson", None),
+    "GET /internal/pool": lambda i, d, rnd: ("/internal/pool", None),
+    "GET /internal/cache": lambda i, d, rnd: ("/internal/cache", None),
+    "GET /internal/auth": lambda i, d, rnd: ("/internal/auth", None),
+    "GET /internal/limites": lambda i, d, rnd: ("/internal/limites", None),
+    "GET /internal/replicas": lambda i, d, rnd: ("/internal/replicas", None),
+    "GET /metrics": lambda i, d, rnd: ("/metrics", None),
+}
+
+# Orden de medicion: lecturas, altas, modificaciones y bajas
+FASES = {"GET": 0, "POST": 1, "PUT": 2, "PATCH": 2, "DELETE": 3}
+
+
+######################################################################
+#                            Medicion                                #
+######################################################################
+
+def rutas_app(app):
+    from fastapi.routing import APIRoute
+
+    rutas = []
+    for ruta in app.routes:
+        if isinstance(ruta, APIRoute):
+            for metodo in sorted(ruta.methods):
+                rutas.append(f"{metodo} {ruta.path}")
+    return sorted(rutas, key=lambda clave: FASES.get(clave.split(" ", 1)[0], 4))
+
+
+def _percentil(ordenadas, fraccion):
+    return ordenadas[max(int(len(ordenadas) * fraccion) - 1, 0)]
+
+
+async def medir(client, clave, datos, rnd, concurrencia, total, calentamiento):
+    metodo = clave.split(" ", 1)[0]
+    escenario = ESCENARIOS[clave]
+    latencias = []
+    estados = {}
+    servidor_ms = []
+
+    async def pedir(i):
+        url, cuerpo = escenario(i, datos, rnd)
+        return await client.request(metodo, url, json=cuerpo)
+
+    # Solo las lecturas se calientan: las escrituras consumen filas sembradas
+    if metodo == "GET":
+        for i in range(calentamiento):
+            await pedir(i)
+
+    pendientes = iter(range(total))
+
+    async def worker():
+        for i in pendientes:
+            inicio = time.perf_counter()
+            resp = await pedir(i)
+            latencias.append(time.perf_counter() - inicio)
+            estados[resp.status_code] = estados.get(resp.status_code, 0) + 1
+            if metodo == "POST" and resp.status_code == 200:
+                datos["creados"].setdefault(clave, []).append(resp.json())
+            timing = resp.headers.get("server-timing", "")
+            if timing.startswith("db;dur="):
+                servidor_ms.append(float(timing[len("db;dur="):].split(";", 1)[0]))
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "ruta": clave,
+        "requests": total,
+        "concurrencia": concurrencia,
+        "req_por_seg": round(total / duracion, 1),
+        "media_ms": round(statistics.mean(latencias) * 1000, 3),
+        "p50_ms": round(statistics.median(latencias) * 1000, 3),
+        "p95_ms": round(_percentil(latencias, 0.95) * 1000, 3),
+        "p99_ms": round(_percentil(latencias, 0.99) * 1000, 3),
+        "db_media_ms": round(statistics.mean(servidor_ms), 3) if servidor_ms else None,
+        "estados": {str(estado): cuenta for estado, cuenta in sorted(estados.items())},
+        "errores": sum(cuenta for estado, cuenta in estados.items() if estado >= 500),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Agrega a cada ruta el p50 de una corrida anterior y el cambio en porcentaje
+def comparar(resultados, archivo):
+    with open(archivo) as f:
+        anteriores = {fila["ruta"]: fila for fila in json.load(f)["resultados"]}
+    for fila in resultados:
+        anterior = anteriores.get(fila["ruta"])
+        if anterior and anterior["p50_ms"]:
+            fila["anterior_p50_ms"] = anterior["p50_ms"]
+            fila["cambio_p50_pct"] = round((fila["p50_ms"] / anterior["p50_ms"] - 1) * 100, 1)
+
+
+async def correr(args):
+    # La configuracion de la app se lee al importar, asi que va despues de fijar DATABASE_URL
+    import database
+    from main import app
+
+    rnd = random.Random(args.semilla)
+    datos = sembrar(database.engine, args, rnd)
+    datos.update(requests=args.requests, lote=args.lote)
+    rutas = rutas_app(app)
+    if args.ruta:
+        rutas = [clave for clave in rutas if clave in args.ruta]
+    sin_escenario = [clave for clave in rutas if clave not in ESCENARIOS]
+
+    resultados = []
+    # ASGITransport no corre el lifespan: se entra a mano (migraciones/EXPLAIN por env y pool precalentado)
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as client:
+            # Las rutas piden token (auth.py): se loguea una vez con el usuario sembrado
+            resp = await client.post("/login", json={"ci": datos["login"]["ci"], "contraseña": datos["login"]["contraseña"]})
+            resp.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {resp.json()['token']}"
+            for clave in rutas:
+                if clave in ESCENARIOS:
+                    resultados.append(await medir(client, clave, datos, rnd, args.concurrencia, args.requests, args.calentamiento))
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+    return {
+        "commit": _commit(),
+        "base": database.engine.dialect.name,
+        "volumenes": {
+            "actividades": len(datos["actividades"]),
+            "equipamiento": len(datos["equipamiento"]),
+            "instructores": len(datos["instructores"]),
+            "turnos": len(datos["turnos"]),
+            "clases": len(datos["clases"]),
+            "alumnos": len(datos["alumnos"]) + len(datos["libres"]),
+            "inscripciones": len(datos["inscripciones"]),
+        },
+        "requests": args.requests,
+        "concurrencia": args.concurrencia,
+        "resultados": resultados,
+        "sin_escenario": sin_escenario,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="URL sincronica de una base vacia (default: SQLite en un archivo temporal)")
+    parser.add_argument("--actividades", type=int, default=10)
+    parser.add_argument("--equipamiento", type=int, default=50)
+    parser.add_argument("--instructores", type=int, default=50)
+    parser.add_argument("--turnos", type=int, default=40)
+    parser.add_argument("--clases", type=int, default=200)
+    parser.add_argument("--alumnos", type=int, default=5000)
+    parser.add_argument("--inscripciones", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--calentamiento", type=int, default=10)
+    parser.add_argument("--lote", type=int, default=50, help="Filas por request en los endpoints bulk")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--ruta", action="append", help='Medir solo esta ruta, ej. "GET /clases/activas"')
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--salida", help="Archivo donde guardar el JSON")
+    args = parser.parse_args()
+    if args.actividades < 1 or args.equipamiento < 1 or args.instructores < 1 or args.turnos < 1 or args.clases < 1:
+        parser.error("actividades, equipamiento, instructores, turnos y clases tienen que ser al menos 1")
+
+    logging.basicConfig(level=logging.WARNING)
+    directorio = None
+    if args.db is None:
+        directorio = tempfile.TemporaryDirectory()
+        args.db = "sqlite:///" + os.path.join(directorio.name, "bench.db")
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    # Todo sale de un mismo cliente: el limite por IP de admision.py cortaria el benchmark
+    os.environ.setdefault("ADMISION_RPS", "0")
+
+    try:
+        informe = asyncio.run(correr(args))
+    finally:
+        if directorio is not None:
+            directorio.cleanup()
+
+    salida = json.dumps(informe, indent=2)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(salida + "\n")
+    print(salida)
+    errores = sum(fila["errores"] for fila in informe["resultados"])
+    return 1 if errores or informe["sin_escenario"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
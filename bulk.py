@@ -0,0 +1,57 @@
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+# Filas por executemany; cada lote va en su propio savepoint dentro de una unica transaccion
+TAMANO_LOTE_BULK = 1000
+MAX_FILAS_BULK = 50000
+
+
+def _mensaje_validacion(error):
+    return "; ".join(
+        f"{'.'.join(str(parte) for parte in detalle['loc'])}: {detalle['msg']}"
+        for detalle in error.errors()
+    )
+
+
+# Valida cada item con el modelo de squemas.py. Devuelve los validos como (indice, params)
+# y la lista de resultados con los errores de validacion ya cargados
+def validar_filas(modelo, items):
+    if len(items) > MAX_FILAS_BULK:
+        raise HTTPException(status_code=413, detail=f"Too many rows, max {MAX_FILAS_BULK}")
+    validas = []
+    resultados = [None] * len(items)
+    for indice, item in enumerate(items):
+        try:
+            fila = modelo.model_validate(item)
+        except ValidationError as error:
+            resultados[indice] = {"index": indice, "ok": False, "error": _mensaje_validacion(error)}
+        else:
+            validas.append((indice, fila.model_dump()))
+    return validas, resultados
+
+
+# Inserta con executemany por lotes. Si un lote choca con la base (duplicado, FK) se
+# rehace fila por fila solo ese lote, para saber exactamente que filas fallaron
+async def insertar_en_lote(db, query, validas, resultados):
+    for inicio in range(0, len(validas), TAMANO_LOTE_BULK):
+        lote = validas[inicio:inicio + TAMANO_LOTE_BULK]
+        try:
+            async with db.begin_nested():
+                await db.execute(query, [params for _, params in lote])
+        except IntegrityError:
+            for indice, params in lote:
+                try:
+                    async with db.begin_nested():
+                        await db.execute(query, params)
+                except IntegrityError as error:
+                    resultados[indice] = {"index": indice, "ok": False, "error": str(error.orig)}
+                else:
+                    resultados[indice] = {"index": indice, "ok": True}
+        else:
+            for indice, _ in lote:
+                resultados[indice] = {"index": indice, "ok": True}
+    await db.commit()
+
+    insertados = sum(1 for resultado in resultados if resultado["ok"])
+    return {"insertados": insertados, "errores": len(resultados) - insertados, "resultados": resultados}
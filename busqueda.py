@@ -0,0 +1,414 @@
+import asyncio
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
+
+from fastapi import HTTPException
+
+from consultas import CONSULTAS
+from paginacion import codificar_cursor, decodificar_cursor
+from versiones import CARGA_PARTE, IndiceVersionado
+
+# Resultados por pagina
+LIMITE_BUSQUEDA = 20
+LIMITE_BUSQUEDA_MAX = 100
+# Tokens por balde de la lista ordenada: insertar o borrar mueve a lo sumo un balde, no la lista entera
+TAMANO_BALDE = 1000
+# Candidatos que se revisan como maximo por pagina. Solo se llega con varias palabras poco
+# selectivas; la pagina vuelve mas corta pero con cursor para seguir desde donde quedo
+MAX_REVISADAS = 5000
+# Filas minimas de un token para tenerlo tambien como bitmap
+MINIMO_MAPA = 256
+# Filas sueltas (de tokens sin bitmap) que se juntan como maximo para la mascara de un termino
+MAXIMO_SUELTOS = 20000
+# Tokens de un rango que se recorren como maximo para contar filas o armar una mascara: un prefijo
+# como "al" abarca todos los correos y recorrerlos cuesta mas que revisar fila por fila
+MAXIMO_TOKENS = 1000
+
+_separadores = re.compile(r"[\s\-]+")
+_puntuacion_ci = re.compile(r"[.\-\s]")
+
+
+# Minusculas y sin tildes: "Gómez" -> "gomez". Casi todo es ASCII y sale por el camino rapido
+def normalizar(texto):
+    if texto.isascii():
+        return texto.lower()
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(letra for letra in descompuesto if not unicodedata.combining(letra)).casefold()
+
+
+# "García-López" -> garcia, lopez; "O'Neill" -> oneill, o, neill. Los nombres se repiten mucho:
+# con la cache cada "María" se normaliza una vez y todas las filas comparten los mismos strings
+@lru_cache(maxsize=100_000)
+def _palabras(valor):
+    palabras = []
+    for palabra in _separadores.split(normalizar(valor)):
+        if "'" in palabra:
+            palabras.extend(palabra.split("'"))
+            palabra = palabra.replace("'", "")
+        palabras.append(palabra)
+    return tuple(palabras)
+
+
+# Si normalizar no cambia nada se guarda el mismo string de la fila, no una copia
+def _mismo(valor, token):
+    return valor if token == valor else token
+
+
+# "4.123.456-7" -> "41234567"
+def _ci(valor):
+    return (_mismo(valor, _puntuacion_ci.sub("", normalizar(valor))),)
+
+
+def _entero(valor):
+    return (_mismo(valor, normalizar(valor)),)
+
+
+TOKENIZADORES = {"ci": _ci, "nombre": _palabras, "apellido": _palabras, "correo": _entero}
+
+
+def terminos(consulta):
+    resultado = []
+    for palabra in normalizar(consulta).split():
+        sin_puntos = _puntuacion_ci.sub("", palabra)
+        resultado.append(sin_puntos if sin_puntos.isdigit() else palabra)
+    return resultado
+
+
+# Lista ordenada partida en baldes (como sortedcontainers): el bisect va sobre el maximo de
+# cada balde y despues adentro del balde
+class ListaOrdenada:
+    def __init__(self, valores=()):
+        valores = sorted(valores)
+        self.baldes = [valores[i:i + TAMANO_BALDE] for i in range(0, len(valores), TAMANO_BALDE)]
+        self.maximos = [balde[-1] for balde in self.baldes]
+
+    def agregar(self, valor):
+        if not self.baldes:
+            self.baldes, self.maximos = [[valor]], [valor]
+            return
+        i = min(bisect_left(self.maximos, valor), len(self.baldes) - 1)
+        balde = self.baldes[i]
+        insort(balde, valor)
+        self.maximos[i] = balde[-1]
+        if len(balde) > 2 * TAMANO_BALDE:
+            self.baldes[i:i + 1] = [balde[:TAMANO_BALDE], balde[TAMANO_BALDE:]]
+            self.maximos[i:i + 1] = [balde[TAMANO_BALDE - 1], balde[-1]]
+
+    def quitar(self, valor):
+        i = bisect_left(self.maximos, valor)
+        if i == len(self.baldes):
+            return
+        balde = self.baldes[i]
+        j = bisect_left(balde, valor)
+        if j < len(balde) and balde[j] == valor:
+            del balde[j]
+            if balde:
+                self.maximos[i] = balde[-1]
+            else:
+                del self.baldes[i]
+                del self.maximos[i]
+
+    # Los valores >= valor, en orden
+    def desde(self, valor):
+        i = bisect_left(self.maximos, valor)
+        if i == len(self.baldes):
+            return
+        balde = self.baldes[i]
+        for j in range(bisect_left(balde, valor), len(balde)):
+            yield balde[j]
+        for k in range(i + 1, len(self.baldes)):
+            yield from self.baldes[k]
+
+
+# Un token de una sola fila (casi todos: cada ci y cada correo) guarda el numero suelto y no una
+# lista: un int no lo recorre el GC ciclico, asi las recolecciones completas no crecen con la tabla
+def _lista(numeros):
+    return (numeros,) if type(numeros) is int else numeros
+
+
+def _mapa(numeros):
+    bits = bytearray((max(numeros) >> 3) + 1)
+    for numero in numeros:
+        bits[numero >> 3] |= 1 << (numero & 7)
+    return int.from_bytes(bits, "little")
+
+
+# Indice de busqueda por prefijo sin tildes sobre una tabla de personas. Cada fila tiene un numero
+# fijo (su lugar en self.filas) y:
+#   postings[token] -> numeros ordenados de las filas con ese token (un int si es una sola, _lista)
+#   mapas[token]    -> los mismos numeros como bitmap (un int), solo para tokens frecuentes
+#   tokens          -> todos los tokens ordenados, para recorrer los que empiezan con un termino
+# Orden del resultado: primero los que tienen el termino como palabra entera, despues los que la
+# completan, en orden alfabetico del token y por numero. Cada fila sale una sola vez, en su mejor
+# token, asi el cursor (orden, token, numero) sirve aunque la tabla cambie entre paginas.
+# Con varias palabras recorre la que menos filas trae; las otras se juntan en una mascara (AND de
+# bitmaps) y un token frecuente se cruza con ella entero, sin mirar fila por fila.
+# Una escritura de otro worker se aplica releyendo solo esas filas (aplicar)
+class IndiceBusqueda(IndiceVersionado):
+    def __init__(self, tabla, campos):
+        super().__init__()
+        self.tablas = (tabla,)
+        self.campos = campos
+        # Durante cargar() los bitmaps no se mantienen fila por fila: se arman al final
+        self.cargando = False
+        self._vaciar()
+
+    def _vaciar(self):
+        self.filas = []
+        self.numeros = {}
+        self.postings = {}
+        self.mapas = {}
+        self.tokens = ListaOrdenada()
+        # Un solo string por nombre o apellido distinto, compartido por todas las filas
+        self.canonicos = {}
+
+    def __len__(self):
+        return len(self.numeros)
+
+    def _compartir(self, valores):
+        return tuple(
+            self.canonicos.setdefault(valor, valor) if TOKENIZADORES[campo] is _palabras else valor
+            for campo, valor in zip(self.campos, valores)
+        )
+
+    def _tokenizar(self, valores):
+        tokens = set()
+        for campo, valor in zip(self.campos, valores):
+            tokens.update(TOKENIZADORES[campo](valor))
+        tokens.discard("")
+        return tuple(tokens)
+
+    # Un bitmap ocupa filas/8 bytes: conviene cuando el token esta en mas de 1 de cada 64 filas
+    def _minimo_mapa(self):
+        return max(MINIMO_MAPA, len(self.filas) // 64)
+
+    # valores en el orden de self.campos; el primero es la PK. Un PUT conserva el numero de la fila
+    def guardar(self, *valores):
+        valores = self._compartir(valores)
+        numero = self.numeros.get(valores[0])
+        if numero is None:
+            numero = len(self.filas)
+            self.filas.append(None)
+            self.numeros[valores[0]] = numero
+        else:
+            self._quitar_tokens(numero)
+        tokens = self._tokenizar(valores)
+        self.filas[numero] = (valores, tokens)
+        minimo = self._minimo_mapa()
+        for token in tokens:
+            numeros = self.postings.get(token)
+            if numeros is None:
+                self.postings[token] = numero
+                self.tokens.agregar(token)
+                continue
+            if type(numeros) is int:
+                # Dos filas no llegan a MINIMO_MAPA
+                self.postings[token] = sorted((numeros, numero))
+                continue
+            insort(numeros, numero)
+            if self.cargando:
+                continue
+            if token in self.mapas:
+                self.mapas[token] |= 1 << numero
+            elif len(numeros) >= minimo:
+                self.mapas[token] = _mapa(numeros)
+
+    def quitar(self, id):
+        numero = self.numeros.pop(id, None)
+        if numero is not None:
+            self._quitar_tokens(numero)
+            self.filas[numero] = None
+
+    def _quitar_tokens(self, numero):
+        minimo = self._minimo_mapa()
+        for token in self.filas[numero][1]:
+            numeros = self.postings[token]
+            if type(numeros) is int:
+                del self.postings[token]
+                self.tokens.quitar(token)
+                continue
+            del numeros[bisect_left(numeros, numero)]
+            if len(numeros) == 1:
+                self.postings[token] = numeros[0]
+            if token in self.mapas:
+                if len(numeros) < minimo // 2:
+                    del self.mapas[token]
+                else:
+                    self.mapas[token] &= ~(1 << numero)
+
+    # De a partes (por_partes) y fila por fila con guardar(), asi una escritura que llega en el medio
+    # cae en la misma estructura. Los bitmaps se arman al final, tambien cediendo el event loop
+    async def cargar(self, db):
+        self._vaciar()
+        self.cargando = True
+        try:
+            async for parte in self.por_partes(db, f"{self.tablas[0]}.busqueda"):
+                for valores in parte:
+                    self.guardar(*valores)
+        finally:
+            self.cargando = False
+        minimo = self._minimo_mapa()
+        for i, (token, numeros) in enumerate(list(self.postings.items())):
+            if type(numeros) is list and len(numeros) >= minimo and token not in self.mapas and self.postings.get(token) is numeros:
+                self.mapas[token] = _mapa(numeros)
+                await asyncio.sleep(0)
+            elif i % CARGA_PARTE == 0:
+                await asyncio.sleep(0)
+
+    # Las claves son PK: se releen esas filas y las que ya no estan se quitan
+    async def aplicar(self, db, cambios):
+        claves = sorted(cambios[self.tablas[0]])
+        if not claves:
+            return
+        filas = (await db.execute(CONSULTAS[f"{self.tablas[0]}.busqueda_por_ids"], {"ids": claves})).fetchall()
+        encontradas = set()
+        for valores in filas:
+            self.guardar(*valores)
+            encontradas.add(valores[0])
+        for clave in claves:
+            if clave not in encontradas:
+                self.quitar(clave)
+
+    def _rango(self, termino):
+        for token in self.tokens.desde(termino):
+            if not token.startswith(termino):
+                return
+            yield token
+
+    # Cuantas filas tienen algun token que empieza con el termino, contando hasta tope. Un rango
+    # de mas de MAXIMO_TOKENS tokens cuenta como infinito
+    def _cantidad(self, termino, tope):
+        total = 0
+        for i, token in enumerate(self._rango(termino)):
+            if i == MAXIMO_TOKENS:
+                return float("inf")
+            total += len(_lista(self.postings[token]))
+            if total > tope:
+                break
+        return total
+
+    # Bitmap de las filas con algun token que empieza con el termino. None si el rango son muchos
+    # tokens de pocas filas cada uno (un prefijo de ci o de correo): ese termino se mira por fila
+    def _mascara(self, termino):
+        mascara = 0
+        sueltos = []
+        for i, token in enumerate(self._rango(termino)):
+            if i == MAXIMO_TOKENS:
+                return None
+            mapa = self.mapas.get(token)
+            if mapa is not None:
+                mascara |= mapa
+                continue
+            sueltos.extend(_lista(self.postings[token]))
+            if len(sueltos) > MAXIMO_SUELTOS:
+                return None
+        if sueltos:
+            mascara |= _mapa(sueltos)
+        return mascara
+
+    # (orden, token) del termino en orden de ranking, desde el del cursor
+    def _tokens_termino(self, termino, despues):
+        if termino in self.postings and (despues is None or despues[0] == 0):
+            yield 0, termino
+        desde = termino if despues is None or despues[0] == 0 else despues[1]
+        for token in self.tokens.desde(desde):
+            if not token.startswith(termino):
+                return
+            if token != termino:
+                yield 1, token
+
+    # Numeros de las filas candidatas en orden (orden, token, numero). Con mascara, un token con
+    # bitmap se cruza entero y uno chico se filtra con la mascara pasada a bytes
+    def _candidatos(self, termino, despues, mascara):
+        bytes_mascara = None
+        for orden, token in self._tokens_termino(termino, despues):
+            minimo = despues[2] if despues is not None and (orden, token) == tuple(despues[:2]) else -1
+            mapa = self.mapas.get(token)
+            if mascara is not None and mapa is not None:
+                cruce = (mapa & mascara) >> (minimo + 1)
+                while cruce:
+                    bajo = cruce & -cruce
+                    cruce ^= bajo
+                    yield orden, token, minimo + bajo.bit_length()
+                continue
+            numeros = _lista(self.postings[token])
+            if mascara is not None and bytes_mascara is None:
+                bytes_mascara = mascara.to_bytes((mascara.bit_length() + 7) // 8, "little")
+            for i in range(bisect_right(numeros, minimo), len(numeros)):
+                numero = numeros[i]
+                if bytes_mascara is None or (numero >> 3 < len(bytes_mascara) and bytes_mascara[numero >> 3] >> (numero & 7) & 1):
+                    yield orden, token, numero
+
+    @staticmethod
+    def _mejor(tokens, termino):
+        mejor = None
+        for token in tokens:
+            if token == termino:
+                return 0, token
+            if token.startswith(termino) and (mejor is None or token < mejor):
+                mejor = token
+        return 1, mejor
+
+    # Devuelve (filas, cursor de la siguiente pagina o None)
+    def buscar(self, consulta, limite, after=None):
+        palabras = terminos(consulta)
+        if not palabras:
+            raise HTTPException(status_code=400, detail="Empty search query")
+        # El termino que recorre el indice va en el cursor, para seguir con el mismo
+        despues = None
+        if after is not None:
+            *despues, principal = decodificar_cursor(after, 4)
+            # El numero de fila va a un corrimiento de bits: uno negativo o fuera de la tabla es un 400, no un 500
+            orden, token, numero = despues
+            if (
+                type(orden) is not int or orden not in (0, 1) or not isinstance(token, str)
+                or type(numero) is not int or not -1 <= numero < len(self.filas) or principal not in palabras
+            ):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        else:
+            principal, menor = palabras[0], None
+            if len(palabras) > 1:
+                for palabra in sorted(set(palabras), key=len, reverse=True):
+                    cantidad = self._cantidad(palabra, float("inf") if menor is None else menor)
+                    if menor is None or cantidad < menor:
+                        principal, menor = palabra, cantidad
+        otras = list(palabras)
+        otras.remove(principal)
+
+        mascara = None
+        por_fila = []
+        for otra in otras:
+            mascara_otra = self._mascara(otra)
+            if mascara_otra is None:
+                por_fila.append(otra)
+            else:
+                mascara = mascara_otra if mascara is None else mascara & mascara_otra
+
+        encontrados = []
+        # Clave de la ultima fila de la pagina: el cursor de la siguiente. Con limite >= 1 (lo
+        # valida la ruta) ya tiene valor cuando la pagina se llena
+        ultima = None
+        revisadas = 0
+        for clave in self._candidatos(principal, despues, mascara):
+            valores, tokens = self.filas[clave[2]]
+            if self._mejor(tokens, principal) == clave[:2] and all(
+                any(token.startswith(otra) for token in tokens) for otra in por_fila
+            ):
+                if len(encontrados) == limite:
+                    # Hay al menos uno mas: el cursor es la ultima fila de esta pagina
+                    return self._filas(encontrados), codificar_cursor((*ultima, principal))
+                encontrados.append(valores)
+                ultima = clave
+            revisadas += 1
+            if revisadas >= MAX_REVISADAS:
+                return self._filas(encontrados), codificar_cursor((*clave, principal))
+        return self._filas(encontrados), None
+
+    def _filas(self, encontrados):
+        return [dict(zip(self.campos, valores)) for valores in encontrados]
+
+
+indice_alumnos = IndiceBusqueda("alumnos", ("ci", "nombre", "apellido", "correo"))
+indice_instructores = IndiceBusqueda("instructores", ("ci", "nombre", "apellido"))
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "1000"))
+# Con CACHE_URL=redis://localhost:6379/0 todos los workers comparten cache (sirve cualquier redis local)
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+
+# Tablas chicas que se leen en cada pagina del front y cambian pocas veces al dia
+TABLAS_CACHEADAS = ("actividades", "turnos", "equipamiento", "instructores")
+
+
+# LRU en memoria del proceso, con TTL por entrada. Cada entrada puede tener una etiqueta
+# (por ejemplo "actividades:listas") para invalidar todas las paginas de una tabla juntas
+class CacheLocal:
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.etiquetas = {}
+        self.desalojos = 0
+
+    async def obtener(self, clave):
+        entrada = self.entradas.get(clave)
+        if entrada is None:
+            return None
+        vence, valor, etiqueta = entrada
+        if vence < time.monotonic():
+            del self.entradas[clave]
+            self._soltar(clave, etiqueta)
+            return None
+        self.entradas.move_to_end(clave)
+        return valor
+
+    async def guardar(self, clave, valor, etiqueta=None):
+        anterior = self.entradas.get(clave)
+        if anterior is not None and anterior[2] != etiqueta:
+            self._soltar(clave, anterior[2])
+        self.entradas[clave] = (time.monotonic() + self.ttl, valor, etiqueta)
+        self.entradas.move_to_end(clave)
+        if etiqueta is not None:
+            self.etiquetas.setdefault(etiqueta, set()).add(clave)
+        while len(self.entradas) > self.max_entradas:
+            desalojada, (_, _, etiqueta_desalojada) = self.entradas.popitem(last=False)
+            self._soltar(desalojada, etiqueta_desalojada)
+            self.desalojos += 1
+
+    async def borrar(self, claves=(), etiqueta=None):
+        claves = set(claves)
+        if etiqueta is not None:
+            claves |= self.etiquetas.pop(etiqueta, set())
+        for clave in claves:
+            entrada = self.entradas.pop(clave, None)
+            if entrada is not None:
+                self._soltar(clave, entrada[2])
+
+    # Las claves de las paginas llevan el cursor del cliente: una entrada que sale por LRU o por
+    # TTL tambien sale de su etiqueta, si no el indice de etiquetas crece sin limite
+    def _soltar(self, clave, etiqueta):
+        claves = self.etiquetas.get(etiqueta)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self.etiquetas[etiqueta]
+
+    def tamano(self):
+        return len(self.entradas)
+
+
+# Backend compartido en redis (dependencia opcional, solo se importa si se configura)
+class CacheRedis:
+    def __init__(self, url, ttl=CACHE_TTL, prefijo="cache:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+        self.prefijo = prefijo
+        self.desalojos = 0
+
+    async def obtener(self, clave):
+        crudo = await self.redis.get(self.prefijo + clave)
+        return None if crudo is None else json.loads(crudo)
+
+    async def guardar(self, clave, valor, etiqueta=None):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.prefijo + clave, json.dumps(valor, default=str), ex=int(self.ttl) or None)
+            if etiqueta is not None:
+                pipe.sadd(self.prefijo + etiqueta, clave)
+                pipe.expire(self.prefijo + etiqueta, int(self.ttl) or None)
+            await pipe.execute()
+
+    async def borrar(self, claves=(), etiqueta=None):
+        claves = set(claves)
+        if etiqueta is not None:
+            miembros = await self.redis.smembers(self.prefijo + etiqueta)
+            claves |= {miembro.decode() for miembro in miembros}
+            claves.add(etiqueta)
+        if claves:
+            await self.redis.delete(*(self.prefijo + clave for clave in claves))
+
+    def tamano(self):
+        return None
+
+
+def crear_backend(url=CACHE_URL):
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return CacheRedis(url)
+    return CacheLocal()
+
+
+# Cache read-through para los GET de las tablas de referencia, con contadores de hit/miss por tabla
+class CacheLecturas:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidaciones = Counter()
+        self.errores = 0
+        self.carreras = 0
+
+    async def _version(self, tabla):
+        # Import aca: versiones.py importa CACHE_URL de este modulo
+        from versiones import versiones_tablas
+
+        return (await versiones_tablas.actual(tabla))[0]
+
+    # Si la clave esta se devuelve; si no se llama a cargar() y se guarda el resultado.
+    # Si cargar() levanta (por ejemplo un 404) no se guarda nada. Tampoco si la version de la
+    # tabla cambio mientras se leia: una escritura en el medio ya invalido la cache, y guardar la
+    # pagina leida antes la dejaria vieja todo el TTL
+    async def leer(self, tabla, clave, cargar):
+        clave_completa = f"{tabla}:{clave}"
+        try:
+            valor = await self.backend.obtener(clave_completa)
+        except Exception:
+            logger.warning("Cache no disponible, se lee de la base", exc_info=True)
+            self.errores += 1
+            return await cargar()
+        if valor is not None:
+            self.hits[tabla] += 1
+            return valor
+
+        self.misses[tabla] += 1
+        version = await self._version(tabla)
+        valor = await cargar()
+        if await self._version(tabla) != version:
+            self.carreras += 1
+            return valor
+        etiqueta = f"{tabla}:listas" if clave.startswith("lista:") else None
+        try:
+            await self.backend.guardar(clave_completa, valor, etiqueta)
+        except Exception:
+            logger.warning("No se pudo guardar en cache", exc_info=True)
+            self.errores += 1
+        return valor
+
+    # Despues de una escritura: borra la entrada por id (si se pasa) y todas las paginas de la tabla
+    async def invalidar(self, tabla, id=None):
+        claves = [f"{tabla}:id:{id}"] if id is not None else []
+        self.invalidaciones[tabla] += 1
+        try:
+            await self.backend.borrar(claves, etiqueta=f"{tabla}:listas")
+        except Exception:
+            logger.warning("No se pudo invalidar la cache de %s", tabla, exc_info=True)
+            self.errores += 1
+
+    def estado(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "entradas": self.backend.tamano(),
+            "desalojos": self.backend.desalojos,
+            "errores": self.errores,
+            "descartadas_por_escritura": self.carreras,
+            "tablas": {
+                tabla: {
+                    "hits": self.hits[tabla],
+                    "misses": self.misses[tabla],
+                    "invalidaciones": self.invalidaciones[tabla],
+                }
+                for tabla in TABLAS_CACHEADAS
+            },
+        }
+
+
+cache_lecturas = CacheLecturas(crear_backend())
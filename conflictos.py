@@ -0,0 +1,181 @@
+from fastapi import HTTPException
+
+from consultas import CONSULTAS
+from versiones import IndiceVersionado
+
+
+# Indice en memoria de inscripciones para rechazar conflictos sin ir a la base:
+#   ocupacion[(ci, id_turno)] -> id_clase que ocupa a ese alumno en ese turno
+#   inscripciones[ci] -> {id_clase: id_equipamiento con el que esta inscripto}
+# Un alumno no puede estar dos veces en la misma clase (aunque cambie el equipamiento)
+# ni en dos clases del mismo turno. Cada chequeo son un par de lookups en dicts. La regla la
+# garantiza el UNIQUE (ci, id_turno) de alumno_clase; el indice contesta el 409 sin ir a la base
+# y los conflictos con escrituras de otro worker que todavia no vio los detecta la base
+class IndiceInscripciones(IndiceVersionado):
+    tablas = ("clase", "alumno_clase")
+
+    def __init__(self):
+        super().__init__()
+        self._vaciar()
+
+    def _vaciar(self):
+        self.clase_turno = {}
+        self.ocupacion = {}
+        self.inscripciones = {}
+        self.alumnos_clase = {}
+
+    # Devuelve el mensaje del conflicto o None. ignorar es la inscripcion (ci, id_clase)
+    # que se esta reemplazando en un PUT, que no choca consigo misma
+    def conflicto(self, ci, id_clase, ignorar=None):
+        ci = str(ci)
+        if id_clase in self.inscripciones.get(ci, ()) and (ci, id_clase) != ignorar:
+            return f"Alumno {ci} is already enrolled in clase {id_clase}"
+        id_turno = self.clase_turno.get(id_clase)
+        if id_turno is None:
+            # Clase desconocida: la FK de alumno_clase lo rechaza en el INSERT
+            return None
+        otra = self.ocupacion.get((ci, id_turno))
+        if otra is not None and otra != id_clase and (ci, otra) != ignorar:
+            return f"Alumno {ci} is already enrolled in clase {otra} on the same turno"
+        return None
+
+    def verificar(self, ci, id_clase, ignorar=None):
+        mensaje = self.conflicto(ci, id_clase, ignorar)
+        if mensaje is not None:
+            raise HTTPException(status_code=409, detail=mensaje)
+
+    def agregar(self, ci, id_clase, id_equipamiento):
+        ci = str(ci)
+        self.inscripciones.setdefault(ci, {})[id_clase] = id_equipamiento
+        self.alumnos_clase.setdefault(id_clase, set()).add(ci)
+        id_turno = self.clase_turno.get(id_clase)
+        if id_turno is not None:
+            self.ocupacion[(ci, id_turno)] = id_clase
+
+    def quitar(self, ci, id_clase):
+        ci = str(ci)
+        clases = self.inscripciones.get(ci)
+        if clases is None or clases.pop(id_clase, None) is None:
+            return
+        if not clases:
+            del self.inscripciones[ci]
+        alumnos = self.alumnos_clase.get(id_clase)
+        if alumnos is not None:
+            alumnos.discard(ci)
+            if not alumnos:
+                del self.alumnos_clase[id_clase]
+        id_turno = self.clase_turno.get(id_clase)
+        if self.ocupacion.get((ci, id_turno)) == id_clase:
+            del self.ocupacion[(ci, id_turno)]
+
+    # PUT: cambia una inscripcion por otra y devuelve el equipamiento anterior para poder deshacerlo
+    def reemplazar(self, ci, id_clase, nuevo_ci, nuevo_id_clase, nuevo_id_equipamiento):
+        anterior = self.inscripciones.get(str(ci), {}).get(id_clase)
+        self.quitar(ci, id_clase)
+        self.agregar(nuevo_ci, nuevo_id_clase, nuevo_id_equipamiento)
+        return anterior
+
+    def deshacer_reemplazo(self, ci, id_clase, anterior, nuevo_ci, nuevo_id_clase):
+        self.quitar(nuevo_ci, nuevo_id_clase)
+        if anterior is not None:
+            self.agregar(ci, id_clase, anterior)
+
+    # Reserva en el indice las filas de un bulk antes de insertarlas, asi los conflictos entre
+    # filas del mismo pedido tambien se detectan en O(1) por fila. Marca los rechazos en
+    # resultados y devuelve las filas que quedan para la base
+    def reservar_lote(self, validas, resultados):
+        reservadas = []
+        for indice, params in validas:
+            mensaje = self.conflicto(params["ci"], params["id_clase"])
+            if mensaje is not None:
+                resultados[indice] = {"index": indice, "ok": False, "error": mensaje}
+                continue
+            self.agregar(params["ci"], params["id_clase"], params["id_equipamiento"])
+            reservadas.append((indice, params))
+        return reservadas
+
+    def liberar_lote(self, reservadas, resultados=None):
+        for indice, params in reservadas:
+            if resultados is None or not resultados[indice]["ok"]:
+                self.quitar(params["ci"], params["id_clase"])
+
+    # Alumnos de la clase que quedarian en dos clases a la vez si la clase pasa a id_turno
+    def conflicto_turno(self, id_clase, id_turno):
+        for ci in sorted(self.alumnos_clase.get(id_clase, ())):
+            otra = self.ocupacion.get((ci, id_turno))
+            if otra is not None and otra != id_clase:
+                return f"Alumno {ci} is already enrolled in clase {otra} on the same turno"
+        return None
+
+    def guardar_clase(self, id_clase, id_turno):
+        anterior = self.clase_turno.get(id_clase)
+        alumnos = self.alumnos_clase.get(id_clase, ())
+        for ci in alumnos:
+            if anterior is not None and self.ocupacion.get((ci, anterior)) == id_clase:
+                del self.ocupacion[(ci, anterior)]
+        self.clase_turno[id_clase] = id_turno
+        for ci in alumnos:
+            self.ocupacion[(ci, id_turno)] = id_clase
+
+    def quitar_clase(self, id_clase):
+        for ci in list(self.alumnos_clase.get(id_clase, ())):
+            self.quitar(ci, id_clase)
+        self.clase_turno.pop(id_clase, None)
+
+    # id_turno de cada clase para escribir en alumno_clase, como parametro comun de la sentencia.
+    # Las clases que el indice todavia no vio (creadas por otro worker) se leen en una sola
+    # sentencia; las que no existen no quedan en el resultado. Si otro worker cambio el turno en
+    # el medio, la FK (id_clase, id_turno) rechaza la fila y no queda una copia vieja
+    async def turnos(self, db, ids):
+        turnos = {id_clase: self.clase_turno[id_clase] for id_clase in ids if id_clase in self.clase_turno}
+        faltan = sorted(set(ids) - turnos.keys())
+        if faltan:
+            turnos.update((await db.execute(CONSULTAS["clase.turnos_por_ids"], {"ids": faltan})).fetchall())
+        return turnos
+
+    # El mismo mensaje que conflicto() cuando el que rechaza es el UNIQUE (ci, id_turno): la otra
+    # inscripcion la hizo otro worker y este indice todavia no la vio
+    async def conflicto_en_base(self, db, ci, id_clase):
+        otra = (await db.execute(CONSULTAS["alumno_clase.en_turno"], {"ci": ci, "id_clase": id_clase})).scalar()
+        if otra is None or otra == id_clase:
+            return f"Alumno {ci} is already enrolled in clase {id_clase}"
+        return f"Alumno {ci} is already enrolled in clase {otra} on the same turno"
+
+    # Lo mismo para conflicto_turno() cuando choca el ON UPDATE CASCADE de clase.id_turno
+    async def conflicto_turno_en_base(self, db, id_clase, id_turno):
+        fila = (await db.execute(CONSULTAS["alumno_clase.choque_turno"], {"id_clase": id_clase, "id_turno": id_turno})).first()
+        if fila is None:
+            return f"Alumnos of clase {id_clase} are already enrolled in another clase on turno {id_turno}"
+        return f"Alumno {fila[0]} is already enrolled in clase {fila[1]} on the same turno"
+
+    # Las inscripciones se cargan de a partes: el event loop atiende otros requests en el medio
+    async def cargar(self, db):
+        clases = await db.execute(CONSULTAS["clase.turnos"])
+        self._vaciar()
+        self.clase_turno = dict(clases.fetchall())
+        async for parte in self.por_partes(db, "alumno_clase.inscripciones"):
+            for id_clase, ci, id_equipamiento in parte:
+                self.agregar(ci, id_clase, id_equipamiento)
+
+    # Cambios de otro worker (o de escrituras propias que se cruzaron): las claves de clase son
+    # ids y las de alumno_clase son ci. Se releen esas clases y todas las inscripciones de esos alumnos
+    async def aplicar(self, db, cambios):
+        clases = sorted(cambios["clase"])
+        if clases:
+            turnos = dict((await db.execute(CONSULTAS["clase.turnos_por_ids"], {"ids": clases})).fetchall())
+            for id_clase in clases:
+                if id_clase in turnos:
+                    self.guardar_clase(id_clase, turnos[id_clase])
+                else:
+                    self.quitar_clase(id_clase)
+        alumnos = sorted(cambios["alumno_clase"])
+        if alumnos:
+            filas = (await db.execute(CONSULTAS["alumno_clase.por_cis"], {"ids": alumnos})).fetchall()
+            for ci in alumnos:
+                for id_clase in list(self.inscripciones.get(str(ci), ())):
+                    self.quitar(ci, id_clase)
+            for ci, id_clase, id_equipamiento in filas:
+                self.agregar(ci, id_clase, id_equipamiento)
+
+
+indice_inscripciones = IndiceInscripciones()
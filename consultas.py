@@ -0,0 +1,196 @@
+from sqlalchemy import Integer, and_, bindparam, delete, insert, or_, select, update
+
+from models import Actividades, AlumnoClase, Alumnos, Clase, Equipamiento, Instructores, Turnos, User
+
+# Registro de sentencias de Core armadas una sola vez al importar. Los handlers las usan por
+# nombre (CONSULTAS["alumnos.por_ci"]), asi no se arma un text() por request y SQLAlchemy
+# reutiliza la forma compilada de su cache. El nombre viaja en execution_options["consulta"]
+# para poder medir cada sentencia
+CONSULTAS = {}
+
+# Tablas con listado paginado: las claves del cursor son la PK de models.py, en orden
+TABLAS_PAGINADAS = (Actividades, Equipamiento, Instructores, Clase, Turnos, Alumnos, AlumnoClase)
+
+
+def registrar(nombre, sentencia):
+    if nombre in CONSULTAS:
+        raise ValueError(f"Consulta repetida: {nombre}")
+    CONSULTAS[nombre] = sentencia.execution_options(consulta=nombre)
+    return CONSULTAS[nombre]
+
+
+def claves_tabla(tabla):
+    return tuple(columna.name for columna in tabla.primary_key.columns)
+
+
+# En los UPDATE la clave va como pk_<columna>: SQLAlchemy reserva los nombres de columna para el SET
+def _por_clave(tabla, prefijo=""):
+    return and_(*(tabla.c[clave] == bindparam(prefijo + clave) for clave in claves_tabla(tabla)))
+
+
+# Primera pagina y siguientes de un listado: (a, b) > (:after_0, :after_1) expandido, igual que antes
+def _paginas(tabla):
+    claves = [tabla.c[clave] for clave in claves_tabla(tabla)]
+    limite = bindparam("limite", type_=Integer)
+    primera = select(tabla).order_by(*claves).limit(limite)
+    alternativas = [
+        and_(*[anterior == bindparam(f"after_{j}") for j, anterior in enumerate(claves[:i])], clave > bindparam(f"after_{i}"))
+        for i, clave in enumerate(claves)
+    ]
+    condicion = or_(*alternativas)
+    if len(claves) > 1:
+        condicion = and_(claves[0] >= bindparam("after_0"), condicion)
+    return primera, select(tabla).where(condicion).order_by(*claves).limit(limite)
+
+
+# Carga de un indice en memoria de a partes (versiones.IndiceVersionado.por_partes): las mismas
+# paginas por PK pero solo con las columnas que usa el indice, la PK primero y en orden.
+# PARTES guarda cuantas columnas de la PK hay al principio de cada fila
+PARTES = {}
+
+
+def _partes(nombre, tabla, *columnas):
+    primera, siguiente = _paginas(tabla)
+    columnas = [tabla.c[columna] for columna in (*claves_tabla(tabla), *columnas)]
+    PARTES[nombre] = len(claves_tabla(tabla))
+    registrar(nombre, primera.with_only_columns(*columnas))
+    registrar(f"{nombre}_siguiente", siguiente.with_only_columns(*columnas))
+
+
+# Turno de una clase dentro de otra sentencia. No va en los INSERT: con una subconsulta en VALUES
+# el executemany de pymysql/aiomysql deja de armar un solo INSERT de muchas filas y manda una
+# sentencia por fila. Ahi id_turno va como parametro comun (conflictos.IndiceInscripciones.turnos)
+def _turno_de_clase(parametro):
+    clase = Clase.__table__
+    return select(clase.c.id_turno).where(clase.c.id == bindparam(parametro)).scalar_subquery()
+
+
+# por_id / insertar / actualizar / borrar para cada tabla. insertar no lleva las PK
+# autoincrementales; actualizar no toca la PK
+def _crud(modelo):
+    tabla = modelo.__table__
+    nombre = tabla.name
+    claves = claves_tabla(tabla)
+    autoincrementales = {columna.name for columna in tabla.primary_key.columns if columna.autoincrement is True}
+    registrar(f"{nombre}.por_id", select(tabla).where(_por_clave(tabla)))
+    registrar(f"{nombre}.insertar", insert(tabla).values({
+        columna.name: bindparam(columna.name) for columna in tabla.c if columna.name not in autoincrementales
+    }))
+    resto = [columna.name for columna in tabla.c if columna.name not in claves]
+    if resto:
+        registrar(f"{nombre}.actualizar", update(tabla).where(_por_clave(tabla, "pk_")).values({
+            columna: bindparam(columna) for columna in resto
+        }))
+    registrar(f"{nombre}.borrar", delete(tabla).where(_por_clave(tabla)))
+
+
+for _modelo in TABLAS_PAGINADAS:
+    _crud(_modelo)
+    _primera, _siguiente = _paginas(_modelo.__table__)
+    registrar(f"{_modelo.__tablename__}.pagina", _primera)
+    registrar(f"{_modelo.__tablename__}.pagina_siguiente", _siguiente)
+
+# Carga en lote de las relaciones de models.py para ?expand= (expandir.py): una sentencia por
+# tabla destino con IN sobre su PK, como hace selectinload, nunca una por fila
+for _modelo in TABLAS_PAGINADAS:
+    for _relacion in _modelo.__mapper__.relationships:
+        _destino = _relacion.mapper.local_table
+        if f"{_destino.name}.por_ids" not in CONSULTAS:
+            (_clave,) = claves_tabla(_destino)
+            registrar(f"{_destino.name}.por_ids", select(_destino).where(_destino.c[_clave].in_(bindparam("ids", expanding=True))))
+
+_clase = Clase.__table__
+_alumno_clase = AlumnoClase.__table__
+_turnos = Turnos.__table__
+_login = User.__table__
+
+registrar("clase.por_turnos", select(_clase).where(_clase.c.id_turno.in_(bindparam("ids", expanding=True))))
+registrar("clase.turnos", select(_clase.c.id, _clase.c.id_turno))
+registrar("clase.turnos_por_ids", select(_clase.c.id, _clase.c.id_turno).where(_clase.c.id.in_(bindparam("ids", expanding=True))))
+registrar("turnos.horarios", select(_turnos.c.id, _turnos.c.hora_inicio, _turnos.c.hora_fin))
+_partes("alumno_clase.inscripciones", _alumno_clase)
+registrar("alumno_clase.por_cis", select(_alumno_clase.c.ci, _alumno_clase.c.id_clase, _alumno_clase.c.id_equipamiento).where(
+    _alumno_clase.c.ci.in_(bindparam("ids", expanding=True))
+))
+registrar("alumno_clase.borrar_por_clase", delete(_alumno_clase).where(_alumno_clase.c.id_clase == bindparam("id_clase")))
+# En alumno_clase la PK entera se puede cambiar, los valores nuevos van como new_*
+registrar("alumno_clase.mover", update(_alumno_clase).where(_por_clave(_alumno_clase, "pk_")).values({
+    **{columna: bindparam(f"new_{columna}") for columna in claves_tabla(_alumno_clase)},
+    "id_turno": bindparam("new_id_turno"),
+}))
+# Cuando el UNIQUE (ci, id_turno) rechaza una escritura: con que clase choca (por ese mismo indice)
+registrar("alumno_clase.en_turno", select(_alumno_clase.c.id_clase).where(
+    _alumno_clase.c.ci == bindparam("ci"), _alumno_clase.c.id_turno == _turno_de_clase("id_clase")
+))
+_otra_clase = _alumno_clase.alias("otra")
+registrar("alumno_clase.choque_turno", select(_alumno_clase.c.ci, _otra_clase.c.id_clase).join(
+    _otra_clase, and_(_otra_clase.c.ci == _alumno_clase.c.ci, _otra_clase.c.id_turno == bindparam("id_turno"))
+).where(_alumno_clase.c.id_clase == bindparam("id_clase"), _otra_clase.c.id_clase != bindparam("id_clase")).order_by(_alumno_clase.c.ci).limit(1))
+registrar("login.por_ci", select(_login.c.ci, _login.c.correo, _login.c["contraseña"]).where(_login.c.ci == bindparam("ci")))
+registrar("login.por_correo", select(_login.c.ci, _login.c.correo, _login.c["contraseña"]).where(_login.c.correo == bindparam("correo")))
+registrar("login.actualizar_contraseña", update(_login).where(_login.c.correo == bindparam("pk_correo")).values(
+    {"contraseña": bindparam("contraseña")}
+))
+
+_alumnos = Alumnos.__table__
+_actividades = Actividades.__table__
+_equipamiento = Equipamiento.__table__
+_instructores = Instructores.__table__
+
+# Datos de la clase para las vistas desnormalizadas (vistas.py): instructor, actividad y turno
+# con etiquetas propias, asi las columnas de distintas tablas no chocan en el cursor
+_columnas_clase = (
+    _clase.c.id, _clase.c.dictada,
+    _instructores.c.ci.label("instructor_ci"), _instructores.c.nombre.label("instructor_nombre"),
+    _instructores.c.apellido.label("instructor_apellido"),
+    _actividades.c.id.label("actividad_id"), _actividades.c.descripcion.label("actividad_descripcion"),
+    _actividades.c.costo.label("actividad_costo"),
+    _turnos.c.id.label("turno_id"), _turnos.c.hora_inicio, _turnos.c.hora_fin,
+)
+_columnas_equipamiento = (
+    _equipamiento.c.id.label("equipamiento_id"), _equipamiento.c.descripcion.label("equipamiento_descripcion"),
+    _equipamiento.c.costo.label("equipamiento_costo"),
+)
+_clase_completa = (
+    _clase.join(_instructores, _instructores.c.ci == _clase.c.ci_instructor)
+    .join(_actividades, _actividades.c.id == _clase.c.id_actividad)
+    .join(_turnos, _turnos.c.id == _clase.c.id_turno)
+)
+
+# Una clase con sus inscriptos y el equipamiento de cada uno, en un solo viaje. Entra por la PK de
+# clase y por la de alumno_clase (que empieza por id_clase); el LEFT JOIN deja la clase aunque no
+# tenga inscriptos. Ordenado por alumno para agrupar en una pasada
+registrar("clase.roster", select(
+    *_columnas_clase,
+    _alumnos.c.ci.label("alumno_ci"), _alumnos.c.nombre.label("alumno_nombre"),
+    _alumnos.c.apellido.label("alumno_apellido"), _alumnos.c.correo.label("alumno_correo"),
+    *_columnas_equipamiento,
+).select_from(
+    _clase_completa
+    .outerjoin(_alumno_clase, _alumno_clase.c.id_clase == _clase.c.id)
+    .outerjoin(_alumnos, _alumnos.c.ci == _alumno_clase.c.ci)
+    .outerjoin(_equipamiento, _equipamiento.c.id == _alumno_clase.c.id_equipamiento)
+).where(_clase.c.id == bindparam("id")).order_by(_alumno_clase.c.ci, _alumno_clase.c.id_equipamiento))
+
+# Las clases de un alumno, lo mismo al reves: entra por la PK de alumnos y el indice de
+# alumno_clase.ci. El LEFT JOIN distingue alumno sin clases (una fila con NULLs) de alumno inexistente.
+# Todo LEFT JOIN en cadena (las FK de clase no son nulas): con el join anidado SQLite recorre clase entera
+registrar("alumnos.clases", select(
+    _alumnos, *_columnas_clase, *_columnas_equipamiento,
+).select_from(
+    _alumnos
+    .outerjoin(_alumno_clase, _alumno_clase.c.ci == _alumnos.c.ci)
+    .outerjoin(_clase, _clase.c.id == _alumno_clase.c.id_clase)
+    .outerjoin(_instructores, _instructores.c.ci == _clase.c.ci_instructor)
+    .outerjoin(_actividades, _actividades.c.id == _clase.c.id_actividad)
+    .outerjoin(_turnos, _turnos.c.id == _clase.c.id_turno)
+    .outerjoin(_equipamiento, _equipamiento.c.id == _alumno_clase.c.id_equipamiento)
+).where(_alumnos.c.ci == bindparam("ci")).order_by(_turnos.c.hora_inicio, _clase.c.id, _alumno_clase.c.id_equipamiento))
+
+# Filas para los indices de busqueda de busqueda.py: la tabla entera por partes para cargarlo
+# y las filas que cambiaron (por PK) para ponerlo al dia
+for _tabla, _columnas in ((_alumnos, ("nombre", "apellido", "correo")), (_instructores, ("nombre", "apellido"))):
+    _partes(f"{_tabla.name}.busqueda", _tabla, *_columnas)
+    registrar(f"{_tabla.name}.busqueda_por_ids", select(_tabla.c.ci, *(_tabla.c[columna] for columna in _columnas)).where(
+        _tabla.c.ci.in_(bindparam("ids", expanding=True))
+    ))
@@ -0,0 +1,54 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+from consultas import CONSULTAS, claves_tabla
+from serializacion import formatear_hora, mapear_filas
+
+# Formateadores de las tablas destino, igual que en sus propios endpoints
+FORMATOS = {"turnos": {"hora_inicio": formatear_hora, "hora_fin": formatear_hora}}
+
+
+# Dependencia con ?expand=instructor,actividad,turno. Las relaciones validas salen de los
+# relationship() de models.py: nombre -> (columna FK local, tabla destino, su PK)
+class Expandir:
+    def __init__(self, modelo):
+        self.relaciones = {}
+        for relacion in modelo.__mapper__.relationships:
+            ((local, _),) = relacion.local_remote_pairs
+            destino = relacion.mapper.local_table
+            self.relaciones[relacion.key] = (local.name, destino.name, claves_tabla(destino)[0])
+
+    def __call__(self, expand: Optional[str] = None):
+        pedidas = [nombre.strip() for nombre in (expand or "").split(",") if nombre.strip()]
+        invalidas = [nombre for nombre in pedidas if nombre not in self.relaciones]
+        if invalidas:
+            permitidas = ", ".join(sorted(self.relaciones))
+            raise HTTPException(status_code=400, detail=f"Unknown expand: {', '.join(invalidas)}. Allowed: {permitidas}")
+        return Expansion([(nombre, *self.relaciones[nombre]) for nombre in dict.fromkeys(pedidas)])
+
+
+class Expansion:
+    def __init__(self, relaciones):
+        self.relaciones = relaciones
+        # FK locales que tiene que traer la consulta principal (ver ?fields= en proyeccion.py)
+        self.columnas = tuple(columna for _, columna, _, _ in relaciones)
+        # Claves que aplicar() agrega a cada fila, en orden
+        self.nombres = tuple(nombre for nombre, _, _, _ in relaciones)
+
+    def __bool__(self):
+        return bool(self.relaciones)
+
+    # Agrega a cada fila el objeto de cada relacion pedida: una sentencia por relacion con todos
+    # los ids de la pagina. Devuelve dicts nuevos, las filas pueden venir de la cache de lecturas
+    async def aplicar(self, db, filas):
+        if not self.relaciones or not filas:
+            return filas
+        filas = [dict(fila) for fila in filas]
+        for nombre, columna, tabla, clave in self.relaciones:
+            ids = {fila[columna] for fila in filas}
+            result = await db.execute(CONSULTAS[f"{tabla}.por_ids"], {"ids": sorted(ids)})
+            por_id = {objeto[clave]: objeto for objeto in mapear_filas(result.keys(), result.fetchall(), FORMATOS.get(tabla))}
+            for fila in filas:
+                fila[nombre] = por_id.get(fila[columna])
+        return filas
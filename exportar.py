@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select
+
+from consultas import registrar
+from database import async_engine
+from models import Base
+from serializacion import formatear_hora
+
+# Nombre en la URL -> (tabla, orden). login no se exporta
+TABLAS_EXPORT = {
+    "actividades": ("actividades", ("id",)),
+    "equipamiento": ("equipamiento", ("id",)),
+    "instructores": ("instructores", ("ci",)),
+    "clases": ("clase", ("id",)),
+    "turnos": ("turnos", ("id",)),
+    "alumnos": ("alumnos", ("ci",)),
+    "alumnosclase": ("alumno_clase", ("id_clase", "ci", "id_equipamiento")),
+}
+
+# Select con los tipos de models.py: asi las columnas TIME llegan como time/timedelta en los dos
+# motores (con text() SQLite las devuelve como el string que guardo, "09:00:00.000000")
+CONSULTAS_EXPORT = {
+    nombre: registrar(f"{tabla}.export", select(Base.metadata.tables[tabla]).order_by(*orden))
+    for nombre, (tabla, orden) in TABLAS_EXPORT.items()
+}
+
+FORMATOS_EXPORT = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Filas que se traen del cursor por vuelta y se mandan juntas en un chunk
+TAMANO_LOTE = 1000
+
+
+def _valor_exportable(valor):
+    if isinstance(valor, (timedelta, time)):
+        return formatear_hora(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def _lote_ndjson(columnas, filas):
+    lineas = []
+    for fila in filas:
+        registro = {columna: _valor_exportable(valor) for columna, valor in zip(columnas, fila)}
+        lineas.append(json.dumps(registro, ensure_ascii=False, default=str))
+    return "\n".join(lineas) + "\n"
+
+
+def _lote_csv(filas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_valor_exportable(valor) for valor in fila] for fila in filas)
+    return buffer.getvalue()
+
+
+# Generador async para StreamingResponse. conn.stream() usa un cursor server-side
+# (SSCursor en MySQL), asi que nunca hay mas de TAMANO_LOTE filas en memoria
+async def exportar_tabla(nombre, formato, engine=None):
+    async with (engine or async_engine).connect() as conn:
+        result = await conn.stream(CONSULTAS_EXPORT[nombre])
+        columnas = list(result.keys())
+        if formato == "csv":
+            yield _lote_csv([columnas])
+        async for filas in result.partitions(TAMANO_LOTE):
+            if formato == "csv":
+                yield _lote_csv(filas)
+            else:
+                yield _lote_ndjson(columnas, filas)
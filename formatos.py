@@ -0,0 +1,195 @@
+import gzip
+import importlib
+import os
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import Response
+
+from serializacion import formatear_hora, mapear_filas, transponer
+
+# Respuestas de mas de estos bytes se comprimen si el cliente manda Accept-Encoding (br o gzip)
+COMPRESION_MINIMO = int(os.getenv("COMPRESION_MINIMO", "4096"))
+# Niveles bajos: con mas nivel el cuerpo casi no achica y el tiempo se multiplica
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "5"))
+COMPRESION_NIVEL_BROTLI = int(os.getenv("COMPRESION_NIVEL_BROTLI", "4"))
+
+# ?format= -> media type. "columnar" es el mismo JSON con una lista por columna en vez de un
+# objeto por fila: {"items": {"ci": [...], "nombre": [...]}, "next": ...}. msgpack va con el
+# mismo formato por columna; en arrow el cursor de la siguiente pagina va en la metadata del schema
+FORMATOS = {
+    "json": "application/json",
+    "columnar": "application/vnd.columnar+json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Media types del header Accept que se entienden, ademas de los de FORMATOS
+TIPOS_ACCEPT = {
+    **{tipo: formato for formato, tipo in FORMATOS.items()},
+    "application/x-msgpack": "msgpack",
+    "application/*": "json",
+    "*/*": "json",
+}
+# Estan en requirements.txt; en un entorno donde falten el formato contesta 406 (y br pasa a gzip)
+MODULOS = {"msgpack": "msgpack", "arrow": "pyarrow"}
+VARY = "Accept, Accept-Encoding"
+
+# Para documentar los otros formatos en /docs
+RESPUESTAS_FORMATOS = {200: {"content": {tipo: {} for formato, tipo in FORMATOS.items() if formato != "json"}}}
+
+
+# Solo se importan la primera vez que se piden: pyarrow tarda en cargar y ocupa memoria
+@lru_cache(maxsize=None)
+def _modulo(nombre):
+    try:
+        return importlib.import_module(nombre)
+    except ImportError:
+        return None
+
+
+def disponible(formato):
+    return formato not in MODULOS or _modulo(MODULOS[formato]) is not None
+
+
+# "a;q=0.5, b" -> [("a", 0.5), ("b", 1.0)], para Accept y Accept-Encoding
+def _preferencias(cabecera):
+    preferencias = []
+    for parte in cabecera.split(","):
+        valor, *parametros = (pedazo.strip() for pedazo in parte.split(";"))
+        calidad = 1.0
+        for parametro in parametros:
+            clave, _, numero = parametro.partition("=")
+            if clave.strip() == "q":
+                try:
+                    calidad = float(numero)
+                except ValueError:
+                    calidad = 0.0
+        if valor:
+            preferencias.append((valor.lower(), calidad))
+    return preferencias
+
+
+# ?format= manda sobre Accept. Un Accept sin ningun tipo conocido sigue recibiendo JSON como
+# antes; 406 si solo pide formatos que este servidor no puede armar
+def negociar(request):
+    pedido = request.query_params.get("format")
+    if pedido is not None:
+        if pedido not in FORMATOS:
+            raise HTTPException(status_code=400, detail=f"Unknown format: {pedido}. Allowed: {', '.join(FORMATOS)}")
+        if not disponible(pedido):
+            raise HTTPException(status_code=406, detail=f"Format {pedido} is not available on this server")
+        return pedido
+    mejor, mejor_calidad, sin_modulo = None, 0.0, False
+    for tipo, calidad in _preferencias(request.headers.get("accept", "")):
+        formato = TIPOS_ACCEPT.get(tipo)
+        if formato is None or calidad <= 0:
+            continue
+        if not disponible(formato):
+            sin_modulo = True
+        elif calidad > mejor_calidad:
+            mejor, mejor_calidad = formato, calidad
+    if mejor is None and sin_modulo:
+        disponibles = ", ".join(tipo for formato, tipo in FORMATOS.items() if disponible(formato))
+        raise HTTPException(status_code=406, detail=f"Not acceptable. Available: {disponibles}")
+    return mejor or "json"
+
+
+def codificacion(request):
+    aceptadas = {valor for valor, calidad in _preferencias(request.headers.get("accept-encoding", "")) if calidad > 0}
+    if "br" in aceptadas and _modulo("brotli") is not None:
+        return "br"
+    if "gzip" in aceptadas or "*" in aceptadas:
+        return "gzip"
+    return None
+
+
+# Lo que cambia el cuerpo sin cambiar la URL: va en el ETag de Condicional(..., negociado=True)
+def variante(request):
+    return f"{negociar(request)}:{codificacion(request)}"
+
+
+######################################################################
+#                            Codificacion                            #
+######################################################################
+
+def _valor_binario(valor):
+    if isinstance(valor, (date, datetime, time)):
+        return valor.isoformat()
+    if isinstance(valor, timedelta):
+        return formatear_hora(valor)
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f"Cannot serialize {type(valor).__name__}")
+
+
+# msgpack no tiene fechas ni Decimal. Se convierten por columna: el default= de packb es una
+# llamada a Python por celda y cuesta mas que armar todo el cuerpo. Lo anidado (?expand=) sigue por default=
+def _msgpack(columnas, siguiente):
+    convertidas = {}
+    for columna, valores in columnas.items():
+        muestra = next((valor for valor in valores if valor is not None), None)
+        if isinstance(muestra, (date, time)) and None not in valores:
+            valores = tuple(map(type(muestra).isoformat, valores))
+        elif isinstance(muestra, (date, time, timedelta, Decimal)):
+            valores = tuple(None if valor is None else _valor_binario(valor) for valor in valores)
+        convertidas[columna] = valores
+    return _modulo("msgpack").packb({"items": convertidas, "next": siguiente}, default=_valor_binario, use_bin_type=True)
+
+
+def _arrow(columnas, siguiente):
+    pa = _modulo("pyarrow")
+    tabla = pa.table(columnas).replace_schema_metadata({"next": siguiente or ""})
+    destino = pa.BufferOutputStream()
+    with pa.ipc.new_stream(destino, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return destino.getvalue().to_pybytes()
+
+
+# Cuerpo de un listado en el formato pedido, desde las columnas y tuplas del cursor. Solo "json"
+# arma un dict por fila; los otros van por columna
+def codificar(formato, columnas, filas, siguiente, formateadores=None):
+    if formato == "json":
+        return orjson.dumps({"items": mapear_filas(columnas, filas, formateadores), "next": siguiente}, option=orjson.OPT_NON_STR_KEYS)
+    por_columna = transponer(columnas, filas, formateadores)
+    if formato == "columnar":
+        return orjson.dumps({"items": por_columna, "next": siguiente}, option=orjson.OPT_NON_STR_KEYS)
+    if formato == "msgpack":
+        return _msgpack(por_columna, siguiente)
+    return _arrow(por_columna, siguiente)
+
+
+def comprimir(cuerpo, metodo):
+    if metodo == "br":
+        return _modulo("brotli").compress(cuerpo, quality=COMPRESION_NIVEL_BROTLI)
+    # mtime=0: el mismo cuerpo da siempre los mismos bytes
+    return gzip.compress(cuerpo, COMPRESION_NIVEL_GZIP, mtime=0)
+
+
+######################################################################
+#                            Dependencia                             #
+######################################################################
+
+# Dependencia para los listados grandes: formato por ?format= o Accept y compresion por Accept-Encoding
+class Formato:
+    # ?format= se lee en negociar(); el parametro queda declarado para que aparezca en /docs
+    def __init__(self, request: Request, formato: Optional[str] = Query(None, alias="format")):
+        self.nombre = negociar(request)
+        self.codificacion = codificacion(request)
+
+    # Como respuesta_json: copia los headers que hayan puesto las dependencias (ETag, etc.)
+    def listado(self, columnas, filas, siguiente, response=None, formateadores=None):
+        cuerpo = codificar(self.nombre, columnas, filas, siguiente, formateadores)
+        cabeceras = {"Vary": VARY}
+        if self.codificacion is not None and len(cuerpo) >= COMPRESION_MINIMO:
+            cuerpo = comprimir(cuerpo, self.codificacion)
+            cabeceras["Content-Encoding"] = self.codificacion
+        respuesta = Response(cuerpo, media_type=FORMATOS[self.nombre], headers=cabeceras)
+        if response is not None:
+            respuesta.raw_headers.extend(
+                (clave, valor) for clave, valor in response.headers.raw if clave not in (b"content-length", b"vary")
+            )
+        return respuesta
@@ -0,0 +1,97 @@
+from bisect import bisect_left, bisect_right
+from datetime import time, timedelta
+from itertools import combinations
+
+from consultas import CONSULTAS
+from serializacion import formatear_hora
+from versiones import IndiceVersionado
+
+MINUTOS_DIA = 24 * 60
+
+
+def a_minutos(valor):
+    if isinstance(valor, timedelta):
+        return (valor.seconds // 60) % MINUTOS_DIA
+    if isinstance(valor, time):
+        return valor.hour * 60 + valor.minute
+    horas, minutos = str(valor).split(":")[:2]
+    return int(horas) * 60 + int(minutos)
+
+
+# Indice de intervalos por segmentos elementales: la linea del dia se corta en cada
+# hora_inicio/hora_fin y cada segmento guarda el set de turnos que lo cubren.
+# "que corre a las T" es un bisect (O(log n)) mas los k resultados, sin recorrer turnos.
+# Los turnos que cruzan la medianoche se guardan como dos tramos
+class IndiceTurnos(IndiceVersionado):
+    tablas = ("turnos",)
+
+    def __init__(self):
+        super().__init__()
+        self._vaciar()
+
+    def _vaciar(self):
+        self.cortes = [0, MINUTOS_DIA]
+        self.activos = [set(), set()]
+        self.tramos = {}
+        self.horas = {}
+
+    def _cortar(self, minuto):
+        i = bisect_left(self.cortes, minuto)
+        if self.cortes[i] != minuto:
+            self.cortes.insert(i, minuto)
+            self.activos.insert(i, set(self.activos[i - 1]))
+        return i
+
+    def _limpiar_corte(self, minuto):
+        i = bisect_left(self.cortes, minuto)
+        if 0 < i < len(self.cortes) - 1 and self.cortes[i] == minuto and self.activos[i] == self.activos[i - 1]:
+            del self.cortes[i]
+            del self.activos[i]
+
+    def agregar(self, id, hora_inicio, hora_fin):
+        self.quitar(id)
+        inicio, fin = a_minutos(hora_inicio), a_minutos(hora_fin)
+        if inicio == fin:
+            tramos = []
+        elif inicio < fin:
+            tramos = [(inicio, fin)]
+        else:
+            tramos = [(inicio, MINUTOS_DIA), (0, fin)]
+        for desde, hasta in tramos:
+            for i in range(self._cortar(desde), self._cortar(hasta)):
+                self.activos[i].add(id)
+        self.tramos[id] = tramos
+        self.horas[id] = (formatear_hora(hora_inicio), formatear_hora(hora_fin))
+
+    def quitar(self, id):
+        for desde, hasta in self.tramos.pop(id, []):
+            for i in range(bisect_left(self.cortes, desde), bisect_left(self.cortes, hasta)):
+                self.activos[i].discard(id)
+            self._limpiar_corte(desde)
+            self._limpiar_corte(hasta)
+        self.horas.pop(id, None)
+
+    def activos_en(self, minuto):
+        return self.activos[bisect_right(self.cortes, minuto) - 1]
+
+    # Pares de turnos que comparten algun segmento
+    def solapados(self):
+        pares = {}
+        for activos in self.activos:
+            for a, b in combinations(sorted(activos), 2):
+                pares.setdefault(a, set()).add(b)
+                pares.setdefault(b, set()).add(a)
+        return pares
+
+    def turno(self, id):
+        hora_inicio, hora_fin = self.horas[id]
+        return {"id": id, "hora_inicio": hora_inicio, "hora_fin": hora_fin}
+
+    async def cargar(self, db):
+        result = await db.execute(CONSULTAS["turnos.horarios"])
+        self._vaciar()
+        for id, hora_inicio, hora_fin in result.fetchall():
+            self.agregar(id, hora_inicio, hora_fin)
+
+
+indice_turnos = IndiceTurnos()
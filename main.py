@@ -1,138 +1,188 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Annotated
-from sqlalchemy import text
-from database import engine, SessionLocal
-from sqlalchemy.orm import Session
+from typing import Annotated, Any, List, Optional
+from sqlalchemy.exc import IntegrityError
+from database import get_db, async_engine, AsyncSessionLocal, calentar_pool, estado_pool, es_duplicado, replicas
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import Actividades, Equipamiento, Instructores, Clase, AlumnoClase, Turnos, Alumnos, User
 from squemas import ActividadCreate, EquipamientoCreate, ActividadModify, EquipamientoModify, TurnoCreate, TurnoModify, InstructorCreate, InstructorModify
 from squemas import ClaseCreate, ClaseModify, AlumnoCreate, AlumnoModify, AlumnoClaseCreate, AlumnoClaseModify, LoginRequest
-from datetime import timedelta
+from squemas import Listado, MensajeOut, ActividadOut, EquipamientoOut, InstructorOut, ClaseOut, TurnoOut, AlumnoOut, AlumnoClaseOut, LoginOut, BulkOut, TurnoSolapado
+from squemas import RosterOut, ClasesAlumnoOut, ClaseExpandida, EquipamientoExpandido, AlumnoEncontrado
+from paginacion import Pagina
+from consultas import CONSULTAS
+from exportar import TABLAS_EXPORT, FORMATOS_EXPORT, exportar_tabla
+from serializacion import mapear_filas, mapear_fila, respuesta_json, formatear_hora
+from vistas import TABLAS_VISTAS, armar_roster, armar_clases_alumno
+from expandir import Expandir, Expansion
+from proyeccion import Campos, Proyeccion, sin_campos
+from formatos import Formato, RESPUESTAS_FORMATOS
+from intervalos import indice_turnos, a_minutos
+from bulk import validar_filas, insertar_en_lote
+from cache import cache_lecturas, TABLAS_CACHEADAS
+from versiones import versiones_tablas, Condicional, revisar_workers, precargar, INDICES_AL_ARRANCAR
+from conflictos import indice_inscripciones
+from busqueda import indice_alumnos, indice_instructores, LIMITE_BUSQUEDA, LIMITE_BUSQUEDA_MAX
+from migraciones import revisar_al_arrancar
+from metricas import MedidorRutas, exposicion
+from presupuesto import PresupuestoConsultas
+from admision import AdmisionRequests, estado_limites
+from auth import usuario_actual, verificar_en_hilo, hashear_en_hilo, emitir_token, cache_tokens
+from contextlib import asynccontextmanager
+from datetime import time
+import asyncio
+import logging
 
+logger = logging.getLogger(__name__)
 
-app = FastAPI()     
-def get_db():
-    db = SessionLocal()
+# Indices que se arman al arrancar: los que cuesta cargar entero en el primer request
+INDICES_PRECARGA = (indice_inscripciones, indice_instructores, indice_alumnos)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Varios workers sin redis: cada uno tendria sus propias versiones de tabla (ETag, cache, indices)
+    revisar_workers()
+    # Migraciones pendientes y chequeo de EXPLAIN, si estan activados por env (DB_MIGRAR, DB_EXPLAIN_CHECK)
+    await revisar_al_arrancar(async_engine)
+    # Precalentar el pool antes de aceptar requests
     try:
-        yield db
-    finally:
-        db.close()
+        abiertas = await calentar_pool()
+        logger.info("Pool precalentado con %d conexiones", abiertas)
+    except Exception:
+        logger.exception("No se pudo precalentar el pool de conexiones")
+    # Primer chequeo de las replicas (si hay) y despues uno cada REPLICA_CHEQUEO segundos
+    await replicas.iniciar()
+    # Indices en memoria en segundo plano y de a partes (INDICES_AL_ARRANCAR=0 los deja para el primer uso)
+    precarga = asyncio.create_task(precargar(INDICES_PRECARGA, AsyncSessionLocal)) if INDICES_AL_ARRANCAR else None
+    yield
+    if precarga is not None:
+        precarga.cancel()
+        await asyncio.gather(precarga, return_exceptions=True)
+    await replicas.detener()
+    await async_engine.dispose()
+
+
+# Todas las rutas piden token salvo auth.RUTAS_PUBLICAS (AUTH_REQUERIDA=0 lo apaga)
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(usuario_actual)])
 
+# Limite por cliente (429) y lugares por carril segun el pool (503). Va adentro de CORS para que
+# el navegador pueda leer el Retry-After de los rechazos
+app.add_middleware(AdmisionRequests)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"], 
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Retry-After"],
 )
+# Latencia por ruta y requests en curso para /metrics
+app.add_middleware(MedidorRutas)
+# Sentencias por request: Server-Timing, log de requests lentos y presupuesto por ruta
+app.add_middleware(PresupuestoConsultas)
+
+# Despues de cada escritura: sube la version de la tabla, que es lo que cambia el ETag de los
+# GET condicionales, e invalida la cache de lecturas (si la tabla esta cacheada). La version va
+# primero: una lectura que empezo antes de la escritura la ve cambiada y no guarda lo que leyo.
+# claves son las filas tocadas (por defecto el id); los indices en memoria releen solo esas
+async def tabla_modificada(tabla, id=None, claves=None):
+    if claves is None and id is not None:
+        claves = (id,)
+    version = await versiones_tablas.incrementar(tabla, claves)
+    if tabla in TABLAS_CACHEADAS:
+        await cache_lecturas.invalidar(tabla, id)
+    return version
 
 ######################################################################
 #                            Actividades                             #  PRONTAAA
 ######################################################################
 
-#Get para obtener actividades
-@app.get("/actividades")
-async def get_actividades(db: Session = Depends(get_db)):
-    query_actividades = text("SELECT * FROM actividades")
-    result = db.execute(query_actividades).fetchall()
-    if not result:
-        raise HTTPException(status_code=404, detail="No hay actividades")
-    
-    actividades = []
-    
-    for row in result:
-        actividad = {
-            "id": row[0],
-            "descripcion": row[1],
-            "costo": row[2]
-        }
-        actividades.append(actividad)
-        
-    return actividades
+CAMPOS_ACTIVIDADES = Campos("actividades")
+
+#Get para obtener actividades (?fields=id,descripcion trae solo esas columnas)
+@app.get("/actividades", response_model=Listado[ActividadOut])
+async def get_actividades(response: Response, pagina: Pagina = Depends(), campos: Proyeccion = Depends(CAMPOS_ACTIVIDADES), db: AsyncSession = Depends(get_db)):
+    # Lectura cacheada; cargar() solo corre en un miss
+    async def cargar():
+        query_actividades, params = pagina.consulta("actividades")
+        result = await db.execute(campos.consulta(query_actividades), params)
+        filas = result.fetchall()
+        if not filas and pagina.after is None:
+            raise HTTPException(status_code=404, detail="No hay actividades")
+        filas, siguiente = pagina.cortar(filas)
+
+        actividades = mapear_filas(result.keys(), filas)
+        return {"items": actividades, "next": siguiente}
+
+    return respuesta_json(await cache_lecturas.leer("actividades", pagina.clave_cache() + campos.clave_cache(), cargar), response)
+
+#Get para obtener una actividad
+@app.get("/actividades/{id}", response_model=ActividadOut)
+async def get_actividad(id: int, campos: Proyeccion = Depends(CAMPOS_ACTIVIDADES), db: AsyncSession = Depends(get_db)):
+    async def cargar():
+        query_actividad = CONSULTAS["actividades.por_id"]
+        result = await db.execute(query_actividad, {"id": id})
+        row = result.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Actividades not found")
+        return mapear_fila(result.keys(), row)
+
+    # La entrada por id se guarda entera (asi se invalida por id); ?fields= recorta lo cacheado
+    return respuesta_json(campos.recortar(await cache_lecturas.leer("actividades", f"id:{id}", cargar)))
 
 #Post para subir actividades
-@app.post("/actividades")
-async def create_actividades(actividades: dict, db: Session = Depends(get_db)):
-    query = text("""
-        INSERT INTO actividades (descripcion, costo)
-        VALUES (:descripcion, :costo)
-    """)
-    db.execute(query, {
-        "descripcion": actividades["descripcion"],
-        "costo": actividades["costo"]
+@app.post("/actividades", response_model=ActividadOut)
+async def create_actividades(actividades: ActividadCreate, db: AsyncSession = Depends(get_db)):
+    query = CONSULTAS["actividades.insertar"]
+    result = await db.execute(query, {
+        "descripcion": actividades.descripcion,
+        "costo": actividades.costo
     })
-    db.commit()
-    
-    # Obtener la actividad recién insertada
-    query_last_inserted = text("""
-        SELECT id, descripcion, costo
-        FROM actividades
-        WHERE id = (SELECT LAST_INSERT_ID())
-    """)
-    nuevaActividad = db.execute(query_last_inserted).fetchone()
-    
-    # Convertir la fila en un diccionario
-    nuevaActividad_dict = {
-        "id": nuevaActividad[0],
-        "descripcion": nuevaActividad[1],
-        "costo": nuevaActividad[2]
+    await db.commit()
+    await tabla_modificada("actividades")
+    
+    # La respuesta se arma con el id generado y lo que se inserto, sin volver a leer la fila
+    return {
+        "id": result.lastrowid,
+        "descripcion": actividades.descripcion,
+        "costo": actividades.costo
     }
-    
-    return nuevaActividad_dict
 
 #Put para modificar actividades
-@app.put("/actividades/{id}")
-async def update_actividades(id: int, actividades: dict, db: Session = Depends(get_db)):
-    # Verificar la existencia de la actividad
-    query_actividades = text("SELECT id FROM actividades WHERE id = :id")
-    result = db.execute(query_actividades, {"id": id}).fetchone()
-    if not result:
-        raise HTTPException(status_code=404, detail="Actividades not found")
-    
-    # Actualizar la actividad
-    query_update = text("""
-        UPDATE actividades
-        SET descripcion = :descripcion,
-            costo = :costo
-        WHERE id = :id
-    """)
-    db.execute(query_update, {
-        "descripcion": actividades["descripcion"],
-        "costo": actividades["costo"],
-        "id": id
+@app.put("/actividades/{id}", response_model=ActividadOut)
+async def update_actividades(id: int, actividades: ActividadModify, db: AsyncSession = Depends(get_db)):
+    query_update = CONSULTAS["actividades.actualizar"]
+    result = await db.execute(query_update, {
+        "descripcion": actividades.descripcion,
+        "costo": actividades.costo,
+        "pk_id": id
     })
-    db.commit()
-    
-    # Obtener la actividad actualizada
-    query_updated = text("""
-        SELECT id, descripcion, costo
-        FROM actividades
-        WHERE id = :id
-    """)
-    updatedActividad = db.execute(query_updated, {"id": id}).fetchone()
+    # Si no matcheo ninguna fila la actividad no existe
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Actividades not found")
+    await db.commit()
+    await tabla_modificada("actividades", id)
     
-    # Convertir la fila en un diccionario
-    updatedActividad_dict = {
-        "id": updatedActividad[0],
-        "descripcion": updatedActividad[1],
-        "costo": updatedActividad[2]
+    return {
+        "id": id,
+        "descripcion": actividades.descripcion,
+        "costo": actividades.costo
     }
-    
-    return updatedActividad_dict
-
-@app.delete("/actividades/{id}")
-async def delete_actividades(id: int, db: Session = Depends(get_db)):
-    # Verificar la existencia de la actividad
-    query_actividades = text("SELECT id FROM actividades WHERE id = :id")
-    result = db.execute(query_actividades, {"id": id}).fetchone()
-    if not result:
+
+@app.delete("/actividades/{id}", response_model=MensajeOut)
+async def delete_actividades(id: int, db: AsyncSession = Depends(get_db)):
+    query_delete = CONSULTAS["actividades.borrar"]
+    try:
+        result = await db.execute(query_delete, {"id": id})
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Actividades is in use")
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Actividades not found")
-    
-    # Eliminar la actividad
-    query_delete = text("DELETE FROM actividades WHERE id = :id")
-    db.execute(query_delete, {"id": id})
-    db.commit()
+    await db.commit()
+    await tabla_modificada("actividades", id)
     
     return {"message": "Actividades deleted successfully"}
 
@@ -140,116 +190,115 @@ async def delete_actividades(id: int, db: Session = Depends(get_db)):
 #                            Equipamiento                            #  PRONTAAA
 ######################################################################
     
-#Get para obtener equipamiento
-@app.get("/equipamiento")
-async def get_equipamiento(db: Session = Depends(get_db)):
-    query_equipamiento = text("SELECT * FROM equipamiento")
-    result = db.execute(query_equipamiento).fetchall()
-    if not result:
-        raise HTTPException(status_code=404, detail="No equipment found")
-    
-    equipamiento = []
-    
-    for row in result:
-        equipo = {
-            "id": row[0],
-            "id_actividad": row[1],
-            "descripcion": row[2],
-            "costo": row[3]
-        }
-        equipamiento.append(equipo)
-        
-    return equipamiento
+EXPANDIR_EQUIPAMIENTO = Expandir(Equipamiento)
+CAMPOS_EQUIPAMIENTO = Campos("equipamiento")
 
+#Get para obtener equipamiento (?expand=actividad, ?fields=)
+@app.get("/equipamiento", response_model=Listado[EquipamientoExpandido])
+async def get_equipamiento(response: Response, pagina: Pagina = Depends(), expansion: Expansion = Depends(EXPANDIR_EQUIPAMIENTO), campos: Proyeccion = Depends(CAMPOS_EQUIPAMIENTO), db: AsyncSession = Depends(get_db)):
+    campos.incluir(*expansion.columnas)
+    # Lectura cacheada; cargar() solo corre en un miss
+    async def cargar():
+        query_equipamiento, params = pagina.consulta("equipamiento")
+        result = await db.execute(campos.consulta(query_equipamiento), params)
+        filas = result.fetchall()
+        if not filas and pagina.after is None:
+            raise HTTPException(status_code=404, detail="No equipment found")
+        filas, siguiente = pagina.cortar(filas)
+
+        equipamiento = mapear_filas(result.keys(), filas)
+        return {"items": equipamiento, "next": siguiente}
+
+    # La pagina sale de la cache igual que sin expand; las relaciones se cargan aparte, una sentencia cada una
+    contenido = await cache_lecturas.leer("equipamiento", pagina.clave_cache() + campos.clave_cache(), cargar)
+    if expansion:
+        contenido = {**contenido, "items": await expansion.aplicar(db, contenido["items"])}
+    return respuesta_json(contenido, response)
+
+
+#Get para obtener un equipamiento (?expand=actividad, ?fields=)
+@app.get("/equipamiento/{id}", response_model=EquipamientoExpandido)
+async def get_equipo(id: int, expansion: Expansion = Depends(EXPANDIR_EQUIPAMIENTO), campos: Proyeccion = Depends(CAMPOS_EQUIPAMIENTO), db: AsyncSession = Depends(get_db)):
+    campos.incluir(*expansion.columnas)
+    async def cargar():
+        query_equipo = CONSULTAS["equipamiento.por_id"]
+        result = await db.execute(query_equipo, {"id": id})
+        row = result.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Equipamiento not found")
+        return mapear_fila(result.keys(), row)
+
+    equipo = campos.recortar(await cache_lecturas.leer("equipamiento", f"id:{id}", cargar))
+    return respuesta_json((await expansion.aplicar(db, [equipo]))[0])
 
 #Post para subir equipamiento
-@app.post("/equipamiento")
-async def create_equipamiento(equipamiento: dict, db: Session = Depends(get_db)):
-    query = text("""
-        INSERT INTO equipamiento (id_actividad, descripcion, costo)
-        VALUES (:id_actividad, :descripcion, :costo)
-    """)
-    db.execute(query, {
-        "id_actividad": equipamiento["id_actividad"],
-        "descripcion": equipamiento["descripcion"],
-        "costo": equipamiento["costo"]
-    })
-    db.commit()
-    
-    # Obtener el equipamiento recién insertado
-    query_last_inserted = text("""
-        SELECT id, id_actividad, descripcion, costo
-        FROM equipamiento
-        WHERE id = (SELECT LAST_INSERT_ID())
-    """)
-    nuevoEquipamiento = db.execute(query_last_inserted).fetchone()
-    
-    # Convertir la fila en un diccionario
-    nuevoEquipamiento_dict = {
-        "id": nuevoEquipamiento[0],
-        "id_actividad": nuevoEquipamiento[1],
-        "descripcion": nuevoEquipamiento[2],
-        "costo": nuevoEquipamiento[3]
+@app.post("/equipamiento", response_model=EquipamientoOut)
+async def create_equipamiento(equipamiento: EquipamientoCreate, db: AsyncSession = Depends(get_db)):
+    query = CONSULTAS["equipamiento.insertar"]
+    try:
+        result = await db.execute(query, {
+            "id_actividad": equipamiento.id_actividad,
+            "descripcion": equipamiento.descripcion,
+            "costo": equipamiento.costo
+        })
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Actividad not found")
+    await db.commit()
+    await tabla_modificada("equipamiento")
+    
+    return {
+        "id": result.lastrowid,
+        "id_actividad": equipamiento.id_actividad,
+        "descripcion": equipamiento.descripcion,
+        "costo": equipamiento.costo
     }
-    
-    return nuevoEquipamiento_dict
+
+#Post para subir mucho equipamiento en una sola transaccion
+@app.post("/equipamiento/bulk", response_model=BulkOut)
+async def create_equipamiento_bulk(equipamiento: List[Any], db: AsyncSession = Depends(get_db)):
+    validas, resultados = validar_filas(EquipamientoCreate, equipamiento)
+    query = CONSULTAS["equipamiento.insertar"]
+    respuesta = await insertar_en_lote(db, query, validas, resultados)
+    await tabla_modificada("equipamiento")
+    return respuesta
 
 #Put para modificar equipamiento
-@app.put("/equipamiento/{id}")
-async def update_equipamiento(id: int, equipamiento: dict, db: Session = Depends(get_db)):
-    # Verificar la existencia del equipamiento
-    query_equipamiento = text("SELECT id FROM equipamiento WHERE id = :id")
-    result = db.execute(query_equipamiento, {"id": id}).fetchone()
-    if not result:
+@app.put("/equipamiento/{id}", response_model=EquipamientoOut)
+async def update_equipamiento(id: int, equipamiento: EquipamientoModify, db: AsyncSession = Depends(get_db)):
+    query_update = CONSULTAS["equipamiento.actualizar"]
+    try:
+        result = await db.execute(query_update, {
+            "id_actividad": equipamiento.id_actividad,
+            "descripcion": equipamiento.descripcion,
+            "costo": equipamiento.costo,
+            "pk_id": id
+        })
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Actividad not found")
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Equipamiento not found")
-    
-    # Actualizar el equipamiento
-    query_update = text("""
-        UPDATE equipamiento
-        SET id_actividad = :id_actividad,
-            descripcion = :descripcion,
-            costo = :costo
-        WHERE id = :id
-    """)
-    db.execute(query_update, {
-        "id_actividad": equipamiento["id_actividad"],
-        "descripcion": equipamiento["descripcion"],
-        "costo": equipamiento["costo"],
-        "id": id
-    })
-    db.commit()
-    
-    # Obtener el equipamiento actualizado
-    query_updated = text("""
-        SELECT id, id_actividad, descripcion, costo
-        FROM equipamiento
-        WHERE id = :id
-    """)
-    updatedEquipamiento = db.execute(query_updated, {"id": id}).fetchone()
-    
-    # Convertir la fila en un diccionario
-    updatedEquipamiento_dict = {
-        "id": updatedEquipamiento[0],
-        "id_actividad": updatedEquipamiento[1],
-        "descripcion": updatedEquipamiento[2],
-        "costo": updatedEquipamiento[3]
+    await db.commit()
+    await tabla_modificada("equipamiento", id)
+    
+    return {
+        "id": id,
+        "id_actividad": equipamiento.id_actividad,
+        "descripcion": equipamiento.descripcion,
+        "costo": equipamiento.costo
     }
-    
-    return updatedEquipamiento_dict
 
 #Delete para borrar equipamiento
-@app.delete("/equipamiento/{id}")
-async def delete_equipamiento(id: int, db: Session = Depends(get_db)):
-    # Verificar la existencia del equipamiento
-    query_equipamiento = text("SELECT id FROM equipamiento WHERE id = :id")
-    result = db.execute(query_equipamiento, {"id": id}).fetchone()
-    if not result:
+@app.delete("/equipamiento/{id}", response_model=MensajeOut)
+async def delete_equipamiento(id: int, db: AsyncSession = Depends(get_db)):
+    query_delete = CONSULTAS["equipamiento.borrar"]
+    try:
+        result = await db.execute(query_delete, {"id": id})
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Equipamiento is in use")
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Equipamiento not found")
-    
-    # Eliminar el equipamiento
-    query_delete = text("DELETE FROM equipamiento WHERE id = :id")
-    db.execute(query_delete, {"id": id})
-    db.commit()
+    await db.commit()
+    await tabla_modificada("equipamiento", id)
     
     return {"message": "Equipamiento deleted successfully"}
 
@@ -259,110 +308,104 @@ async def delete_equipamiento(id: int, db: Session = Depends(get_db)):
 ######################################################################
 
 
-#Get para obtener instructores
-@app.get("/instructores")
-async def get_instructores(db: Session = Depends(get_db)):
-    query_instructores = text("SELECT * FROM instructores")
-    result = db.execute(query_instructores).fetchall()
-    if not result:
-        raise HTTPException(status_code=404, detail="No instructors found")
-    
-    instructores = []
-    
-    for row in result:
-        instructor = {
-            "ci": row[0],
-            "nombre": row[1],
-            "apellido": row[2]
-        }
-        instructores.append(instructor)
-        
-    return instructores
+CAMPOS_INSTRUCTORES = Campos("instructores")
+
+#Get para obtener instructores (?fields=)
+@app.get("/instructores", response_model=Listado[InstructorOut])
+async def get_instructores(response: Response, pagina: Pagina = Depends(), campos: Proyeccion = Depends(CAMPOS_INSTRUCTORES), db: AsyncSession = Depends(get_db)):
+    # Lectura cacheada; cargar() solo corre en un miss
+    async def cargar():
+        query_instructores, params = pagina.consulta("instructores")
+        result = await db.execute(campos.consulta(query_instructores), params)
+        filas = result.fetchall()
+        if not filas and pagina.after is None:
+            raise HTTPException(status_code=404, detail="No instructors found")
+        filas, siguiente = pagina.cortar(filas)
+
+        instructores = mapear_filas(result.keys(), filas)
+        return {"items": instructores, "next": siguiente}
+
+    return respuesta_json(await cache_lecturas.leer("instructores", pagina.clave_cache() + campos.clave_cache(), cargar), response)
+
+#Get para buscar instructores por nombre, apellido o ci (prefijo, sin importar tildes), sale del indice en memoria (?fields=)
+@app.get("/instructores/search", response_model=Listado[InstructorOut])
+async def search_instructores(q: str, limit: int = Query(LIMITE_BUSQUEDA, ge=1, le=LIMITE_BUSQUEDA_MAX), after: Optional[str] = None, campos: Proyeccion = Depends(CAMPOS_INSTRUCTORES), db: AsyncSession = Depends(get_db)):
+    await indice_instructores.asegurar(db)
+    instructores, siguiente = indice_instructores.buscar(q, limit, after)
+    return respuesta_json({"items": [campos.recortar(instructor) for instructor in instructores], "next": siguiente})
+
+#Get para obtener un instructor
+@app.get("/instructores/{ci}", response_model=InstructorOut)
+async def get_instructor(ci: str, campos: Proyeccion = Depends(CAMPOS_INSTRUCTORES), db: AsyncSession = Depends(get_db)):
+    async def cargar():
+        query_instructor = CONSULTAS["instructores.por_id"]
+        result = await db.execute(query_instructor, {"ci": ci})
+        row = result.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Instructor not found")
+        return mapear_fila(result.keys(), row)
+
+    return respuesta_json(campos.recortar(await cache_lecturas.leer("instructores", f"id:{ci}", cargar)))
 
 #Post para subir instructores
-@app.post("/instructores")
-async def create_instructores(instructores: dict, db: Session = Depends(get_db)):
-    query = text("""
-        INSERT INTO instructores (ci, nombre, apellido)
-        VALUES (:ci, :nombre, :apellido)
-    """)
-    db.execute(query, {
-        "ci": instructores["ci"],
-        "nombre": instructores["nombre"],
-        "apellido": instructores["apellido"]
-    })
-    db.commit()
-    
-    # Obtener el instructor recién insertado
-    query_last_inserted = text("""
-        SELECT ci, nombre, apellido
-        FROM instructores
-        WHERE ci = :ci
-    """)
-    nuevoInstructor = db.execute(query_last_inserted, {"ci": instructores["ci"]}).fetchone()
-    
-    # Convertir la fila en un diccionario
-    nuevoInstructor_dict = {
-        "ci": nuevoInstructor[0],
-        "nombre": nuevoInstructor[1],
-        "apellido": nuevoInstructor[2]
+@app.post("/instructores", response_model=InstructorOut)
+async def create_instructores(instructores: InstructorCreate, db: AsyncSession = Depends(get_db)):
+    query = CONSULTAS["instructores.insertar"]
+    try:
+        await db.execute(query, {
+            "ci": instructores.ci,
+            "nombre": instructores.nombre,
+            "apellido": instructores.apellido
+        })
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Duplicate entry for instructor")
+    await db.commit()
+    version = await tabla_modificada("instructores", claves=(instructores.ci,))
+    indice_instructores.guardar(instructores.ci, instructores.nombre, instructores.apellido)
+    indice_instructores.confirmar("instructores", version)
+    
+    return {
+        "ci": instructores.ci,
+        "nombre": instructores.nombre,
+        "apellido": instructores.apellido
     }
-    
-    return nuevoInstructor_dict
 
 #Put para modificar instructores
-@app.put("/instructores/{ci}")
-async def update_instructores(ci: str, instructores: dict, db: Session = Depends(get_db)):
-    # Verificar la existencia del instructor
-    query_instructor = text("SELECT ci FROM instructores WHERE ci = :ci")
-    result = db.execute(query_instructor, {"ci": ci}).fetchone()
-    if not result:
-        raise HTTPException(status_code=404, detail="Instructor not found")
-    
-    # Actualizar el instructor
-    query_update = text("""
-        UPDATE instructores
-        SET nombre = :nombre,
-            apellido = :apellido
-        WHERE ci = :ci
-    """)
-    db.execute(query_update, {
-        "nombre": instructores["nombre"],
-        "apellido": instructores["apellido"],
-        "ci": ci
+@app.put("/instructores/{ci}", response_model=InstructorOut)
+async def update_instructores(ci: str, instructores: InstructorModify, db: AsyncSession = Depends(get_db)):
+    query_update = CONSULTAS["instructores.actualizar"]
+    result = await db.execute(query_update, {
+        "nombre": instructores.nombre,
+        "apellido": instructores.apellido,
+        "pk_ci": ci
     })
-    db.commit()
-    
-    # Obtener el instructor actualizado
-    query_updated = text("""
-        SELECT ci, nombre, apellido
-        FROM instructores
-        WHERE ci = :ci
-    """)
-    updatedInstructor = db.execute(query_updated, {"ci": ci}).fetchone()
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Instructor not found")
+    await db.commit()
+    version = await tabla_modificada("instructores", ci)
+    indice_instructores.guardar(ci, instructores.nombre, instructores.apellido)
+    indice_instructores.confirmar("instructores", version)
     
-    # Convertir la fila en un diccionario
-    updatedInstructor_dict = {
-        "ci": updatedInstructor[0],
-        "nombre": updatedInstructor[1],
-        "apellido": updatedInstructor[2]
+    return {
+        "ci": ci,
+        "nombre": instructores.nombre,
+        "apellido": instructores.apellido
     }
-    
-    return updatedInstructor_dict
 
 #Delete para borrar instructores
-@app.delete("/instructores/{ci}")
-async def delete_instructores(ci: str, db: Session = Depends(get_db)):
-    # Verificar la existencia del instructor
-    query_instructor = text("SELECT ci FROM instructores WHERE ci = :ci")
-    result = db.execute(query_instructor, {"ci": ci}).fetchone()
-    if not result:
+@app.delete("/instructores/{ci}", response_model=MensajeOut)
+async def delete_instructores(ci: str, db: AsyncSession = Depends(get_db)):
+    query_delete = CONSULTAS["instructores.borrar"]
+    try:
+        result = await db.execute(query_delete, {"ci": ci})
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Instructor is in use")
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Instructor not found")
-    
-    # Eliminar el instructor
-    query_delete = text("DELETE FROM instructores WHERE ci = :ci")
-    db.execute(query_delete, {"ci": ci})
-    db.commit()
+    await db.commit()
+    version = await tabla_modificada("instructores", ci)
+    indice_instructores.quitar(ci)
+    indice_instructores.confirmar("instructores", version)
     
     return {"message": "Instructor deleted successfully"}
 
@@ -370,130 +413,157 @@ async def delete_instructores(ci: str, db: Session = Depends(get_db)):
 #                            Clases                                  #  PRONTAAA
 ######################################################################
 
-#Get para obtener clases
-@app.get("/clases")
-async def get_clases(db: Session = Depends(get_db)):
-    query_clases = text("SELECT * FROM clase")
-    result = db.execute(query_clases).fetchall()
-    if not result:
+# MySQL devuelve dictada como 0/1
+FORMATO_CLASE = {"dictada": bool}
+EXPANDIR_CLASE = Expandir(Clase)
+CAMPOS_CLASE = Campos("clase")
+
+#Get para obtener clases (?expand=instructor,actividad,turno, ?fields=, ?format=). El ETag incluye las tablas que se pueden expandir
+@app.get("/clases", response_model=Listado[ClaseExpandida], responses=RESPUESTAS_FORMATOS, dependencies=[Depends(Condicional("clase", "instructores", "actividades", "turnos", negociado=True))])
+async def get_clases(response: Response, pagina: Pagina = Depends(), expansion: Expansion = Depends(EXPANDIR_CLASE), campos: Proyeccion = Depends(CAMPOS_CLASE), formato: Formato = Depends(), db: AsyncSession = Depends(get_db)):
+    campos.incluir(*expansion.columnas)
+    query_clases, params = pagina.consulta("clase")
+    result = await db.execute(campos.consulta(query_clases), params)
+    filas = result.fetchall()
+    if not filas and pagina.after is None:
         raise HTTPException(status_code=404, detail="No clases found")
-    
-    clases = []
-    
-    for row in result:
-        clase = {
-            "id": row[0],
-            "ci_instructor": row[1],
-            "id_actividad": row[2],
-            "id_turno": row[3],
-            "dictada": row[4]
-        }
-        clases.append(clase)
-        
-    return clases
+    filas, siguiente = pagina.cortar(filas)
+
+    if not expansion:
+        return formato.listado(result.keys(), filas, siguiente, response, FORMATO_CLASE)
+    clases = await expansion.aplicar(db, mapear_filas(result.keys(), filas, FORMATO_CLASE))
+    columnas = (*result.keys(), *expansion.nombres)
+    return formato.listado(columnas, [tuple(clase.values()) for clase in clases], siguiente, response)
+
+#Get para obtener las clases cuyo turno esta corriendo a una hora (?at=HH:MM)
+@app.get("/clases/activas", response_model=List[ClaseOut])
+async def get_clases_activas(at: str, campos: Proyeccion = Depends(CAMPOS_CLASE), db: AsyncSession = Depends(get_db)):
+    minuto = a_minutos(parsear_hora(at))
+    await indice_turnos.asegurar(db)
+    turnos_activos = indice_turnos.activos_en(minuto)
+    if not turnos_activos:
+        return []
+
+    query_clases = CONSULTAS["clase.por_turnos"]
+    result = await db.execute(campos.consulta(query_clases), {"ids": sorted(turnos_activos)})
+    return respuesta_json(mapear_filas(result.keys(), result.fetchall(), FORMATO_CLASE))
+
+#Get para obtener una clase con instructor, actividad, turno y sus alumnos con el equipamiento de
+#cada uno, en una sola consulta (antes el front bajaba seis tablas enteras y las juntaba)
+@app.get("/clases/{id}/roster", response_model=RosterOut, dependencies=[Depends(sin_campos), Depends(Condicional(*TABLAS_VISTAS))])
+async def get_clase_roster(id: int, response: Response, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(CONSULTAS["clase.roster"], {"id": id})
+    roster = armar_roster(result.keys(), result.fetchall())
+    if roster is None:
+        raise HTTPException(status_code=404, detail="Clase not found")
+    return respuesta_json(roster, response)
+
+#Get para obtener una clase (?expand=instructor,actividad,turno, ?fields=)
+@app.get("/clases/{id}", response_model=ClaseExpandida)
+async def get_clase(id: int, expansion: Expansion = Depends(EXPANDIR_CLASE), campos: Proyeccion = Depends(CAMPOS_CLASE), db: AsyncSession = Depends(get_db)):
+    campos.incluir(*expansion.columnas)
+    query_clase = CONSULTAS["clase.por_id"]
+    result = await db.execute(campos.consulta(query_clase), {"id": id})
+    row = result.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Clase not found")
+    clase = mapear_fila(result.keys(), row, FORMATO_CLASE)
+    return respuesta_json((await expansion.aplicar(db, [clase]))[0])
 
 #Post para subir clases
-@app.post("/clases")
-async def create_clases(clases: dict, db: Session = Depends(get_db)):
-    # Verificar la existencia del ci_instructor
-    query_instructor = text("SELECT ci FROM instructores WHERE ci = :ci_instructor")
-    result = db.execute(query_instructor, {"ci_instructor": clases["ci_instructor"]}).fetchone()
-    if not result:
-        raise HTTPException(status_code=400, detail="Instructor not found")
-    
-    query = text("""
-        INSERT INTO clase (ci_instructor, id_actividad, id_turno, dictada)
-        VALUES (:ci_instructor, :id_actividad, :id_turno, :dictada)
-    """)
-    db.execute(query, {
-        "ci_instructor": clases["ci_instructor"],
-        "id_actividad": clases["id_actividad"],
-        "id_turno": clases["id_turno"],
-        "dictada": clases["dictada"]
-    })
-    db.commit()
-    
-    # Obtener la clase recién insertada
-    query_last_inserted = text("""
-        SELECT id, ci_instructor, id_actividad, id_turno, dictada
-        FROM clase
-        WHERE id = LAST_INSERT_ID()
-    """)
-    nuevaClase = db.execute(query_last_inserted).fetchone()
-    
-    # Convertir la fila en un diccionario
-    nuevaClase_dict = {
-        "id": nuevaClase[0],
-        "ci_instructor": nuevaClase[1],
-        "id_actividad": nuevaClase[2],
-        "id_turno": nuevaClase[3],
-        "dictada": nuevaClase[4]
+@app.post("/clases", response_model=ClaseOut)
+async def create_clases(clases: ClaseCreate, db: AsyncSession = Depends(get_db)):
+    query = CONSULTAS["clase.insertar"]
+    # Las FK de clase validan instructor, actividad y turno en el mismo INSERT
+    try:
+        result = await db.execute(query, {
+            "ci_instructor": clases.ci_instructor,
+            "id_actividad": clases.id_actividad,
+            "id_turno": clases.id_turno,
+            "dictada": clases.dictada
+        })
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Instructor, actividad or turno not found")
+    await db.commit()
+    version = await tabla_modificada("clase", claves=(result.lastrowid,))
+    indice_inscripciones.guardar_clase(result.lastrowid, clases.id_turno)
+    indice_inscripciones.confirmar("clase", version)
+    
+    return {
+        "id": result.lastrowid,
+        "ci_instructor": clases.ci_instructor,
+        "id_actividad": clases.id_actividad,
+        "id_turno": clases.id_turno,
+        "dictada": clases.dictada
     }
-    
-    return nuevaClase_dict
 
 #Put para modificar clases
-@app.put("/clases/{id}")
-async def update_clases(id: int, clases: dict, db: Session = Depends(get_db)):
-    # Verificar la existencia de la clase
-    query_clase = text("SELECT id FROM clase WHERE id = :id")
-    result = db.execute(query_clase, {"id": id}).fetchone()
-    if not result:
-        raise HTTPException(status_code=404, detail="Clase not found")
-    
-    # Actualizar la clase
-    query_update = text("""
-        UPDATE clase
-        SET ci_instructor = :ci_instructor,
-            id_actividad = :id_actividad,
-            id_turno = :id_turno,
-            dictada = :dictada
-        WHERE id = :id
-    """)
-    db.execute(query_update, {
-        "ci_instructor": clases["ci_instructor"],
-        "id_actividad": clases["id_actividad"],
-        "id_turno": clases["id_turno"],
-        "dictada": clases["dictada"],
-        "id": id
-    })
-    db.commit()
-    
-    # Obtener la clase actualizada
-    query_updated = text("""
-        SELECT id, ci_instructor, id_actividad, id_turno, dictada
-        FROM clase
-        WHERE id = :id
-    """)
-    updatedClase = db.execute(query_updated, {"id": id}).fetchone()
-    
-    # Convertir la fila en un diccionario
-    updatedClase_dict = {
-        "id": updatedClase[0],
-        "ci_instructor": updatedClase[1],
-        "id_actividad": updatedClase[2],
-        "id_turno": updatedClase[3],
-        "dictada": updatedClase[4]
+@app.put("/clases/{id}", response_model=ClaseOut)
+async def update_clases(id: int, clases: ClaseModify, db: AsyncSession = Depends(get_db)):
+    query_update = CONSULTAS["clase.actualizar"]
+    # Si cambia el turno, ningun alumno de la clase puede quedar en dos clases a la vez.
+    # El turno nuevo se reserva en el indice antes del UPDATE y se vuelve atras si falla. El
+    # ON UPDATE CASCADE lleva el turno a alumno_clase, donde el UNIQUE (ci, id_turno) lo vuelve a revisar
+    await indice_inscripciones.asegurar(db)
+    conflicto = indice_inscripciones.conflicto_turno(id, clases.id_turno)
+    if conflicto is not None:
+        raise HTTPException(status_code=409, detail=conflicto)
+    turno_anterior = indice_inscripciones.clase_turno.get(id)
+    indice_inscripciones.guardar_clase(id, clases.id_turno)
+    try:
+        try:
+            result = await db.execute(query_update, {
+                "ci_instructor": clases.ci_instructor,
+                "id_actividad": clases.id_actividad,
+                "id_turno": clases.id_turno,
+                "dictada": clases.dictada,
+                "pk_id": id
+            })
+        except IntegrityError as error:
+            if es_duplicado(error):
+                await db.rollback()
+                raise HTTPException(status_code=409, detail=await indice_inscripciones.conflicto_turno_en_base(db, id, clases.id_turno))
+            raise HTTPException(status_code=400, detail="Instructor, actividad or turno not found")
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Clase not found")
+        await db.commit()
+    except BaseException:
+        if turno_anterior is None:
+            indice_inscripciones.quitar_clase(id)
+        else:
+            indice_inscripciones.guardar_clase(id, turno_anterior)
+        raise
+    # El turno copiado en alumno_clase tambien cambio
+    if turno_anterior != clases.id_turno:
+        indice_inscripciones.confirmar("alumno_clase", await tabla_modificada("alumno_clase", claves=()))
+    version = await tabla_modificada("clase", claves=(id,))
+    indice_inscripciones.confirmar("clase", version)
+    
+    return {
+        "id": id,
+        "ci_instructor": clases.ci_instructor,
+        "id_actividad": clases.id_actividad,
+        "id_turno": clases.id_turno,
+        "dictada": clases.dictada
     }
-    
-    return updatedClase_dict
 
 #Delete para borrar clases
-@app.delete("/clases/{id}")
-async def delete_clases(id: int, db: Session = Depends(get_db)):
+@app.delete("/clases/{id}", response_model=MensajeOut)
+async def delete_clases(id: int, db: AsyncSession = Depends(get_db)):
     # Eliminar filas dependientes en alumno_clase
-    query_alumno_clase = text("DELETE FROM alumno_clase WHERE id_clase = :id")
-    db.execute(query_alumno_clase, {"id": id})
+    query_alumno_clase = CONSULTAS["alumno_clase.borrar_por_clase"]
+    await db.execute(query_alumno_clase, {"id_clase": id})
     
-    # Eliminar la clase
-    query_clases = text("SELECT * FROM clase WHERE id = :id")
-    result = db.execute(query_clases, {"id": id}).fetchone()
-    if not result:
+    # Eliminar la clase; si no existia se descarta todo (la sesion hace rollback al cerrarse)
+    query = CONSULTAS["clase.borrar"]
+    result = await db.execute(query, {"id": id})
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Clase not found")
-    
-    query = text("DELETE FROM clase WHERE id = :id")
-    db.execute(query, {"id": id})
-    db.commit()
+    await db.commit()
+    indice_inscripciones.quitar_clase(id)
+    # Las inscripciones borradas las saca quitar_clase() al releer la clase: sin claves de alumno_clase
+    indice_inscripciones.confirmar("alumno_clase", await tabla_modificada("alumno_clase", claves=()))
+    indice_inscripciones.confirmar("clase", await tabla_modificada("clase", claves=(id,)))
 
     return {"message": "Clase deleted successfully"}
 
@@ -501,80 +571,126 @@ async def delete_clases(id: int, db: Session = Depends(get_db)):
 #                            Turnos                                  #  PRONTAAA
 ######################################################################
 
-#Get para obtener turnos
-@app.get("/turnos")
-async def get_turnos(db: Session = Depends(get_db)):
-    query_turnos = text("SELECT * FROM turnos")
-    result = db.execute(query_turnos).fetchall()
-    if not result:
-        raise HTTPException(status_code=404, detail="No turnos found")
-    
-    turnos = []
-    
-    for row in result:
-        time_delta_inicio = row[1]
-        time_delta_fin = row[2]
-
-        hours_inicio, remainder_inicio = divmod(time_delta_inicio.seconds, 3600)
-        minutes_inicio, seconds_inicio = divmod(remainder_inicio, 60)
-        formatted_time_inicio = f"{hours_inicio:02d}:{minutes_inicio:02d}"
-
-        hours_fin, remainder_fin = divmod(time_delta_fin.seconds, 3600)
-        minutes_fin, seconds_fin = divmod(remainder_fin, 60)
-        formatted_time_fin = f"{hours_fin:02d}:{minutes_fin:02d}"
-
-        turno = {
-            "id": row[0],
-            "hora_inicio": formatted_time_inicio,
-            "hora_fin": formatted_time_fin
-        }
-        turnos.append(turno)
-        
-    return turnos
+# "8:30" o "08:30:00" -> time(8, 30), que es como se guarda en la columna TIME
+def parsear_hora(valor):
+    partes = valor.split(":")
+    try:
+        horas, minutos = int(partes[0]), int(partes[1])
+        # Los segundos se aceptan (HH:MM:SS) pero los turnos van por minuto
+        segundos = int(partes[2]) if len(partes) == 3 else 0
+    except (ValueError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid time, expected HH:MM")
+    if len(partes) > 3 or not (0 <= horas < 24 and 0 <= minutos < 60 and 0 <= segundos < 60):
+        raise HTTPException(status_code=400, detail="Invalid time, expected HH:MM")
+    return time(horas, minutos)
 
-#Post para subir turnos
-@app.post("/turnos")
-async def create_turnos(turnos: TurnoCreate, db: Session = Depends(get_db)):
-    hora_inicio_parts = [int(part) for part in turnos.hora_inicio.split(":")]
-    hora_fin_parts = [int(part) for part in turnos.hora_fin.split(":")]
+FORMATO_TURNO = {"hora_inicio": formatear_hora, "hora_fin": formatear_hora}
+CAMPOS_TURNOS = Campos("turnos")
+
+#Get para obtener turnos (?fields=)
+@app.get("/turnos", response_model=Listado[TurnoOut], dependencies=[Depends(Condicional("turnos"))])
+async def get_turnos(response: Response, pagina: Pagina = Depends(), campos: Proyeccion = Depends(CAMPOS_TURNOS), db: AsyncSession = Depends(get_db)):
+    # Lectura cacheada; cargar() solo corre en un miss
+    async def cargar():
+        query_turnos, params = pagina.consulta("turnos")
+        result = await db.execute(campos.consulta(query_turnos), params)
+        filas = result.fetchall()
+        if not filas and pagina.after is None:
+            raise HTTPException(status_code=404, detail="No turnos found")
+        filas, siguiente = pagina.cortar(filas)
+
+        turnos = mapear_filas(result.keys(), filas, FORMATO_TURNO)
+        return {"items": turnos, "next": siguiente}
+
+    return respuesta_json(await cache_lecturas.leer("turnos", pagina.clave_cache() + campos.clave_cache(), cargar), response)
+
+#Get para obtener los turnos que estan corriendo a una hora (?at=HH:MM), sale del indice en memoria (?fields=)
+@app.get("/turnos/activos", response_model=List[TurnoOut])
+async def get_turnos_activos(at: str, campos: Proyeccion = Depends(CAMPOS_TURNOS), db: AsyncSession = Depends(get_db)):
+    minuto = a_minutos(parsear_hora(at))
+    await indice_turnos.asegurar(db)
+    return respuesta_json([campos.recortar(indice_turnos.turno(id)) for id in sorted(indice_turnos.activos_en(minuto))])
+
+#Get para obtener los turnos que se solapan con algun otro (?fields=; solapa_con va siempre)
+@app.get("/turnos/solapados", response_model=List[TurnoSolapado])
+async def get_turnos_solapados(campos: Proyeccion = Depends(CAMPOS_TURNOS), db: AsyncSession = Depends(get_db)):
+    await indice_turnos.asegurar(db)
+    solapados = indice_turnos.solapados()
+    return respuesta_json([
+        {**campos.recortar(indice_turnos.turno(id)), "solapa_con": sorted(otros)}
+        for id, otros in sorted(solapados.items())
+    ])
 
-    hora_inicio_timedelta = timedelta(hours=hora_inicio_parts[0], minutes=hora_inicio_parts[1])
-    hora_fin_timedelta = timedelta(hours=hora_fin_parts[0], minutes=hora_fin_parts[1])
+#Get para obtener un turno
+@app.get("/turnos/{id}", response_model=TurnoOut)
+async def get_turno(id: int, campos: Proyeccion = Depends(CAMPOS_TURNOS), db: AsyncSession = Depends(get_db)):
+    async def cargar():
+        query_turno = CONSULTAS["turnos.por_id"]
+        result = await db.execute(query_turno, {"id": id})
+        row = result.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Turnos not found")
+        return mapear_fila(result.keys(), row, FORMATO_TURNO)
 
-    nuevoTurno = Turnos(hora_inicio=hora_inicio_timedelta, hora_fin=hora_fin_timedelta)
-    db.add(nuevoTurno)
-    db.commit()
-    db.refresh(nuevoTurno)
-    return nuevoTurno
+    return respuesta_json(campos.recortar(await cache_lecturas.leer("turnos", f"id:{id}", cargar)))
+
+#Post para subir turnos
+@app.post("/turnos", response_model=TurnoOut)
+async def create_turnos(turnos: TurnoCreate, db: AsyncSession = Depends(get_db)):
+    query = CONSULTAS["turnos.insertar"]
+    hora_inicio, hora_fin = parsear_hora(turnos.hora_inicio), parsear_hora(turnos.hora_fin)
+    result = await db.execute(query, {
+        "hora_inicio": hora_inicio,
+        "hora_fin": hora_fin
+    })
+    await db.commit()
+    version = await tabla_modificada("turnos")
+    indice_turnos.agregar(result.lastrowid, hora_inicio, hora_fin)
+    indice_turnos.confirmar("turnos", version)
+    
+    return {
+        "id": result.lastrowid,
+        "hora_inicio": formatear_hora(hora_inicio),
+        "hora_fin": formatear_hora(hora_fin)
+    }
 
 #Put para modificar turnos
-@app.put("/turnos/{id}")
-async def update_turnos(id: int, turnos: TurnoModify, db: Session = Depends(get_db)):
-    db_turnos = db.query(Turnos).filter(Turnos.id == id).first()
-    if not db_turnos:
+@app.put("/turnos/{id}", response_model=TurnoOut)
+async def update_turnos(id: int, turnos: TurnoModify, db: AsyncSession = Depends(get_db)):
+    query_update = CONSULTAS["turnos.actualizar"]
+    hora_inicio, hora_fin = parsear_hora(turnos.hora_inicio), parsear_hora(turnos.hora_fin)
+    result = await db.execute(query_update, {
+        "hora_inicio": hora_inicio,
+        "hora_fin": hora_fin,
+        "pk_id": id
+    })
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Turnos not found")
-    
-    hora_inicio_parts = [int(part) for part in turnos.hora_inicio.split(":")]
-    hora_fin_parts = [int(part) for part in turnos.hora_fin.split(":")]
-
-    db_turnos.hora_inicio = timedelta(hours=hora_inicio_parts[0], minutes=hora_inicio_parts[1])
-    db_turnos.hora_fin = timedelta(hours=hora_fin_parts[0], minutes=hora_fin_parts[1])
-    
-    db.commit()
-    db.refresh(db_turnos)
-    return db_turnos
+    await db.commit()
+    version = await tabla_modificada("turnos", id)
+    indice_turnos.agregar(id, hora_inicio, hora_fin)
+    indice_turnos.confirmar("turnos", version)
+    
+    return {
+        "id": id,
+        "hora_inicio": formatear_hora(hora_inicio),
+        "hora_fin": formatear_hora(hora_fin)
+    }
 
 #Delete para borrar turnos
-@app.delete("/turnos/{id}")
-async def delete_turnos(id: int, db: Session = Depends(get_db)):
-    query_turnos = text("SELECT * FROM turnos WHERE id = :id")
-    result = db.execute(query_turnos, {"id": id}).fetchone()
-    if not result:
+@app.delete("/turnos/{id}", response_model=MensajeOut)
+async def delete_turnos(id: int, db: AsyncSession = Depends(get_db)):
+    query = CONSULTAS["turnos.borrar"]
+    try:
+        result = await db.execute(query, {"id": id})
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Turnos is in use")
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Turnos not found")
-    
-    query = text("DELETE FROM turnos WHERE id = :id")
-    db.execute(query, {"id": id})
-    db.commit()
+    await db.commit()
+    version = await tabla_modificada("turnos", id)
+    indice_turnos.quitar(id)
+    indice_turnos.confirmar("turnos", version)
 
     return {"message": "Turno deleted successfully"}
 
@@ -582,283 +698,341 @@ async def delete_turnos(id: int, db: Session = Depends(get_db)):
 #                            Alumnos                                 #  PRONTAAA
 ######################################################################
 
-#Get para obtener alumnos
-@app.get("/alumnos")
-async def get_alumnos(db: Session = Depends(get_db)):
-    query_alumnos = text("SELECT * FROM alumnos")
-    result = db.execute(query_alumnos).fetchall()
-    if not result:
+CAMPOS_ALUMNOS = Campos("alumnos")
+
+#Get para obtener alumnos (?fields=ci,nombre,apellido trae solo esas columnas; ?format= o Accept para columnar, msgpack o arrow)
+@app.get("/alumnos", response_model=Listado[AlumnoOut], responses=RESPUESTAS_FORMATOS)
+async def get_alumnos(response: Response, pagina: Pagina = Depends(), campos: Proyeccion = Depends(CAMPOS_ALUMNOS), formato: Formato = Depends(), db: AsyncSession = Depends(get_db)):
+    query_alumnos, params = pagina.consulta("alumnos")
+    result = await db.execute(campos.consulta(query_alumnos), params)
+    filas = result.fetchall()
+    if not filas and pagina.after is None:
         raise HTTPException(status_code=404, detail="No alumnos found")
-    
-    alumnos = []
-    for row in result:
-        alumno = {
-            "ci": row[0],
-            "nombre": row[1],
-            "apellido": row[2],
-            "telefono": row[3],
-            "fecha_nacimiento": row[4],
-            "correo": row[5]
-        }
-        alumnos.append(alumno)
-        
-    return alumnos
+    filas, siguiente = pagina.cortar(filas)
+
+    return formato.listado(result.keys(), filas, siguiente, response)
+
+# El indice guarda solo estas columnas: ?fields=telefono en la busqueda es un 400
+CAMPOS_ALUMNOS_BUSQUEDA = Campos("alumnos", indice_alumnos.campos)
+
+#Get para buscar alumnos por nombre, apellido, ci o correo (prefijo, sin importar tildes), sale del indice en memoria (?fields=)
+@app.get("/alumnos/search", response_model=Listado[AlumnoEncontrado])
+async def search_alumnos(q: str, limit: int = Query(LIMITE_BUSQUEDA, ge=1, le=LIMITE_BUSQUEDA_MAX), after: Optional[str] = None, campos: Proyeccion = Depends(CAMPOS_ALUMNOS_BUSQUEDA), db: AsyncSession = Depends(get_db)):
+    await indice_alumnos.asegurar(db)
+    alumnos, siguiente = indice_alumnos.buscar(q, limit, after)
+    return respuesta_json({"items": [campos.recortar(alumno) for alumno in alumnos], "next": siguiente})
+
+#Get para obtener un alumno con sus clases (instructor, actividad, turno y equipamiento), en una sola consulta
+@app.get("/alumnos/{ci}/clases", response_model=ClasesAlumnoOut, dependencies=[Depends(sin_campos), Depends(Condicional(*TABLAS_VISTAS))])
+async def get_alumno_clases(ci: str, response: Response, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(CONSULTAS["alumnos.clases"], {"ci": ci})
+    vista = armar_clases_alumno(result.keys(), result.fetchall())
+    if vista is None:
+        raise HTTPException(status_code=404, detail="Alumno not found")
+    return respuesta_json(vista, response)
 
 #Post para subir alumnos
-@app.post("/alumnos")
-async def create_alumnos(alumnos: AlumnoCreate, db: Session = Depends(get_db)):
-    query_insert = text("""
-        INSERT INTO alumnos (ci, nombre, apellido, telefono, fecha_nacimiento, correo)
-        VALUES (:ci, :nombre, :apellido, :telefono, :fecha_nacimiento, :correo)
-    """)
-    db.execute(query_insert, {
+@app.post("/alumnos", response_model=AlumnoOut)
+async def create_alumnos(alumnos: AlumnoCreate, db: AsyncSession = Depends(get_db)):
+    query_insert = CONSULTAS["alumnos.insertar"]
+    try:
+        await db.execute(query_insert, {
+            "ci": alumnos.ci,
+            "nombre": alumnos.nombre,
+            "apellido": alumnos.apellido,
+            "telefono": alumnos.telefono,
+            "fecha_nacimiento": alumnos.fecha_nacimiento,
+            "correo": alumnos.correo
+        })
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Duplicate entry for alumno")
+    await db.commit()
+    version = await tabla_modificada("alumnos", claves=(alumnos.ci,))
+    indice_alumnos.guardar(alumnos.ci, alumnos.nombre, alumnos.apellido, alumnos.correo)
+    indice_alumnos.confirmar("alumnos", version)
+    
+    return {
         "ci": alumnos.ci,
         "nombre": alumnos.nombre,
         "apellido": alumnos.apellido,
         "telefono": alumnos.telefono,
         "fecha_nacimiento": alumnos.fecha_nacimiento,
         "correo": alumnos.correo
-    })
-    db.commit()
-    
-    query_alumno = text("SELECT * FROM alumnos WHERE ci = :ci")
-    result = db.execute(query_alumno, {"ci": alumnos.ci}).fetchone()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="Alumno not found after creation")
-    
-    alumno = {
-        "ci": result[0],
-        "nombre": result[1],
-        "apellido": result[2],
-        "telefono": result[3],
-        "fecha_nacimiento": result[4],
-        "correo": result[5]
     }
-    
-    return alumno
+
+#Post para subir muchos alumnos en una sola transaccion
+@app.post("/alumnos/bulk", response_model=BulkOut)
+async def create_alumnos_bulk(alumnos: List[Any], db: AsyncSession = Depends(get_db)):
+    validas, resultados = validar_filas(AlumnoCreate, alumnos)
+    query_insert = CONSULTAS["alumnos.insertar"]
+    respuesta = await insertar_en_lote(db, query_insert, validas, resultados)
+    version = await tabla_modificada("alumnos", claves=[params["ci"] for indice, params in validas if resultados[indice]["ok"]])
+    for indice, params in validas:
+        if resultados[indice]["ok"]:
+            indice_alumnos.guardar(params["ci"], params["nombre"], params["apellido"], params["correo"])
+    indice_alumnos.confirmar("alumnos", version)
+    return respuesta
 
 #Put para modificar alumnos
-@app.put("/alumnos/{ci}")
-async def update_alumnos(ci: str, alumnos: dict, db: Session = Depends(get_db)):
-    print(alumnos)
-    query_alumnos = text("SELECT * FROM alumnos WHERE ci = :ci")
-    result = db.execute(query_alumnos, {"ci": ci}).fetchone()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="Alumno not found")
-    
-    query_update = text("""
-        UPDATE alumnos
-        SET nombre = :nombre, apellido = :apellido,  fecha_nacimiento = :fecha_nacimiento,telefono = :telefono, correo = :correo
-        WHERE ci = :ci
-    """)
-    db.execute(query_update, {
-        "nombre": alumnos.get("nombre"),
-        "apellido": alumnos.get("apellido"),
-        "telefono": alumnos.get("telefono"),
-        "fecha_nacimiento": alumnos.get("fecha_nacimiento"),
-        "correo": alumnos.get("correo"),
-        "ci": alumnos.get("ci")
+@app.put("/alumnos/{ci}", response_model=AlumnoOut)
+async def update_alumnos(ci: str, alumnos: AlumnoModify, db: AsyncSession = Depends(get_db)):
+    query_update = CONSULTAS["alumnos.actualizar"]
+    result = await db.execute(query_update, {
+        "nombre": alumnos.nombre,
+        "apellido": alumnos.apellido,
+        "telefono": alumnos.telefono,
+        "fecha_nacimiento": alumnos.fecha_nacimiento,
+        "correo": alumnos.correo,
+        "pk_ci": ci
     })
-    db.commit()
-    
-    query_alumno = text("SELECT * FROM alumnos WHERE ci = :ci")
-    result = db.execute(query_alumno, {"ci": ci}).fetchone()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="Alumno not found after update")
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Alumno not found")
+    await db.commit()
+    version = await tabla_modificada("alumnos", claves=(ci,))
+    indice_alumnos.guardar(ci, alumnos.nombre, alumnos.apellido, alumnos.correo)
+    indice_alumnos.confirmar("alumnos", version)
     
-    alumno = {
-        "ci": result[0],
-        "nombre": result[1],
-        "apellido": result[2],
-        "telefono": result[3],
-        "fecha_nacimiento": result[4],
-        "correo": result[5]
+    return {
+        "ci": ci,
+        "nombre": alumnos.nombre,
+        "apellido": alumnos.apellido,
+        "telefono": alumnos.telefono,
+        "fecha_nacimiento": alumnos.fecha_nacimiento,
+        "correo": alumnos.correo
     }
-    
-    return alumno
 
 #Delete para borrar alumnos
-@app.delete("/alumnos/{ci}")
-async def delete_alumnos(ci: str, db: Session = Depends(get_db)):
-    query_alumnos = text(f"SELECT * FROM alumnos WHERE ci = {ci}")
-    result = db.execute(query_alumnos).fetchone()
-    if not result:
+@app.delete("/alumnos/{ci}", response_model=MensajeOut)
+async def delete_alumnos(ci: str, db: AsyncSession = Depends(get_db)):
+    query_delete = CONSULTAS["alumnos.borrar"]
+    try:
+        result = await db.execute(query_delete, {"ci": ci})
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Alumno is enrolled in a clase")
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Alumno not found")
-
-    query_delete = text(f"DELETE FROM alumnos WHERE ci = {ci}")
-    db.execute(query_delete)
-    db.commit()
+    await db.commit()
+    version = await tabla_modificada("alumnos", claves=(ci,))
+    indice_alumnos.quitar(ci)
+    indice_alumnos.confirmar("alumnos", version)
     return {"message": "Alumno deleted successfully"}
 
 ######################################################################
 #                            Login                                   #
 ######################################################################
 
-@app.post("/login")
-async def login(request: LoginRequest, db: Session = Depends(get_db)):
-    query_user = text("SELECT ci, correo, contraseña FROM login WHERE ci = :ci")
-    user = db.execute(query_user, {"ci": request.ci}).fetchone()
-    
-    if user and user[2] == request.contraseña:
-        return {"message": "Login successful", "correo": user[1], "ci": user[0]}
-    else:
+#Post para loguearse: verifica la contraseña con scrypt (en el threadpool) y devuelve un token firmado
+@app.post("/login", response_model=LoginOut)
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_db)):
+    query_user = CONSULTAS["login.por_ci"]
+    user = (await db.execute(query_user, {"ci": request.ci})).fetchone()
+
+    valida, rehashear = await verificar_en_hilo(request.contraseña, user[2] if user else None)
+    if not valida:
         raise HTTPException(status_code=401, detail="Invalid CI or password")
+
+    guardada = user[2]
+    # Contraseña en texto plano (o con parametros viejos): se guarda hasheada ahora que la conocemos
+    if rehashear:
+        guardada = await hashear_en_hilo(request.contraseña)
+        await db.execute(CONSULTAS["login.actualizar_contraseña"], {"contraseña": guardada, "pk_correo": user[1]})
+        await db.commit()
+
+    token, expira = emitir_token(user[0], user[1], guardada)
+    return {"message": "Login successful", "correo": user[1], "ci": user[0], "token": token, "expira": expira}
     
 ######################################################################
 #                            Alumnosclase                            #
 ######################################################################
 
-#Get para obtener alumnosclase
-@app.get("/alumnosclase")
-async def get_alumnosclase(db: Session = Depends(get_db)):
-    query_alumnosclase = text("SELECT * FROM alumno_clase")
-    result = db.execute(query_alumnosclase).fetchall()
-    if not result:
+CAMPOS_ALUMNO_CLASE = Campos("alumno_clase")
+
+#Get para obtener alumnosclase (?fields=, ?format=)
+@app.get("/alumnosclase", response_model=Listado[AlumnoClaseOut], responses=RESPUESTAS_FORMATOS, dependencies=[Depends(Condicional("alumno_clase", negociado=True))])
+async def get_alumnosclase(response: Response, pagina: Pagina = Depends(), campos: Proyeccion = Depends(CAMPOS_ALUMNO_CLASE), formato: Formato = Depends(), db: AsyncSession = Depends(get_db)):
+    query_alumnosclase, params = pagina.consulta("alumno_clase")
+    result = await db.execute(campos.consulta(query_alumnosclase), params)
+    filas = result.fetchall()
+    if not filas and pagina.after is None:
         raise HTTPException(status_code=404, detail="No alumnosclase found")
-    
-    alumnosclase = []
-    for row in result:
-        alumno_clase = {
-            "id_clase": row[0],
-            "ci": row[1],
-            "id_equipamiento": row[2]
-        }
-        alumnosclase.append(alumno_clase)
-        
-    return alumnosclase
+    filas, siguiente = pagina.cortar(filas)
+
+    return formato.listado(result.keys(), filas, siguiente, response)
 
 #Post para subir alumnosclase, para poder hacer un post tengo que modificar la tabla de alumnos ci_alumnos
-@app.post("/alumnosclase")
-async def create_alumnosclase(alumnosclase: dict, db: Session = Depends(get_db)):
-    # Verificar si la entrada ya existe
-    query_check = text("""
-        SELECT * FROM alumno_clase
-        WHERE id_clase = :id_clase AND ci = :ci AND id_equipamiento = :id_equipamiento
-    """)
-    existing_entry = db.execute(query_check, {
-        "id_clase": alumnosclase["id_clase"],
-        "ci": alumnosclase["ci"],
-        "id_equipamiento": alumnosclase["id_equipamiento"]
-    }).fetchone()
-    
-    if existing_entry:
-        raise HTTPException(status_code=400, detail="Duplicate entry for alumno_clase")
-    
-    # Insertar la nueva entrada
-    query_insert = text("""
-        INSERT INTO alumno_clase (id_clase, ci, id_equipamiento)
-        VALUES (:id_clase, :ci, :id_equipamiento)
-    """)
-    db.execute(query_insert, {
-        "id_clase": alumnosclase["id_clase"],
-        "ci": alumnosclase["ci"],
-        "id_equipamiento": alumnosclase["id_equipamiento"]
-    })
-    db.commit()
-    
-    query_last_inserted = text("""
-        SELECT id_clase, ci, id_equipamiento
-        FROM alumno_clase
-        WHERE id_clase = :id_clase AND ci = :ci AND id_equipamiento = :id_equipamiento
-    """)
-    nuevoAlumnoClase = db.execute(query_last_inserted, {
-        "id_clase": alumnosclase["id_clase"],
-        "ci": alumnosclase["ci"],
-        "id_equipamiento": alumnosclase["id_equipamiento"]
-    }).fetchone()
-    
-    if not nuevoAlumnoClase:
-        raise HTTPException(status_code=404, detail="AlumnoClase not found after creation")
-    
-    alumno_clase_dict = {
-        "id_clase": nuevoAlumnoClase[0],
-        "ci": nuevoAlumnoClase[1],
-        "id_equipamiento": nuevoAlumnoClase[2]
+@app.post("/alumnosclase", response_model=AlumnoClaseOut)
+async def create_alumnosclase(alumnosclase: AlumnoClaseCreate, db: AsyncSession = Depends(get_db)):
+    query_insert = CONSULTAS["alumno_clase.insertar"]
+    # Doble inscripcion en la clase o en el mismo turno: 409 desde el indice, sin joins.
+    # La inscripcion se reserva en el indice antes del INSERT y se libera si no se guarda
+    await indice_inscripciones.asegurar(db)
+    indice_inscripciones.verificar(alumnosclase.ci, alumnosclase.id_clase)
+    indice_inscripciones.agregar(alumnosclase.ci, alumnosclase.id_clase, alumnosclase.id_equipamiento)
+    try:
+        turnos = await indice_inscripciones.turnos(db, [alumnosclase.id_clase])
+        if alumnosclase.id_clase not in turnos:
+            raise HTTPException(status_code=400, detail="Clase, alumno or equipamiento not found")
+        try:
+            await db.execute(query_insert, {
+                "id_clase": alumnosclase.id_clase,
+                "ci": alumnosclase.ci,
+                "id_equipamiento": alumnosclase.id_equipamiento,
+                "id_turno": turnos[alumnosclase.id_clase]
+            })
+        except IntegrityError as error:
+            if es_duplicado(error):
+                await db.rollback()
+                raise HTTPException(status_code=409, detail=await indice_inscripciones.conflicto_en_base(db, alumnosclase.ci, alumnosclase.id_clase))
+            raise HTTPException(status_code=400, detail="Clase, alumno or equipamiento not found")
+        await db.commit()
+    except BaseException:
+        indice_inscripciones.quitar(alumnosclase.ci, alumnosclase.id_clase)
+        raise
+    version = await tabla_modificada("alumno_clase", claves=(alumnosclase.ci,))
+    indice_inscripciones.confirmar("alumno_clase", version)
+    
+    return {
+        "id_clase": alumnosclase.id_clase,
+        "ci": alumnosclase.ci,
+        "id_equipamiento": alumnosclase.id_equipamiento,
+        "id_turno": indice_inscripciones.clase_turno.get(alumnosclase.id_clase)
     }
-    
-    return alumno_clase_dict
+
+#Post para subir muchos alumnosclase en una sola transaccion; los conflictos (tambien entre
+#filas del mismo pedido) los rechaza el indice de inscripciones y el resto la PK/FK
+@app.post("/alumnosclase/bulk", response_model=BulkOut)
+async def create_alumnosclase_bulk(alumnosclase: List[Any], db: AsyncSession = Depends(get_db)):
+    validas, resultados = validar_filas(AlumnoClaseCreate, alumnosclase)
+    query_insert = CONSULTAS["alumno_clase.insertar"]
+    await indice_inscripciones.asegurar(db)
+    reservadas = indice_inscripciones.reservar_lote(validas, resultados)
+    try:
+        # id_turno va como un parametro mas: el INSERT sigue siendo de muchas filas en MySQL
+        turnos = await indice_inscripciones.turnos(db, {params["id_clase"] for _, params in reservadas})
+        for indice, params in reservadas:
+            if params["id_clase"] in turnos:
+                params["id_turno"] = turnos[params["id_clase"]]
+            else:
+                resultados[indice] = {"index": indice, "ok": False, "error": f"Clase {params['id_clase']} not found"}
+        respuesta = await insertar_en_lote(db, query_insert, [(indice, params) for indice, params in reservadas if "id_turno" in params], resultados)
+    except BaseException:
+        indice_inscripciones.liberar_lote(reservadas)
+        raise
+    indice_inscripciones.liberar_lote(reservadas, resultados)
+    version = await tabla_modificada("alumno_clase", claves=[params["ci"] for indice, params in reservadas if resultados[indice]["ok"]])
+    indice_inscripciones.confirmar("alumno_clase", version)
+    return respuesta
 
 #Put para modificar alumnosclase
-@app.put("/alumnosclase/{id_clase}/{ci}/{id_equipamiento}")
-async def update_alumnosclase(id_clase: int, ci: str, id_equipamiento: int, alumnosclase: dict, db: Session = Depends(get_db)):
-    query_alumnosclase = text("""
-        SELECT * FROM alumno_clase
-        WHERE id_clase = :id_clase AND ci = :ci AND id_equipamiento = :id_equipamiento
-    """)
-    result = db.execute(query_alumnosclase, {
-        "id_clase": id_clase,
-        "ci": ci,
-        "id_equipamiento": id_equipamiento
-    }).fetchone()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="AlumnoClase not found")
-    
-    query_update = text("""
-        UPDATE alumno_clase
-        SET id_clase = :new_id_clase, ci = :new_ci, id_equipamiento = :new_id_equipamiento
-        WHERE id_clase = :id_clase AND ci = :ci AND id_equipamiento = :id_equipamiento
-    """)
-    db.execute(query_update, {
-        "new_id_clase": alumnosclase["id_clase"],
-        "new_ci": alumnosclase["ci"],
-        "new_id_equipamiento": alumnosclase["id_equipamiento"],
-        "id_clase": id_clase,
-        "ci": ci,
-        "id_equipamiento": id_equipamiento
-    })
-    db.commit()
-    
-    query_updated = text("""
-        SELECT id_clase, ci, id_equipamiento
-        FROM alumno_clase
-        WHERE id_clase = :id_clase AND ci = :ci AND id_equipamiento = :id_equipamiento
-    """)
-    updatedAlumnoClase = db.execute(query_updated, {
-        "id_clase": alumnosclase["id_clase"],
-        "ci": alumnosclase["ci"],
-        "id_equipamiento": alumnosclase["id_equipamiento"]
-    }).fetchone()
-    
-    if not updatedAlumnoClase:
-        raise HTTPException(status_code=404, detail="AlumnoClase not found after update")
-    
-    updated_alumno_clase_dict = {
-        "id_clase": updatedAlumnoClase[0],
-        "ci": updatedAlumnoClase[1],
-        "id_equipamiento": updatedAlumnoClase[2]
+@app.put("/alumnosclase/{id_clase}/{ci}/{id_equipamiento}", response_model=AlumnoClaseOut)
+async def update_alumnosclase(id_clase: int, ci: str, id_equipamiento: int, alumnosclase: AlumnoClaseModify, db: AsyncSession = Depends(get_db)):
+    query_update = CONSULTAS["alumno_clase.mover"]
+    await indice_inscripciones.asegurar(db)
+    indice_inscripciones.verificar(alumnosclase.ci, alumnosclase.id_clase, ignorar=(ci, id_clase))
+    anterior = indice_inscripciones.reemplazar(ci, id_clase, alumnosclase.ci, alumnosclase.id_clase, alumnosclase.id_equipamiento)
+    try:
+        turnos = await indice_inscripciones.turnos(db, [alumnosclase.id_clase])
+        if alumnosclase.id_clase not in turnos:
+            raise HTTPException(status_code=400, detail="Clase, alumno or equipamiento not found")
+        try:
+            result = await db.execute(query_update, {
+                "new_id_clase": alumnosclase.id_clase,
+                "new_ci": alumnosclase.ci,
+                "new_id_equipamiento": alumnosclase.id_equipamiento,
+                "new_id_turno": turnos[alumnosclase.id_clase],
+                "pk_id_clase": id_clase,
+                "pk_ci": ci,
+                "pk_id_equipamiento": id_equipamiento
+            })
+        except IntegrityError as error:
+            if es_duplicado(error):
+                await db.rollback()
+                raise HTTPException(status_code=409, detail=await indice_inscripciones.conflicto_en_base(db, alumnosclase.ci, alumnosclase.id_clase))
+            raise HTTPException(status_code=400, detail="Clase, alumno or equipamiento not found")
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="AlumnoClase not found")
+        await db.commit()
+    except BaseException:
+        indice_inscripciones.deshacer_reemplazo(ci, id_clase, anterior, alumnosclase.ci, alumnosclase.id_clase)
+        raise
+    version = await tabla_modificada("alumno_clase", claves=(ci, alumnosclase.ci))
+    indice_inscripciones.confirmar("alumno_clase", version)
+    
+    return {
+        "id_clase": alumnosclase.id_clase,
+        "ci": alumnosclase.ci,
+        "id_equipamiento": alumnosclase.id_equipamiento,
+        "id_turno": indice_inscripciones.clase_turno.get(alumnosclase.id_clase)
     }
-    
-    return updated_alumno_clase_dict
 
 #Delete para borrar alumnosclase
-@app.delete("/alumnosclase/{id_clase}/{ci}/{id_equipamiento}")
-async def delete_alumnosclase(id_clase: int, ci: str, id_equipamiento: int, db: Session = Depends(get_db)):
-    query_alumnosclase = text("""
-        SELECT * FROM alumno_clase
-        WHERE id_clase = :id_clase AND ci = :ci AND id_equipamiento = :id_equipamiento
-    """)
-    result = db.execute(query_alumnosclase, {
-        "id_clase": id_clase,
-        "ci": ci,
-        "id_equipamiento": id_equipamiento
-    }).fetchone()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="AlumnoClase not found")
-    
-    query_delete = text("""
-        DELETE FROM alumno_clase
-        WHERE id_clase = :id_clase AND ci = :ci AND id_equipamiento = :id_equipamiento
-    """)
-    db.execute(query_delete, {
+@app.delete("/alumnosclase/{id_clase}/{ci}/{id_equipamiento}", response_model=MensajeOut)
+async def delete_alumnosclase(id_clase: int, ci: str, id_equipamiento: int, db: AsyncSession = Depends(get_db)):
+    query_delete = CONSULTAS["alumno_clase.borrar"]
+    result = await db.execute(query_delete, {
         "id_clase": id_clase,
         "ci": ci,
         "id_equipamiento": id_equipamiento
     })
-    db.commit()
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="AlumnoClase not found")
+    await db.commit()
+    indice_inscripciones.quitar(ci, id_clase)
+    version = await tabla_modificada("alumno_clase", claves=(ci,))
+    indice_inscripciones.confirmar("alumno_clase", version)
     
-    return {"message": "AlumnoClase deleted successfully"}
\ No newline at end of file
+    return {"message": "AlumnoClase deleted successfully"}
+
+######################################################################
+#                            Export                                  #
+######################################################################
+
+#Get para exportar una tabla entera en streaming (ndjson o csv)
+@app.get("/export/{table}")
+async def export_table(request: Request, table: str, format: str = "ndjson"):
+    if table not in TABLAS_EXPORT:
+        raise HTTPException(status_code=404, detail="Table not found")
+    if format not in FORMATOS_EXPORT:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+
+    # El export es la lectura mas pesada: va a una replica con las mismas reglas que get_db
+    engine = await replicas.elegir(request, async_engine, (TABLAS_EXPORT[table][0],))
+    return StreamingResponse(
+        exportar_tabla(table, format, engine),
+        media_type=FORMATOS_EXPORT[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
+
+######################################################################
+#                            Internal                                #
+######################################################################
+
+#Get para ver el estado del pool de conexiones
+@app.get("/internal/pool")
+async def get_pool():
+    return estado_pool()
+
+#Get para ver hits/misses de la cache de lecturas
+@app.get("/internal/cache")
+async def get_cache():
+    return cache_lecturas.estado()
+
+#Get para ver hits/misses de la cache de tokens verificados
+@app.get("/internal/auth")
+async def get_auth():
+    return cache_tokens.estado()
+
+#Get para ver las replicas de lectura: sanas o no, lecturas y por que se fue a la primaria
+@app.get("/internal/replicas")
+async def get_replicas():
+    return replicas.estado()
+
+#Get para ver el control de admision: lugares en uso, colas por carril y rechazos
+@app.get("/internal/limites")
+async def get_limites():
+    return estado_limites()
+
+#Get con las metricas de consultas, rutas, pool y cache en formato de texto de Prometheus
+@app.get("/metrics")
+async def get_metrics():
+    return Response(exposicion(estado_pool(), cache_lecturas.estado(), cache_tokens.estado(), estado_limites(), replicas.estado()), media_type="text/plain; version=0.0.4")
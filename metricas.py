@@ -0,0 +1,269 @@
+import re
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Limites de los buckets en segundos
+BUCKETS_CONSULTAS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKETS_RUTAS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Lista (nombre, segundos) de las sentencias del request en curso; la pone presupuesto.py
+consultas_request = ContextVar("consultas_request", default=None)
+
+# Sentencias sin nombre (las que no salen de consultas.py) se agrupan por su SQL normalizado
+MAX_SQL_NORMALIZADO = 2000
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|:\w+")
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_sql(sql):
+    sql = _LITERALES.sub("?", sql)
+    sql = _LISTAS.sub("(?)", sql)
+    return _ESPACIOS.sub(" ", sql).strip()[:200]
+
+
+# Histograma acumulativo como lo espera Prometheus; observar() es un bisect sobre los limites
+class Histograma:
+    __slots__ = ("limites", "cuentas", "suma", "total")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+def _etiquetas(pares):
+    partes = []
+    for clave, valor in pares:
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _lineas_histograma(nombre, ayuda, series, claves):
+    lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+    for valores, histograma in sorted(series.items()):
+        pares = list(zip(claves, valores))
+        acumulado = 0
+        for limite, cuenta in zip(histograma.limites + (float("inf"),), histograma.cuentas):
+            acumulado += cuenta
+            le = "+Inf" if limite == float("inf") else repr(limite)
+            lineas.append(f"{nombre}_bucket{_etiquetas(pares + [('le', le)])} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas(pares)} {histograma.suma}")
+        lineas.append(f"{nombre}_count{_etiquetas(pares)} {histograma.total}")
+    return lineas
+
+
+def _lineas_simples(nombre, tipo, ayuda, series, claves=()):
+    lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+    for valores, valor in sorted(series.items()):
+        etiquetas = _etiquetas(list(zip(claves, valores))) if claves else ""
+        lineas.append(f"{nombre}{etiquetas} {valor}")
+    return lineas
+
+
+######################################################################
+#                            Consultas                               #
+######################################################################
+
+# Latencia, filas y errores por sentencia, con hooks de cursor sobre el engine. La etiqueta es
+# el nombre de consultas.py (execution_options["consulta"]) o el SQL normalizado
+class MetricasConsultas:
+    def __init__(self):
+        self.latencias = {}
+        self.filas = {}
+        self.errores = {}
+        self._normalizadas = {}
+        # Si algun engine anota las sentencias en consultas_request (presupuesto.py las cuenta)
+        self.por_request = False
+
+    def _nombre(self, contexto, sql):
+        if contexto is not None:
+            nombre = contexto.execution_options.get("consulta")
+            if nombre is not None:
+                return nombre
+        normalizada = self._normalizadas.get(sql)
+        if normalizada is None:
+            normalizada = normalizar_sql(sql)
+            if len(self._normalizadas) < MAX_SQL_NORMALIZADO:
+                self._normalizadas[sql] = normalizada
+        return normalizada
+
+    def _antes(self, conn, cursor, sql, params, contexto, executemany):
+        contexto._inicio_metricas = time.perf_counter()
+
+    def _despues(self, conn, cursor, sql, params, contexto, executemany):
+        duracion = time.perf_counter() - contexto._inicio_metricas
+        nombre = self._nombre(contexto, sql)
+        histograma = self.latencias.get(nombre)
+        if histograma is None:
+            histograma = self.latencias[nombre] = Histograma(BUCKETS_CONSULTAS)
+        histograma.observar(duracion)
+        registro = consultas_request.get()
+        if registro is not None:
+            registro.append((nombre, duracion))
+        # rowcount: filas afectadas, o leidas si el driver las trae todas (en SQLite un SELECT da -1)
+        if cursor.rowcount > 0:
+            self.filas[nombre] = self.filas.get(nombre, 0) + cursor.rowcount
+
+    def _despues_request(self, conn, cursor, sql, params, contexto, executemany):
+        registro = consultas_request.get()
+        if registro is not None:
+            registro.append((self._nombre(contexto, sql), time.perf_counter() - contexto._inicio_metricas))
+
+    def _error(self, contexto_error):
+        if contexto_error.statement is None:
+            return
+        nombre = self._nombre(contexto_error.execution_context, contexto_error.statement)
+        self.errores[nombre] = self.errores.get(nombre, 0) + 1
+
+    def escuchar(self, engine):
+        event.listen(engine, "before_cursor_execute", self._antes)
+        event.listen(engine, "after_cursor_execute", self._despues)
+        event.listen(engine, "handle_error", self._error)
+        self.por_request = True
+
+    # Solo la lista del request para presupuesto.py, sin histogramas: con DB_METRICAS=0 el
+    # presupuesto estricto igual tiene que contar las sentencias
+    def escuchar_request(self, engine):
+        event.listen(engine, "before_cursor_execute", self._antes)
+        event.listen(engine, "after_cursor_execute", self._despues_request)
+        self.por_request = True
+
+    def lineas(self):
+        lineas = _lineas_histograma(
+            "db_query_duration_seconds", "Latency of each statement", {(nombre,): h for nombre, h in self.latencias.items()}, ("query",)
+        )
+        lineas += _lineas_simples(
+            "db_query_rows_total", "counter", "Rows affected or returned, as reported by the driver",
+            {(nombre,): filas for nombre, filas in self.filas.items()}, ("query",)
+        )
+        lineas += _lineas_simples(
+            "db_query_errors_total", "counter", "Statements that raised a database error",
+            {(nombre,): errores for nombre, errores in self.errores.items()}, ("query",)
+        )
+        return lineas
+
+
+######################################################################
+#                            Rutas                                   #
+######################################################################
+
+class MetricasRutas:
+    def __init__(self):
+        self.latencias = {}
+        self.en_curso = 0
+
+    def observar(self, metodo, ruta, estado, duracion):
+        clave = (metodo, ruta, estado)
+        histograma = self.latencias.get(clave)
+        if histograma is None:
+            histograma = self.latencias[clave] = Histograma(BUCKETS_RUTAS)
+        histograma.observar(duracion)
+
+    def lineas(self):
+        lineas = _lineas_histograma(
+            "http_request_duration_seconds", "Latency of each request by route template", self.latencias, ("method", "route", "status")
+        )
+        lineas += _lineas_simples("http_requests_in_flight", "gauge", "Requests being served", {(): self.en_curso})
+        return lineas
+
+
+# Middleware ASGI puro (sin BaseHTTPMiddleware, que agrega una tarea por request). La ruta se
+# etiqueta con la plantilla (/alumnos/{ci}), que el router deja en scope["route"]
+class MedidorRutas:
+    def __init__(self, app, metricas=None):
+        self.app = app
+        self.metricas = metricas or metricas_rutas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        self.metricas.en_curso += 1
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            self.metricas.en_curso -= 1
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            self.metricas.observar(scope["method"], ruta, estado, time.perf_counter() - inicio)
+
+
+metricas_consultas = MetricasConsultas()
+metricas_rutas = MetricasRutas()
+
+
+# Texto de /metrics. pool, cache, auth, admision y replicas son los dicts de estado_pool(),
+# cache_lecturas.estado(), cache_tokens.estado(), estado_limites() y replicas.estado()
+def exposicion(pool=None, cache=None, auth=None, admision=None, replicas=None):
+    lineas = metricas_consultas.lineas() + metricas_rutas.lineas()
+    if pool is not None:
+        for clave, tipo in (("size", "gauge"), ("checked_out", "gauge"), ("idle", "gauge"), ("overflow", "gauge"),
+                            ("checkouts", "counter"), ("timeouts", "counter")):
+            nombre = f"db_pool_{clave}" + ("_total" if tipo == "counter" else "")
+            lineas += _lineas_simples(nombre, tipo, f"Connection pool {clave}", {(): pool[clave]})
+        lineas += _lineas_simples("db_pool_wait_seconds_max", "gauge", "Longest checkout wait", {(): pool["espera_max_ms"] / 1000})
+    if cache is not None:
+        for clave, nombre in (("hits", "cache_hits_total"), ("misses", "cache_misses_total"),
+                              ("invalidaciones", "cache_invalidations_total")):
+            lineas += _lineas_simples(
+                nombre, "counter", f"Read cache {clave} by table",
+                {(tabla,): valores[clave] for tabla, valores in cache["tablas"].items()}, ("table",)
+            )
+        if cache["entradas"] is not None:
+            lineas += _lineas_simples("cache_entries", "gauge", "Entries in the read cache", {(): cache["entradas"]})
+        lineas += _lineas_simples("cache_evictions_total", "counter", "Entries evicted from the read cache", {(): cache["desalojos"]})
+        lineas += _lineas_simples("cache_errors_total", "counter", "Cache backend errors", {(): cache["errores"]})
+    if auth is not None:
+        for clave, nombre, tipo in (("hits", "auth_token_cache_hits_total", "counter"),
+                                    ("misses", "auth_token_cache_misses_total", "counter"),
+                                    ("entradas", "auth_token_cache_entries", "gauge")):
+            lineas += _lineas_simples(nombre, tipo, f"Verified token cache {clave}", {(): auth[clave]})
+    if admision is not None:
+        lineas += _lineas_simples("http_admission_in_use", "gauge", "Requests holding an admission slot", {(): admision["en_uso"]})
+        lineas += _lineas_simples("http_admission_capacity", "gauge", "Admission slots", {(): admision["capacidad"]})
+        lineas += _lineas_simples(
+            "http_admission_queued", "gauge", "Requests waiting for a slot by lane",
+            {(carril,): cantidad for carril, cantidad in admision["esperando"].items()}, ("lane",)
+        )
+        lineas += _lineas_simples(
+            "http_admission_admitted_total", "counter", "Requests admitted by lane",
+            {(carril,): cantidad for carril, cantidad in admision["admitidos"].items()}, ("lane",)
+        )
+        lineas += _lineas_simples(
+            "http_admission_rejected_total", "counter", "Requests shed with 429 (client) or 503 (capacity)",
+            {(rechazo["motivo"], rechazo["carril"]): rechazo["cantidad"] for rechazo in admision["rechazos"]}, ("reason", "lane")
+        )
+    if replicas is not None and replicas["replicas"]:
+        lineas += _lineas_simples(
+            "db_replica_up", "gauge", "1 if the read replica passes its health check",
+            {(replica["nombre"],): int(replica["sana"]) for replica in replicas["replicas"]}, ("replica",)
+        )
+        lineas += _lineas_simples(
+            "db_replica_reads_total", "counter", "Requests routed to each read replica",
+            {(replica["nombre"],): replica["lecturas"] for replica in replicas["replicas"]}, ("replica",)
+        )
+        lineas += _lineas_simples(
+            "db_read_routing_total", "counter", "Routing decisions by reason (replica or why the primary was used)",
+            {(motivo,): cantidad for motivo, cantidad in replicas["motivos"].items()}, ("reason",)
+        )
+    return "\n".join(lineas) + "\n"
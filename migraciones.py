@@ -0,0 +1,234 @@
+import logging
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, func, insert, inspect, select, text
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.sql.elements import BindParameter
+
+import models
+from consultas import CONSULTAS
+
+logger = logging.getLogger(__name__)
+
+# Al arrancar la app: aplicar migraciones pendientes y/o revisar los planes de las queries
+MIGRAR_AL_ARRANCAR = os.getenv("DB_MIGRAR", "0") == "1"
+EXPLAIN_AL_ARRANCAR = os.getenv("DB_EXPLAIN_CHECK", "0") == "1"
+
+# Tabla con las migraciones ya aplicadas; va aparte de models.py para que create_all no la toque
+metadata_migraciones = MetaData()
+schema_version = Table(
+    "schema_version",
+    metadata_migraciones,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("descripcion", String(255), nullable=False),
+    Column("aplicada", DateTime, nullable=False),
+)
+
+
+######################################################################
+#                            Migraciones                             #
+######################################################################
+
+# Cada migracion es una funcion que recibe una conexion sincronica. En MySQL el DDL hace commit
+# implicito, asi que todas tienen que poder correrse de nuevo sin romper (checkfirst)
+
+def _esquema_inicial(conn):
+    models.Base.metadata.create_all(conn)
+
+
+# Indices sobre las FK declarados con index=True en models.py. Tambien sirve para bases
+# creadas a mano antes de que existieran las migraciones
+def _indices_fk(conn):
+    for tabla in models.Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(conn, checkfirst=True)
+
+
+# El UNIQUE (ci, id_turno) no se puede agregar si ya hay alumnos en dos clases del mismo turno (o
+# inscripciones a clases borradas): se frena antes de tocar la tabla para que se arreglen a mano
+def _revisar_inscripciones(conn):
+    huerfanas = conn.execute(text(
+        "SELECT COUNT(*) FROM alumno_clase LEFT JOIN clase ON clase.id = alumno_clase.id_clase WHERE clase.id IS NULL"
+    )).scalar()
+    repetidas = conn.execute(text(
+        "SELECT alumno_clase.ci, clase.id_turno FROM alumno_clase JOIN clase ON clase.id = alumno_clase.id_clase "
+        "GROUP BY alumno_clase.ci, clase.id_turno HAVING COUNT(*) > 1 LIMIT 5"
+    )).all()
+    if huerfanas or repetidas:
+        raise RuntimeError(
+            f"alumno_clase tiene {huerfanas} inscripciones sin clase y alumnos en dos clases del mismo turno "
+            f"(ci, id_turno): {[tuple(fila) for fila in repetidas]}. Corregirlas y volver a migrar"
+        )
+
+
+# alumno_clase.id_turno con su UNIQUE (ci, id_turno) y la FK (id_clase, id_turno) -> clase de
+# models.py. Una base creada con este models.py ya lo tiene y no se toca
+def _turno_en_inscripciones(conn):
+    for indice in models.Clase.__table__.indexes:
+        indice.create(conn, checkfirst=True)
+    inspector = inspect(conn)
+    if any(unico["name"] == "uq_alumno_clase_ci_turno" for unico in inspector.get_unique_constraints("alumno_clase")):
+        return
+    _revisar_inscripciones(conn)
+    if conn.dialect.name == "mysql":
+        if "id_turno" not in {columna["name"] for columna in inspector.get_columns("alumno_clase")}:
+            conn.execute(text("ALTER TABLE alumno_clase ADD COLUMN id_turno INT NULL"))
+        conn.execute(text(
+            "UPDATE alumno_clase JOIN clase ON clase.id = alumno_clase.id_clase SET alumno_clase.id_turno = clase.id_turno"
+        ))
+        conn.execute(text(
+            "ALTER TABLE alumno_clase MODIFY id_turno INT NOT NULL, "
+            "ADD CONSTRAINT uq_alumno_clase_ci_turno UNIQUE (ci, id_turno), "
+            "ADD CONSTRAINT fk_alumno_clase_turno FOREIGN KEY (id_clase, id_turno) REFERENCES clase (id, id_turno) ON UPDATE CASCADE"
+        ))
+        return
+    # SQLite no agrega constraints con ALTER TABLE: tabla nueva desde models.py y se copian las filas
+    indices = [indice["name"] for indice in inspector.get_indexes("alumno_clase")]
+    conn.execute(text("ALTER TABLE alumno_clase RENAME TO alumno_clase_anterior"))
+    for indice in indices:
+        conn.execute(text(f"DROP INDEX {indice}"))
+    models.AlumnoClase.__table__.create(conn)
+    conn.execute(text(
+        "INSERT INTO alumno_clase (id_clase, ci, id_equipamiento, id_turno) "
+        "SELECT anterior.id_clase, anterior.ci, anterior.id_equipamiento, clase.id_turno "
+        "FROM alumno_clase_anterior AS anterior JOIN clase ON clase.id = anterior.id_clase"
+    ))
+    conn.execute(text("DROP TABLE alumno_clase_anterior"))
+
+
+# Los cambios nuevos al esquema van siempre como una migracion nueva al final, nunca editando una vieja
+MIGRACIONES = [
+    (1, "Esquema inicial desde models.py", _esquema_inicial),
+    (2, "Indices secundarios sobre las FK", _indices_fk),
+    (3, "Un alumno por turno: alumno_clase.id_turno con UNIQUE (ci, id_turno)", _turno_en_inscripciones),
+]
+
+
+def version_actual(conn):
+    schema_version.create(conn, checkfirst=True)
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+# Aplica las migraciones pendientes y devuelve las versiones aplicadas. En MySQL toma un lock
+# con nombre para que varios workers arrancando a la vez no migren en paralelo
+def migrar(conn):
+    mysql = conn.dialect.name == "mysql"
+    if mysql:
+        conn.execute(text("SELECT GET_LOCK('schema_version', 60)"))
+    try:
+        actual = version_actual(conn)
+        aplicadas = []
+        for version, descripcion, paso in MIGRACIONES:
+            if version <= actual:
+                continue
+            paso(conn)
+            conn.execute(insert(schema_version).values(version=version, descripcion=descripcion, aplicada=datetime.now()))
+            conn.commit()
+            aplicadas.append(version)
+        return aplicadas
+    finally:
+        if mysql:
+            conn.execute(text("SELECT RELEASE_LOCK('schema_version')"))
+
+
+######################################################################
+#                            Explain                                 #
+######################################################################
+
+# Valores de relleno segun el tipo de cada parametro: en MySQL comparar un CHAR con un entero anula el indice
+def _relleno(parametro):
+    try:
+        tipo = parametro.type.python_type
+    except NotImplementedError:
+        tipo = str
+    if tipo in (bool, int, float):
+        valor, tipo_sql = tipo(1), parametro.type
+    else:
+        valor, tipo_sql = "1", String()
+    if parametro.expanding:
+        valor = [valor]
+    return bindparam(parametro.key, valor, type_=tipo_sql, expanding=parametro.expanding)
+
+
+def sql_con_valores(sentencia, dialecto):
+    con_valores = visitors.replacement_traverse(
+        sentencia, {}, lambda elemento: _relleno(elemento) if isinstance(elemento, BindParameter) else None
+    )
+    return str(con_valores.compile(dialect=dialecto, compile_kwargs={"literal_binds": True}))
+
+
+def _plan(conn, sql):
+    mysql = conn.dialect.name == "mysql"
+    filas = [dict(fila._mapping) for fila in conn.exec_driver_sql(("EXPLAIN " if mysql else "EXPLAIN QUERY PLAN ") + sql)]
+    if mysql:
+        escaneos = [f"{fila['table']}: type ALL" for fila in filas if fila.get("type") == "ALL"]
+    else:
+        escaneos = [fila["detail"] for fila in filas if fila["detail"].startswith("SCAN ") and " USING " not in fila["detail"]]
+    return filas, escaneos
+
+
+# Corre EXPLAIN sobre cada sentencia del registro de consultas.py. Un recorrido completo solo
+# se marca si la sentencia filtra (WHERE): un listado o la carga de un indice leen la tabla
+# entera a proposito. Los INSERT ... VALUES no leen la tabla y se saltean
+def revisar_consultas(conn):
+    hallazgos = []
+    for nombre, sentencia in sorted(CONSULTAS.items()):
+        if isinstance(sentencia, Insert) or sentencia.whereclause is None:
+            continue
+        sql = sql_con_valores(sentencia, conn.dialect)
+        _, escaneos = _plan(conn, sql)
+        if escaneos:
+            hallazgos.append({"consulta": nombre, "sql": " ".join(sql.split()), "escaneos": escaneos})
+    return hallazgos
+
+
+# Para el lifespan de main.py, sobre el engine async
+async def revisar_al_arrancar(async_engine):
+    if MIGRAR_AL_ARRANCAR:
+        async with async_engine.connect() as conn:
+            aplicadas = await conn.run_sync(migrar)
+        if aplicadas:
+            logger.info("Migraciones aplicadas: %s", aplicadas)
+    if EXPLAIN_AL_ARRANCAR:
+        async with async_engine.connect() as conn:
+            hallazgos = await conn.run_sync(revisar_consultas)
+        for hallazgo in hallazgos:
+            logger.warning("Full scan en %s: %s (%s)", hallazgo["consulta"], hallazgo["sql"], "; ".join(hallazgo["escaneos"]))
+
+
+# python migraciones.py upgrade  -> aplica las migraciones pendientes
+# python migraciones.py explain  -> lista las sentencias del registro que hacen full scan (exit 1 si hay)
+# python migraciones.py status   -> version actual del esquema
+def main(argumentos):
+    from database import engine
+
+    comando = argumentos[0] if argumentos else "upgrade"
+    if comando == "upgrade":
+        with engine.connect() as conn:
+            aplicadas = migrar(conn)
+        print(f"Migraciones aplicadas: {aplicadas}" if aplicadas else "El esquema ya estaba al dia")
+        return 0
+    if comando == "status":
+        with engine.connect() as conn:
+            actual = version_actual(conn)
+            conn.commit()
+        print(f"Version {actual} de {MIGRACIONES[-1][0]}")
+        return 0
+    if comando == "explain":
+        with engine.connect() as conn:
+            hallazgos = revisar_consultas(conn)
+        for hallazgo in hallazgos:
+            print(f"{hallazgo['consulta']}: {hallazgo['sql']}")
+            for escaneo in hallazgo["escaneos"]:
+                print(f"    {escaneo}")
+        print(f"{len(hallazgos)} sentencias con full scan")
+        return 1 if hallazgos else 0
+    print("Uso: python migraciones.py [upgrade|status|explain]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
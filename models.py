@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, CHAR, Boolean, Date, Time
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, CHAR, Boolean, Date, Time, Index, ForeignKeyConstraint, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -15,7 +15,7 @@ class Equipamiento(Base):
     __tablename__ = "equipamiento"
     
     id = Column(Integer, primary_key=True,autoincrement=True)
-    id_actividad = Column(Integer, ForeignKey('actividades.id'), nullable=False)
+    id_actividad = Column(Integer, ForeignKey('actividades.id'), index=True, nullable=False)
     descripcion = Column(String(255), nullable=False)
     costo = Column(Float, nullable=False)
     
@@ -32,10 +32,13 @@ class Clase(Base):
     __tablename__ = "clase"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ci_instructor = Column(CHAR(11), ForeignKey('instructores.ci'), nullable=False)
-    id_actividad = Column(Integer, ForeignKey('actividades.id'), nullable=False)
-    id_turno = Column(Integer, ForeignKey('turnos.id'), nullable=False)
+    ci_instructor = Column(CHAR(11), ForeignKey('instructores.ci'), index=True, nullable=False)
+    id_actividad = Column(Integer, ForeignKey('actividades.id'), index=True, nullable=False)
+    id_turno = Column(Integer, ForeignKey('turnos.id'), index=True, nullable=False)
     dictada = Column(Boolean, default=False)
+
+    # Destino de la FK (id_clase, id_turno) de alumno_clase
+    __table_args__ = (Index("uq_clase_id_turno", "id", "id_turno", unique=True),)
     
     instructor = relationship("Instructores")
     actividad = relationship("Actividades")
@@ -45,8 +48,17 @@ class AlumnoClase(Base):
     __tablename__ = "alumno_clase"
     
     id_clase = Column(Integer, ForeignKey('clase.id'), primary_key=True, nullable=False)
-    ci = Column(CHAR(11), ForeignKey('alumnos.ci'), primary_key=True, nullable=False)
-    id_equipamiento = Column(Integer, ForeignKey('equipamiento.id'), primary_key=True, nullable=False)
+    ci = Column(CHAR(11), ForeignKey('alumnos.ci'), primary_key=True, index=True, nullable=False)
+    id_equipamiento = Column(Integer, ForeignKey('equipamiento.id'), primary_key=True, index=True, nullable=False)
+    # Copia del turno de la clase, que la FK compuesta mantiene al dia (ON UPDATE CASCADE). Con el
+    # UNIQUE (ci, id_turno) la base misma rechaza a un alumno en dos clases del mismo turno (o dos
+    # veces en la misma clase), atienda el worker que atienda la escritura
+    id_turno = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(["id_clase", "id_turno"], ["clase.id", "clase.id_turno"], name="fk_alumno_clase_turno", onupdate="CASCADE"),
+        UniqueConstraint("ci", "id_turno", name="uq_alumno_clase_ci_turno"),
+    )
 
 class Turnos(Base):
     __tablename__ = "turnos"
@@ -0,0 +1,62 @@
+import base64
+import binascii
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Query
+
+from consultas import CONSULTAS, claves_tabla
+from models import Base
+
+LIMITE_DEFAULT = 100
+LIMITE_MAX = 1000
+
+
+# El cursor es opaco para el cliente: base64 del JSON con la clave primaria de la ultima fila
+def codificar_cursor(valores):
+    crudo = json.dumps(list(valores), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor, cantidad):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # type() y no isinstance(): true/false de JSON son bool, que hereda de int
+    if not all(type(valor) in (int, str) for valor in valores):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return valores
+
+
+# Dependencia con ?limit= y ?after= para los endpoints de listado
+class Pagina:
+    def __init__(self, limit: int = Query(LIMITE_DEFAULT, ge=1, le=LIMITE_MAX), after: Optional[str] = None):
+        self.limit = limit
+        self.after = after
+        self.claves = ()
+
+    def clave_cache(self):
+        return f"lista:{self.limit}:{self.after}"
+
+    # Sentencia de la pagina (ya armada en consultas.py) y sus parametros; se pide una fila
+    # de mas para saber si hay siguiente. El cursor es la PK de la tabla
+    def consulta(self, tabla):
+        self.claves = claves_tabla(Base.metadata.tables[tabla])
+        params = {"limite": self.limit + 1}
+        if self.after is None:
+            return CONSULTAS[f"{tabla}.pagina"], params
+        valores = decodificar_cursor(self.after, len(self.claves))
+        params.update({f"after_{i}": valor for i, valor in enumerate(valores)})
+        return CONSULTAS[f"{tabla}.pagina_siguiente"], params
+
+    # Devuelve las filas de la pagina y el cursor de la siguiente (None si es la ultima)
+    def cortar(self, filas):
+        if len(filas) <= self.limit:
+            return filas, None
+        filas = filas[:self.limit]
+        ultima = filas[-1]._mapping
+        return filas, codificar_cursor(ultima[clave] for clave in self.claves)
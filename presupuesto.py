@@ -0,0 +1,118 @@
+import logging
+import os
+import time
+
+from consultas import PARTES
+from metricas import consultas_request, metricas_consultas
+
+logger = logging.getLogger(__name__)
+
+# Sentencias permitidas por request si la ruta no tiene presupuesto propio. Casi todos los
+# handlers hacen un solo viaje a la base, asi que un loop de queries salta enseguida
+PRESUPUESTO_DEFAULT = int(os.getenv("DB_PRESUPUESTO_DEFAULT", "1"))
+# 1 = pasarse del presupuesto levanta PresupuestoExcedido (para tests); 0 = solo warning en el log.
+# Estricto, database.py cuenta las sentencias aunque DB_METRICAS=0 apague las metricas
+PRESUPUESTO_ESTRICTO = os.getenv("DB_PRESUPUESTO_ESTRICTO", "0") == "1"
+# Requests mas lentos que esto se loguean con la lista completa de sentencias
+REQUEST_LENTO_MS = float(os.getenv("DB_REQUEST_LENTO_MS", "500"))
+
+# "METODO /plantilla" -> maximo de sentencias (None = sin limite). Los indices en memoria
+# (turnos, inscripciones) pueden sumar sus consultas de carga cuando estan desactualizados
+PRESUPUESTOS = {
+    # ?expand= suma una sentencia por relacion pedida (expandir.py), nunca una por fila
+    "GET /clases": 4,
+    "GET /clases/{id}": 4,
+    "GET /equipamiento": 2,
+    "GET /equipamiento/{id}": 2,
+    "GET /clases/activas": 2,
+    "PUT /clases/{id}": 3,
+    "DELETE /clases/{id}": 2,
+    "POST /alumnosclase": 3,
+    "PUT /alumnosclase/{id_clase}/{ci}/{id_equipamiento}": 3,
+    # Si la contraseña estaba en texto plano o con otros parametros de scrypt se rehashea en el mismo login
+    "POST /login": 2,
+    # Un executemany por lote y, si un lote falla, una sentencia por fila
+    "POST /equipamiento/bulk": None,
+    "POST /alumnos/bulk": None,
+    "POST /alumnosclase/bulk": None,
+    "GET /export/{table}": None,
+}
+
+
+# Las partes siguientes de la carga de un indice (consultas._partes) son la misma lectura cortada
+# en pedazos: para el presupuesto cuentan como una sola sentencia
+CONTINUACIONES = {f"{nombre}_siguiente" for nombre in PARTES}
+
+
+class PresupuestoExcedido(Exception):
+    pass
+
+
+# DB_PRESUPUESTOS="GET /clases=2,POST /alumnos=1" pisa o agrega presupuestos sin tocar el codigo
+def leer_presupuestos(valor):
+    presupuestos = {}
+    for entrada in filter(None, (parte.strip() for parte in valor.split(","))):
+        ruta, _, maximo = entrada.rpartition("=")
+        presupuestos[ruta.strip()] = None if maximo.strip() in ("", "none") else int(maximo)
+    return presupuestos
+
+
+PRESUPUESTOS.update(leer_presupuestos(os.getenv("DB_PRESUPUESTOS", "")))
+
+
+def _detalle(consultas):
+    return ", ".join(f"{nombre} {duracion * 1000:.1f}ms" for nombre, duracion in consultas)
+
+
+# Middleware ASGI: cuenta las sentencias y el tiempo en la base de cada request (los hooks de
+# metricas.py las anotan en consultas_request), agrega Server-Timing, loguea los requests lentos
+# y controla el presupuesto de la ruta. Sin hooks (DB_METRICAS=0 y no estricto) no hay nada que
+# contar: Server-Timing lleva solo el tiempo total y el presupuesto no se revisa
+class PresupuestoConsultas:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        consultas = []
+        token = consultas_request.set(consultas)
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - inicio) * 1000
+                valor = f"app;dur={total_ms:.2f}"
+                if metricas_consultas.por_request:
+                    db_ms = sum(duracion for _, duracion in consultas) * 1000
+                    valor = f'db;dur={db_ms:.2f};desc="{len(consultas)} queries", {valor}'
+                mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), (b"server-timing", valor.encode())]}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            consultas_request.reset(token)
+        self._revisar(scope, consultas, time.perf_counter() - inicio)
+
+    def _revisar(self, scope, consultas, duracion):
+        ruta = getattr(scope.get("route"), "path", None)
+        if ruta is None:
+            return
+        clave = f"{scope['method']} {ruta}"
+        if not metricas_consultas.por_request:
+            if duracion * 1000 >= REQUEST_LENTO_MS:
+                logger.warning("Request lento %s: %.1f ms", clave, duracion * 1000)
+            return
+        if duracion * 1000 >= REQUEST_LENTO_MS:
+            db_ms = sum(tiempo for _, tiempo in consultas) * 1000
+            logger.warning("Request lento %s: %.1f ms (db %.1f ms, %d sentencias): %s",
+                           clave, duracion * 1000, db_ms, len(consultas), _detalle(consultas))
+        maximo = PRESUPUESTOS.get(clave, PRESUPUESTO_DEFAULT)
+        sentencias = sum(1 for nombre, _ in consultas if nombre not in CONTINUACIONES)
+        if maximo is not None and sentencias > maximo:
+            mensaje = f"{clave} hizo {sentencias} sentencias, el presupuesto es {maximo}: {_detalle(consultas)}"
+            if PRESUPUESTO_ESTRICTO:
+                raise PresupuestoExcedido(mensaje)
+            logger.warning(mensaje)
@@ -0,0 +1,72 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+from consultas import claves_tabla
+from models import Base
+
+# Sentencias ya proyectadas: (consulta, columnas) -> select con solo esas columnas. Se arma una
+# vez por combinacion, asi SQLAlchemy reutiliza la forma compilada igual que con las de consultas.py
+_proyectadas = {}
+
+
+# Dependencia con ?fields=id,descripcion para los GET de una tabla. Los nombres se validan
+# contra las columnas de models.py; la PK va siempre (la usan el cursor y la cache por id).
+# Las busquedas salen de un indice en memoria que guarda solo algunas columnas: esas se pasan
+# en columnas y son las unicas que se aceptan
+class Campos:
+    def __init__(self, tabla, columnas=None):
+        self.tabla = Base.metadata.tables[tabla]
+        self.claves = claves_tabla(self.tabla)
+        self.columnas = list(self.tabla.c.keys()) if columnas is None else [nombre for nombre in self.tabla.c.keys() if nombre in columnas]
+
+    def __call__(self, fields: Optional[str] = None):
+        if not fields:
+            return Proyeccion(self.tabla, None)
+        pedidas = {nombre.strip() for nombre in fields.split(",") if nombre.strip()}
+        invalidas = sorted(pedidas - set(self.columnas))
+        if invalidas:
+            permitidas = ", ".join(self.columnas)
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(invalidas)}. Allowed: {permitidas}")
+        return Proyeccion(self.tabla, pedidas | set(self.claves))
+
+
+# Para las vistas anidadas de vistas.py (roster, clases de un alumno), que no tienen una tabla
+# que proyectar: ?fields= es un 400 en vez de ignorarse en silencio
+def sin_campos(fields: Optional[str] = None):
+    if fields is not None:
+        raise HTTPException(status_code=400, detail="fields is not supported on this route")
+
+
+class Proyeccion:
+    def __init__(self, tabla, columnas):
+        self.tabla = tabla
+        # Siempre en el orden de la tabla: ?fields=b,a y ?fields=a,b son la misma sentencia y la misma entrada de cache
+        self.columnas = None if columnas is None else tuple(nombre for nombre in tabla.c.keys() if nombre in columnas)
+
+    def __bool__(self):
+        return self.columnas is not None
+
+    # Columnas que el handler necesita aunque no se hayan pedido (por ejemplo las FK de ?expand=)
+    def incluir(self, *columnas):
+        if self.columnas is not None and columnas:
+            self.columnas = tuple(nombre for nombre in self.tabla.c.keys() if nombre in self.columnas or nombre in columnas)
+
+    # La sentencia de consultas.py con solo las columnas pedidas; sin ?fields= la misma
+    def consulta(self, sentencia):
+        if self.columnas is None:
+            return sentencia
+        clave = (sentencia.get_execution_options()["consulta"], self.columnas)
+        proyectada = _proyectadas.get(clave)
+        if proyectada is None:
+            proyectada = _proyectadas[clave] = sentencia.with_only_columns(*(self.tabla.c[nombre] for nombre in self.columnas))
+        return proyectada
+
+    def clave_cache(self):
+        return "" if self.columnas is None else ":" + ",".join(self.columnas)
+
+    # Para lo que ya esta entero en la cache de lecturas (entradas por id): no hace falta ir a la base
+    def recortar(self, objeto):
+        if self.columnas is None:
+            return objeto
+        return {nombre: objeto[nombre] for nombre in self.columnas}
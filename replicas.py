@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from cache import CACHE_URL
+from versiones import versiones_tablas
+from vistas import TABLAS_VISTAS
+
+logger = logging.getLogger(__name__)
+
+# Segundos despues de una escritura en los que se lee de la primaria: para el cliente que escribio
+# (read-your-writes) y para todas las rutas que leen la tabla escrita (asi la cache de lecturas,
+# los ETag y los indices en memoria no se llenan con datos de una replica atrasada)
+REPLICA_VENTANA = float(os.getenv("REPLICA_VENTANA", "5"))
+# Cada cuanto se chequean las replicas, cuanto se espera a cada una y cuanto atraso se tolera (MySQL)
+REPLICA_CHEQUEO = float(os.getenv("REPLICA_CHEQUEO", "5"))
+REPLICA_TIMEOUT = float(os.getenv("REPLICA_TIMEOUT", "2"))
+REPLICA_ATRASO_MAX = float(os.getenv("REPLICA_ATRASO_MAX", "5"))
+MAX_CLIENTES_PEGADOS = 10000
+
+# "GET /plantilla" -> tablas que lee (con ?expand=, tambien las relaciones). Solo estas rutas pueden ir a una replica; las que arman
+# indices en memoria (/turnos/activos, /clases/activas, ...) y todas las escrituras van a la primaria
+RUTAS_REPLICA = {
+    "GET /actividades": ("actividades",),
+    "GET /actividades/{id}": ("actividades",),
+    "GET /equipamiento": ("equipamiento", "actividades"),
+    "GET /equipamiento/{id}": ("equipamiento", "actividades"),
+    "GET /instructores": ("instructores",),
+    "GET /instructores/{ci}": ("instructores",),
+    "GET /clases": ("clase", "instructores", "actividades", "turnos"),
+    "GET /clases/{id}": ("clase", "instructores", "actividades", "turnos"),
+    "GET /clases/{id}/roster": TABLAS_VISTAS,
+    "GET /turnos": ("turnos",),
+    "GET /turnos/{id}": ("turnos",),
+    "GET /alumnos": ("alumnos",),
+    "GET /alumnos/{ci}/clases": TABLAS_VISTAS,
+    "GET /alumnosclase": ("alumno_clase",),
+}
+
+
+######################################################################
+#                            Read-your-writes                        #
+######################################################################
+
+# Clientes que escribieron hace poco, en memoria del proceso
+class PegadoLocal:
+    def __init__(self):
+        self.clientes = {}
+
+    async def marcar(self, cliente, segundos):
+        ahora = time.monotonic()
+        if len(self.clientes) >= MAX_CLIENTES_PEGADOS:
+            self.clientes = {clave: vence for clave, vence in self.clientes.items() if vence > ahora}
+        self.clientes[cliente] = ahora + segundos
+
+    async def activo(self, cliente):
+        vence = self.clientes.get(cliente)
+        return vence is not None and vence > time.monotonic()
+
+
+# Lo mismo en redis, para que el cliente quede pegado a la primaria en todos los workers
+class PegadoRedis:
+    def __init__(self, url, prefijo="pegado:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.prefijo = prefijo
+
+    async def marcar(self, cliente, segundos):
+        await self.redis.set(self.prefijo + cliente, 1, px=int(segundos * 1000))
+
+    async def activo(self, cliente):
+        return bool(await self.redis.exists(self.prefijo + cliente))
+
+
+def crear_pegado(url=CACHE_URL):
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return PegadoRedis(url)
+    return PegadoLocal()
+
+
+# El token identifica mejor al usuario que la IP (varios alumnos detras del mismo NAT)
+def _cliente(request):
+    autorizacion = request.headers.get("authorization")
+    if autorizacion:
+        return hashlib.blake2b(autorizacion.encode(), digest_size=12).hexdigest()
+    return request.client.host if request.client else "desconocido"
+
+
+######################################################################
+#                            Replicas                                #
+######################################################################
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.nombre = engine.url.render_as_string(hide_password=True)
+        self.sana = True
+        self.error = None
+        self.lecturas = 0
+
+
+# Elige el engine de cada request y vigila las replicas en segundo plano: SELECT 1 (y en MySQL el
+# atraso de SHOW REPLICA STATUS) cada REPLICA_CHEQUEO segundos. Una replica caida sale de la
+# rotacion hasta que el chequeo vuelva a andar; sin replicas sanas todo va a la primaria
+class Replicas:
+    def __init__(self, engines, pegado=None):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.pegado = pegado or crear_pegado()
+        self.siguiente = 0
+        self.motivos = {}
+        self._tarea = None
+
+    def _contar(self, motivo):
+        self.motivos[motivo] = self.motivos.get(motivo, 0) + 1
+
+    def _rotar(self):
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self.siguiente % len(self.replicas)]
+            self.siguiente += 1
+            if replica.sana:
+                return replica
+        return None
+
+    # tablas=None: las de RUTAS_REPLICA segun la ruta del request
+    async def elegir(self, request, primaria, tablas=None):
+        if not self.replicas:
+            return primaria
+        try:
+            cliente = _cliente(request)
+            if request.method not in ("GET", "HEAD"):
+                await self.pegado.marcar(cliente, REPLICA_VENTANA)
+                self._contar("escritura")
+                return primaria
+            if tablas is None:
+                ruta = getattr(request.scope.get("route"), "path", None)
+                tablas = RUTAS_REPLICA.get(f"GET {ruta}")
+                if tablas is None:
+                    self._contar("ruta")
+                    return primaria
+            if await self.pegado.activo(cliente):
+                self._contar("cliente_escribio")
+                return primaria
+            ahora = time.time()
+            for tabla in tablas:
+                _, modificado = await versiones_tablas.actual(tabla)
+                if ahora - modificado < REPLICA_VENTANA:
+                    self._contar("tabla_reciente")
+                    return primaria
+        except Exception:
+            logger.warning("No se pudo decidir la replica, se usa la primaria", exc_info=True)
+            self._contar("error")
+            return primaria
+        replica = self._rotar()
+        if replica is None:
+            self._contar("sin_replicas_sanas")
+            return primaria
+        replica.lecturas += 1
+        self._contar("replica")
+        return replica.engine
+
+    # Un error de conexion en medio de un request saca a la replica hasta el proximo chequeo
+    def fallo(self, engine, error):
+        for replica in self.replicas:
+            if replica.engine is engine and replica.sana:
+                replica.sana = False
+                replica.error = str(error).splitlines()[0]
+                logger.warning("Replica %s fuera de rotacion: %s", replica.nombre, error)
+
+    async def _probar(self, replica):
+        async with replica.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            if conn.dialect.name != "mysql":
+                return
+            try:
+                estado = (await conn.exec_driver_sql("SHOW REPLICA STATUS")).mappings().first()
+            except DBAPIError:
+                # MySQL < 8.0.22 o sin permiso REPLICATION CLIENT: queda solo el SELECT 1
+                return
+            if estado is not None:
+                atraso = estado.get("Seconds_Behind_Source")
+                if atraso is None or atraso > REPLICA_ATRASO_MAX:
+                    raise RuntimeError(f"replication lag {atraso}")
+
+    async def chequear(self):
+        for replica in self.replicas:
+            try:
+                await asyncio.wait_for(self._probar(replica), REPLICA_TIMEOUT)
+            except Exception as error:
+                if replica.sana:
+                    logger.warning("Replica %s fuera de rotacion: %s", replica.nombre, error)
+                replica.sana, replica.error = False, (str(error) or type(error).__name__).splitlines()[0]
+            else:
+                if not replica.sana:
+                    logger.info("Replica %s de vuelta en rotacion", replica.nombre)
+                replica.sana, replica.error = True, None
+
+    async def _vigilar(self):
+        while True:
+            await asyncio.sleep(REPLICA_CHEQUEO)
+            await self.chequear()
+
+    # Para el lifespan de main.py
+    async def iniciar(self):
+        if not self.replicas:
+            return
+        await self.chequear()
+        self._tarea = asyncio.ensure_future(self._vigilar())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def estado(self):
+        return {
+            "replicas": [
+                {"nombre": replica.nombre, "sana": replica.sana, "error": replica.error, "lecturas": replica.lecturas}
+                for replica in self.replicas
+            ],
+            "ventana_s": REPLICA_VENTANA,
+            "motivos": dict(self.motivos),
+        }
@@ -0,0 +1,58 @@
+from datetime import time, timedelta
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+# MySQL devuelve las columnas TIME como timedelta; se muestran como "HH:MM"
+def formatear_hora(valor):
+    if isinstance(valor, timedelta):
+        horas, resto = divmod(valor.seconds, 3600)
+        return f"{horas:02d}:{resto // 60:02d}"
+    if isinstance(valor, time):
+        return valor.strftime("%H:%M")
+    return str(valor)[:5]
+
+
+# Convierte filas en dicts usando los nombres de columna del cursor, no la posicion.
+# Los formateadores se aplican por columna (un map por columna, no un if por celda)
+def mapear_filas(columnas, filas, formateadores=None):
+    columnas = tuple(columnas)
+    if formateadores and filas:
+        por_columna = list(zip(*filas))
+        for i, columna in enumerate(columnas):
+            if columna in formateadores:
+                por_columna[i] = map(formateadores[columna], por_columna[i])
+        filas = zip(*por_columna)
+    return [dict(zip(columnas, fila)) for fila in filas]
+
+
+# Las mismas filas por columna: nombre -> tupla de valores, sin armar un dict por fila
+def transponer(columnas, filas, formateadores=None):
+    columnas = tuple(columnas)
+    por_columna = list(zip(*filas)) if filas else [()] * len(columnas)
+    formateadores = formateadores or {}
+    return {
+        columna: tuple(map(formateadores[columna], valores)) if columna in formateadores else valores
+        for columna, valores in zip(columnas, por_columna)
+    }
+
+
+def mapear_fila(columnas, fila, formateadores=None):
+    return mapear_filas(columnas, [fila], formateadores)[0]
+
+
+class RespuestaORJSON(JSONResponse):
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Para listados grandes: se serializa directo con orjson, sin pasar por la validacion del
+# response_model. Copia los headers que hayan puesto las dependencias (ETag, etc.)
+def respuesta_json(contenido, response=None):
+    respuesta = RespuestaORJSON(contenido)
+    if response is not None:
+        respuesta.raw_headers.extend(
+            (clave, valor) for clave, valor in response.headers.raw if clave != b"content-length"
+        )
+    return respuesta
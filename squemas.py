@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import date
+from typing import Generic, List, Optional, TypeVar
 
 class ActividadCreate(BaseModel):
     descripcion: str
@@ -79,4 +80,125 @@ class LoginRequest(BaseModel):
     ci: str
     contraseña: str
     
-#Aca lo que hay que poner es que se agregue el resto de metodos que faltan y hay que modificar el models
\ No newline at end of file
+#Aca lo que hay que poner es que se agregue el resto de metodos que faltan y hay que modificar el models
+
+# Modelos de respuesta
+
+T = TypeVar("T")
+
+class Listado(BaseModel, Generic[T]):
+    items: List[T]
+    next: Optional[str] = None
+
+class MensajeOut(BaseModel):
+    message: str
+
+class ActividadOut(BaseModel):
+    id: int
+    descripcion: str
+    costo: float
+
+class EquipamientoOut(BaseModel):
+    id: int
+    id_actividad: int
+    descripcion: str
+    costo: float
+
+class InstructorOut(BaseModel):
+    ci: str
+    nombre: str
+    apellido: str
+
+class ClaseOut(BaseModel):
+    id: int
+    ci_instructor: str
+    id_actividad: int
+    id_turno: int
+    dictada: bool
+
+class TurnoOut(BaseModel):
+    id: int
+    hora_inicio: str
+    hora_fin: str
+
+class TurnoSolapado(TurnoOut):
+    solapa_con: List[int]
+
+class AlumnoOut(BaseModel):
+    ci: str
+    nombre: str
+    apellido: str
+    telefono: str
+    fecha_nacimiento: date
+    correo: str
+
+class AlumnoClaseOut(BaseModel):
+    id_clase: int
+    ci: str
+    id_equipamiento: int
+    id_turno: Optional[int] = None
+
+class AlumnoEncontrado(BaseModel):
+    ci: str
+    nombre: str
+    apellido: str
+    correo: str
+
+# Con ?expand= (expandir.py) las relaciones pedidas vienen anidadas; las otras no aparecen
+
+class EquipamientoExpandido(EquipamientoOut):
+    actividad: Optional[ActividadOut] = None
+
+class ClaseExpandida(ClaseOut):
+    instructor: Optional[InstructorOut] = None
+    actividad: Optional[ActividadOut] = None
+    turno: Optional[TurnoOut] = None
+
+# Vistas desnormalizadas de vistas.py
+
+class EquipamientoResumen(BaseModel):
+    id: int
+    descripcion: str
+    costo: float
+
+class ClaseDetalle(BaseModel):
+    id: int
+    dictada: bool
+    instructor: InstructorOut
+    actividad: ActividadOut
+    turno: TurnoOut
+
+class AlumnoRoster(BaseModel):
+    ci: str
+    nombre: str
+    apellido: str
+    correo: str
+    equipamiento: List[EquipamientoResumen]
+
+class RosterOut(ClaseDetalle):
+    alumnos: List[AlumnoRoster]
+
+class ClaseDeAlumno(ClaseDetalle):
+    equipamiento: List[EquipamientoResumen]
+
+class ClasesAlumnoOut(BaseModel):
+    alumno: AlumnoOut
+    clases: List[ClaseDeAlumno]
+
+class LoginOut(BaseModel):
+    message: str
+    correo: str
+    ci: str
+    token: str
+    token_type: str = "bearer"
+    expira: int
+
+class ResultadoBulk(BaseModel):
+    index: int
+    ok: bool
+    error: Optional[str] = None
+
+class BulkOut(BaseModel):
+    insertados: int
+    errores: int
+    resultados: List[ResultadoBulk]
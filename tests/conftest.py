@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import date, time
+
+import httpx
+import pytest
+from sqlalchemy import insert
+
+# La configuracion se lee al importar los modulos (database.py, presupuesto.py, ...): el entorno
+# tiene que estar armado antes de que un test importe main. Base SQLite en un archivo temporal,
+# sin token, sin limite por cliente y con el presupuesto de sentencias estricto
+_directorio = tempfile.mkdtemp(prefix="tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_directorio, "tests.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["AUTH_REQUERIDA"] = "0"
+os.environ["ADMISION_RPS"] = "0"
+os.environ["DB_PRESUPUESTO_ESTRICTO"] = "1"
+os.environ["INDICES_AL_ARRANCAR"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import models
+from database import engine
+
+CLASES = 6
+ALUMNOS = 4
+
+
+# Una sola base para toda la corrida: los indices en memoria y la cache de lecturas viven en el
+# proceso, y una tabla recreada entre modulos los dejaria con filas que ya no existen.
+# Clase i: instructor i % 3 + 1, actividad i % 3 + 1, turno (i + 1) % 3 + 1 (clases 1 y 4 en el turno 3).
+# El turno 4 (sin clases) se solapa con el 1 y el 2. El alumno 104 esta inscripto en la clase 2
+@pytest.fixture(scope="session", autouse=True)
+def datos():
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Actividades.__table__), [
+            {"id": i, "descripcion": f"Actividad {i}", "costo": 100 * i} for i in range(1, 4)
+        ])
+        conn.execute(insert(models.Instructores.__table__), [
+            {"ci": str(i), "nombre": f"Nombre {i}", "apellido": f"Apellido {i}"} for i in range(1, 4)
+        ])
+        conn.execute(insert(models.Turnos.__table__), [
+            {"id": i, "hora_inicio": time(8 + i), "hora_fin": time(9 + i)} for i in range(1, 4)
+        ] + [{"id": 4, "hora_inicio": time(9, 30), "hora_fin": time(10, 30)}])
+        conn.execute(insert(models.Clase.__table__), [
+            {"id": i, "ci_instructor": str(i % 3 + 1), "id_actividad": i % 3 + 1, "id_turno": (i + 1) % 3 + 1, "dictada": False}
+            for i in range(1, CLASES + 1)
+        ])
+        conn.execute(insert(models.Equipamiento.__table__), [
+            {"id": i, "id_actividad": i % 3 + 1, "descripcion": f"Equipo {i}", "costo": 10 * i} for i in range(1, CLASES + 1)
+        ])
+        conn.execute(insert(models.Alumnos.__table__), [
+            {"ci": str(100 + i), "nombre": f"Alumno {i}", "apellido": f"Perez {i}", "telefono": f"099{i}",
+             "fecha_nacimiento": date(2000, 1, i), "correo": f"alumno{i}@correo.com"}
+            for i in range(1, ALUMNOS + 1)
+        ])
+        conn.execute(insert(models.AlumnoClase.__table__), {"id_clase": 2, "ci": "104", "id_equipamiento": 2, "id_turno": 1})
+    yield
+    models.Base.metadata.drop_all(engine)
+
+
+# Corre funcion(cliente) con la app levantada (lifespan incluido) y devuelve lo que devuelva
+def con_cliente(funcion):
+    async def correr():
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as cliente:
+                return await funcion(cliente)
+    return asyncio.run(correr())
@@ -0,0 +1,31 @@
+import admision
+from conftest import con_cliente
+
+
+def pedir_varias(ruta, cantidad):
+    async def correr(cliente):
+        return [await cliente.get(ruta) for _ in range(cantidad)]
+    return con_cliente(correr)
+
+
+# Con una rafaga de 2 el tercer request seguido del mismo cliente se rechaza enseguida, con Retry-After
+def test_limite_por_cliente_429(monkeypatch):
+    monkeypatch.setattr(admision.limite_por_cliente, "tasa", 0.5)
+    monkeypatch.setattr(admision.limite_por_cliente, "rafaga", 2)
+    monkeypatch.setattr(admision.limite_por_cliente, "cubetas", {})
+    respuestas = pedir_varias("/actividades", 3)
+    assert [respuesta.status_code for respuesta in respuestas] == [200, 200, 429]
+    assert respuestas[2].headers["retry-after"] == "2"
+    assert respuestas[2].json() == {"detail": "Too many requests"}
+
+
+# Sin lugar en el carril y sin espera: 503 en vez de quedar esperando una conexion del pool
+def test_sin_capacidad_503(monkeypatch):
+    monkeypatch.setattr(admision.limite_global, "en_uso", admision.limite_global.capacidad)
+    monkeypatch.setattr(admision.limite_global, "esperas", {nombre: 0 for nombre in admision.CARRILES})
+    (respuesta,) = pedir_varias("/actividades", 1)
+    assert respuesta.status_code == 503
+    assert respuesta.headers["retry-after"] == str(admision.ADMISION_RETRY_AFTER)
+    # /metrics no pasa por la admision
+    (metricas,) = pedir_varias("/metrics", 1)
+    assert metricas.status_code == 200
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from sqlalchemy import insert, update
+
+import auth
+import models
+from conftest import con_cliente
+from database import engine
+
+CI, CORREO, CONTRASEÑA = "101", "alumno1@correo.com", "secreta"
+
+
+@pytest.fixture(scope="module")
+def guardada():
+    guardada = auth.hashear(CONTRASEÑA)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), {"ci": CI, "correo": CORREO, "contraseña": guardada})
+    return guardada
+
+
+@pytest.fixture(autouse=True)
+def con_token(monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_REQUERIDA", True)
+
+
+def con_bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_login_y_token(guardada):
+    async def correr(cliente):
+        sin_token = await cliente.get("/actividades")
+        mala = await cliente.post("/login", json={"ci": CI, "contraseña": "otra"})
+        login = await cliente.post("/login", json={"ci": CI, "contraseña": CONTRASEÑA})
+        con_token = await cliente.get("/actividades", headers=con_bearer(login.json()["token"]))
+        return sin_token, mala, login, con_token
+
+    sin_token, mala, login, con_token = con_cliente(correr)
+    assert sin_token.status_code == 401
+    assert sin_token.headers["www-authenticate"] == "Bearer"
+    assert mala.status_code == 401
+    assert login.status_code == 200
+    assert con_token.status_code == 200
+
+
+@pytest.mark.parametrize("token", [
+    # Vencido
+    lambda guardada: auth.emitir_token(CI, CORREO, guardada, ahora=time.time() - auth.AUTH_TOKEN_TTL - 60)[0],
+    # Firma que no corresponde
+    lambda guardada: auth.emitir_token(CI, CORREO, guardada)[0][:-2] + "xx",
+    lambda guardada: "no-es-un-token",
+])
+def test_token_invalido(guardada, token):
+    async def correr(cliente):
+        return await cliente.get("/actividades", headers=con_bearer(token(guardada)))
+
+    respuesta = con_cliente(correr)
+    assert respuesta.status_code == 401
+    assert respuesta.json()["detail"] == "Invalid or expired token"
+
+
+# La huella de la contraseña va en el token: cambiarla invalida los tokens emitidos antes
+def test_cambio_de_contraseña_invalida_el_token(guardada):
+    # Otro vencimiento que el del login de arriba: un token que no esta en la cache de tokens verificados
+    token = auth.emitir_token(CI, CORREO, guardada, ahora=time.time() - 60)[0]
+    with engine.begin() as conn:
+        conn.execute(update(models.User.__table__).where(models.User.__table__.c.correo == CORREO).values(contraseña=auth.hashear("nueva")))
+
+    async def correr(cliente):
+        return await cliente.get("/actividades", headers=con_bearer(token))
+
+    assert con_cliente(correr).status_code == 401
@@ -0,0 +1,22 @@
+import aiomysql.cursors
+import pymysql.cursors
+import pytest
+from sqlalchemy.dialects import mysql
+
+from consultas import CONSULTAS
+
+INSERTAR = sorted(nombre for nombre in CONSULTAS if nombre.endswith(".insertar"))
+
+
+# Los bulk (bulk.insertar_en_lote) y los benchmarks hacen executemany con estas sentencias. En
+# MySQL el driver solo las junta en un INSERT de muchas filas si el SQL matchea RE_INSERT_VALUES:
+# con una subconsulta o una expresion en VALUES manda una sentencia por fila sin avisar
+@pytest.mark.parametrize("nombre", INSERTAR)
+@pytest.mark.parametrize("driver", [pymysql.cursors, aiomysql.cursors], ids=["pymysql", "aiomysql"])
+def test_insertar_es_multifila_en_mysql(nombre, driver):
+    sql = str(CONSULTAS[nombre].compile(dialect=mysql.dialect(paramstyle="pyformat")))
+    assert driver.RE_INSERT_VALUES.match(sql), sql
+
+
+def test_alumno_clase_tiene_insertar():
+    assert "alumno_clase.insertar" in INSERTAR
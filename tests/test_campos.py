@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import con_cliente
+
+
+def pedir(*rutas):
+    async def correr(cliente):
+        return [await cliente.get(ruta) for ruta in rutas]
+    return con_cliente(correr)
+
+
+# Las rutas que salen de los indices en memoria recortan las filas igual que los listados; la PK va siempre
+@pytest.mark.parametrize("ruta, esperadas", [
+    ("/turnos/activos?at=09:30&fields=hora_fin", {"id", "hora_fin"}),
+    ("/alumnos/search?q=alumno&fields=nombre,correo", {"ci", "nombre", "correo"}),
+    ("/instructores/search?q=nombre&fields=apellido", {"ci", "apellido"}),
+])
+def test_fields_en_busquedas(ruta, esperadas):
+    (respuesta,) = pedir(ruta)
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    filas = cuerpo if isinstance(cuerpo, list) else cuerpo["items"]
+    assert filas
+    assert all(set(fila) == esperadas for fila in filas)
+
+
+def test_fields_en_solapados_mantiene_solapa_con():
+    (respuesta,) = pedir("/turnos/solapados?fields=hora_inicio")
+    assert respuesta.status_code == 200
+    assert respuesta.json()
+    assert all(set(turno) == {"id", "hora_inicio", "solapa_con"} for turno in respuesta.json())
+
+
+@pytest.mark.parametrize("ruta", [
+    # El indice de alumnos no guarda el telefono
+    "/alumnos/search?q=alumno&fields=telefono",
+    "/turnos/activos?at=09:30&fields=costo",
+    # Vistas anidadas: no hay una tabla que proyectar
+    "/clases/1/roster?fields=id",
+    "/alumnos/101/clases?fields=ci",
+])
+def test_fields_no_soportado(ruta):
+    (respuesta,) = pedir(ruta)
+    assert respuesta.status_code == 400
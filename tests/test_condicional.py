@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import con_cliente
+from versiones import VersionesLocal, _workers_en, revisar_workers
+
+
+def clase(dictada):
+    return {"ci_instructor": "2", "id_actividad": 2, "id_turno": 2, "dictada": dictada}
+
+
+# Un 304 mientras no cambie nada; despues de una escritura en la tabla (o en una que se expande) el ETag viejo ya no vale
+def test_etag_se_invalida_con_escrituras():
+    async def correr(cliente):
+        primera = await cliente.get("/clases?limit=3")
+        etag = {"If-None-Match": primera.headers["etag"]}
+        igual = await cliente.get("/clases?limit=3", headers=etag)
+        escritura = await cliente.put("/clases/5", json=clase(True))
+        despues = await cliente.get("/clases?limit=3", headers=etag)
+        etag_nuevo = {"If-None-Match": despues.headers["etag"]}
+        relacionada = await cliente.put("/instructores/3", json={"ci": "3", "nombre": "Otro", "apellido": "Apellido 3"})
+        despues_relacionada = await cliente.get("/clases?limit=3", headers=etag_nuevo)
+        return primera, igual, escritura, despues, relacionada, despues_relacionada
+
+    primera, igual, escritura, despues, relacionada, despues_relacionada = con_cliente(correr)
+    assert primera.status_code == 200
+    assert igual.status_code == 304
+    assert escritura.status_code == 200
+    assert despues.status_code == 200
+    assert despues.headers["etag"] != primera.headers["etag"]
+    assert relacionada.status_code == 200
+    assert despues_relacionada.status_code == 200
+
+
+def test_etag_de_vista_con_inscripcion():
+    async def correr(cliente):
+        primera = await cliente.get("/clases/3/roster")
+        etag = {"If-None-Match": primera.headers["etag"]}
+        igual = await cliente.get("/clases/3/roster", headers=etag)
+        inscripcion = await cliente.post("/alumnosclase", json={"id_clase": 3, "ci": "104", "id_equipamiento": 3})
+        despues = await cliente.get("/clases/3/roster", headers=etag)
+        return primera, igual, inscripcion, despues
+
+    primera, igual, inscripcion, despues = con_cliente(correr)
+    assert primera.status_code == 200
+    assert igual.status_code == 304
+    assert inscripcion.status_code == 200
+    assert despues.status_code == 200
+    assert "104" in {alumno["ci"] for alumno in despues.json()["alumnos"]}
+
+
+@pytest.mark.parametrize("argumentos, workers", [
+    (["uvicorn", "main:app", "--workers", "4"], 4),
+    (["uvicorn", "main:app", "--workers=3"], 3),
+    (["gunicorn", "-w", "5", "main:app"], 5),
+    (["gunicorn", "-w2", "main:app"], 2),
+    (["python", "-m", "uvicorn", "main:app"], None),
+])
+def test_workers_en_la_linea_de_comando(argumentos, workers):
+    assert _workers_en(argumentos) == workers
+
+
+def test_varios_workers_con_versiones_en_memoria():
+    revisar_workers(1, VersionesLocal())
+    with pytest.raises(RuntimeError):
+        revisar_workers(2, VersionesLocal())
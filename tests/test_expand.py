@@ -0,0 +1,63 @@
+import asyncio
+import re
+
+import httpx
+
+import main
+from conftest import CLASES
+
+
+# Corre los GET contra la app (con su lifespan) y devuelve las respuestas
+def pedir(*rutas):
+    async def correr():
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as cliente:
+                return [await cliente.get(ruta) for ruta in rutas]
+    return asyncio.run(correr())
+
+
+# Sentencias que hizo el request, segun el Server-Timing de presupuesto.py
+def sentencias(respuesta):
+    return int(re.search(r'desc="(\d+) queries"', respuesta.headers["server-timing"]).group(1))
+
+
+# Con DB_PRESUPUESTO_ESTRICTO=1 un request que se pasa de su presupuesto falla; ademas se
+# controla la cantidad exacta: una sentencia por la pagina y una por relacion, no una por fila
+def test_clases_expand_una_sentencia_por_relacion():
+    sin_expand, con_expand = pedir("/clases?limit=50", "/clases?limit=50&expand=instructor,actividad,turno")
+    assert sin_expand.status_code == 200
+    assert sentencias(sin_expand) == 1
+    assert con_expand.status_code == 200
+    assert sentencias(con_expand) == 4
+    clases = con_expand.json()["items"]
+    assert len(clases) == CLASES
+    for clase in clases:
+        assert clase["instructor"]["ci"] == clase["ci_instructor"]
+        assert clase["actividad"]["id"] == clase["id_actividad"]
+        assert clase["turno"]["id"] == clase["id_turno"]
+        assert re.fullmatch(r"\d\d:\d\d", clase["turno"]["hora_inicio"])
+
+
+def test_clases_expand_una_relacion():
+    (respuesta,) = pedir("/clases?limit=40&expand=actividad")
+    assert respuesta.status_code == 200
+    assert sentencias(respuesta) == 2
+    assert all("instructor" not in clase for clase in respuesta.json()["items"])
+
+
+def test_equipamiento_expand_una_sentencia_por_relacion():
+    # limit distinto en cada pedido: la pagina no sale de la cache de lecturas
+    sin_expand, con_expand = pedir("/equipamiento?limit=30", "/equipamiento?limit=31&expand=actividad")
+    assert sin_expand.status_code == 200
+    assert sentencias(sin_expand) == 1
+    assert con_expand.status_code == 200
+    assert sentencias(con_expand) == 2
+    equipos = con_expand.json()["items"]
+    assert len(equipos) == CLASES
+    for equipo in equipos:
+        assert equipo["actividad"]["id"] == equipo["id_actividad"]
+
+
+def test_expand_desconocido():
+    (respuesta,) = pedir("/clases?expand=alumnos")
+    assert respuesta.status_code == 400
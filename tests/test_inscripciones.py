@@ -0,0 +1,80 @@
+import asyncio
+
+from sqlalchemy import insert
+
+import models
+from conftest import con_cliente
+from database import engine
+
+# Con los datos de conftest.py: clases 1 y 4 en el turno 3, clase 2 en el 1, clases 3 y 6 en el 2
+
+
+def inscribir(cliente, ci, id_clase, id_equipamiento=1):
+    return cliente.post("/alumnosclase", json={"id_clase": id_clase, "ci": ci, "id_equipamiento": id_equipamiento})
+
+
+def test_inscripcion_duplicada_y_mismo_turno():
+    async def correr(cliente):
+        primera = await inscribir(cliente, "101", 1)
+        # Otro equipamiento no la vuelve otra inscripcion
+        misma_clase = await inscribir(cliente, "101", 1, 2)
+        mismo_turno = await inscribir(cliente, "101", 4)
+        otro_turno = await inscribir(cliente, "101", 2)
+        return primera, misma_clase, mismo_turno, otro_turno
+
+    primera, misma_clase, mismo_turno, otro_turno = con_cliente(correr)
+    assert primera.status_code == 200
+    assert primera.json()["id_turno"] == 3
+    assert misma_clase.status_code == 409
+    assert "already enrolled in clase 1" in misma_clase.json()["detail"]
+    assert mismo_turno.status_code == 409
+    assert "same turno" in mismo_turno.json()["detail"]
+    assert otro_turno.status_code == 200
+
+
+def test_inscripcion_clase_inexistente():
+    async def correr(cliente):
+        return await inscribir(cliente, "104", 999)
+
+    assert con_cliente(correr).status_code == 400
+
+
+# Una inscripcion que el indice no vio (la hizo otro worker): la rechaza el UNIQUE (ci, id_turno)
+def test_mismo_turno_lo_rechaza_la_base():
+    async def correr(cliente):
+        assert (await inscribir(cliente, "103", 3)).status_code == 200
+
+        def de_otro_worker():
+            with engine.begin() as conn:
+                conn.execute(insert(models.AlumnoClase.__table__), {"id_clase": 1, "ci": "103", "id_equipamiento": 1, "id_turno": 3})
+
+        await asyncio.to_thread(de_otro_worker)
+        return await inscribir(cliente, "103", 4)
+
+    respuesta = con_cliente(correr)
+    assert respuesta.status_code == 409
+    assert "same turno" in respuesta.json()["detail"]
+
+
+# El turno de la clase se copia a alumno_clase por el ON UPDATE CASCADE: un cambio de turno que
+# deja a un alumno en dos clases a la vez es un 409, y uno valido llega a sus inscripciones
+def test_cambio_de_turno_de_clase():
+    def clase(id_turno):
+        return {"ci_instructor": "1", "id_actividad": 1, "id_turno": id_turno, "dictada": False}
+
+    async def correr(cliente):
+        assert (await inscribir(cliente, "102", 2)).status_code == 200
+        assert (await inscribir(cliente, "102", 6)).status_code == 200
+        choca = await cliente.put("/clases/6", json=clase(1))
+        cambia = await cliente.put("/clases/6", json=clase(3))
+        inscripciones = await cliente.get("/alumnosclase?limit=99")
+        # La clase 4 ya esta en el turno 3: ahora choca con la 6
+        mismo_turno = await inscribir(cliente, "102", 4)
+        return choca, cambia, inscripciones, mismo_turno
+
+    choca, cambia, inscripciones, mismo_turno = con_cliente(correr)
+    assert choca.status_code == 409
+    assert cambia.status_code == 200
+    fila = next(fila for fila in inscripciones.json()["items"] if fila["ci"] == "102" and fila["id_clase"] == 6)
+    assert fila["id_turno"] == 3
+    assert mismo_turno.status_code == 409
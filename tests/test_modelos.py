@@ -0,0 +1,39 @@
+import re
+
+import pytest
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+
+import main
+from conftest import con_cliente
+
+# Parametros de ruta y query obligatorios, con valores de los datos de conftest.py
+PARAMETROS = {"id": "2", "ci": "101"}
+URLS = {"/instructores/{ci}": "/instructores/1"}
+QUERY = {
+    "/clases/activas": "?at=10:30",
+    "/turnos/activos": "?at=10:30",
+    "/alumnos/search": "?q=alumno",
+    "/instructores/search": "?q=nombre",
+}
+
+
+# Los GET contestan con respuesta_json / formatos.py, que no pasan por el response_model: el
+# contrato tipado (el de /docs) se controla aca contra el JSON que sale de verdad
+def rutas_con_modelo():
+    for ruta in main.app.routes:
+        if isinstance(ruta, APIRoute) and "GET" in ruta.methods and ruta.response_model is not None:
+            url = URLS.get(ruta.path) or re.sub(r"\{(\w+)\}", lambda parametro: PARAMETROS[parametro.group(1)], ruta.path)
+            yield pytest.param(url + QUERY.get(ruta.path, ""), ruta.response_model, id=ruta.path)
+
+
+@pytest.mark.parametrize("url, modelo", list(rutas_con_modelo()))
+def test_respuesta_cumple_el_modelo(url, modelo):
+    async def correr(cliente):
+        return await cliente.get(url)
+
+    respuesta = con_cliente(correr)
+    assert respuesta.status_code == 200, respuesta.text
+    cuerpo = respuesta.json()
+    assert cuerpo
+    TypeAdapter(modelo).validate_python(cuerpo)
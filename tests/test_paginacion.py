@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import ALUMNOS, CLASES, con_cliente
+from paginacion import codificar_cursor
+
+
+# Sigue los cursores hasta la ultima pagina y devuelve las PK de todas las filas
+def recorrer(ruta, clave):
+    async def correr(cliente):
+        vistas, siguiente = [], None
+        while True:
+            respuesta = await cliente.get(ruta if siguiente is None else f"{ruta}&after={siguiente}")
+            assert respuesta.status_code == 200
+            cuerpo = respuesta.json()
+            assert len(cuerpo["items"]) <= 2
+            vistas.extend(fila[clave] for fila in cuerpo["items"])
+            siguiente = cuerpo["next"]
+            if siguiente is None:
+                return vistas
+    return con_cliente(correr)
+
+
+def test_cursor_recorre_todo_sin_repetir():
+    assert recorrer("/equipamiento?limit=2", "id") == list(range(1, CLASES + 1))
+    # PK de texto
+    assert recorrer("/alumnos?limit=2", "ci") == [str(100 + i) for i in range(1, ALUMNOS + 1)]
+
+
+def test_cursor_de_busqueda():
+    assert sorted(recorrer("/alumnos/search?q=alumno&limit=2", "ci")) == [str(100 + i) for i in range(1, ALUMNOS + 1)]
+
+
+@pytest.mark.parametrize("ruta", [
+    "/equipamiento?after=no-es-base64!",
+    "/equipamiento?after=" + codificar_cursor([]),
+    "/equipamiento?after=" + codificar_cursor([1, 2]),
+    # bool hereda de int
+    "/equipamiento?after=" + codificar_cursor([True]),
+    "/equipamiento?after=" + codificar_cursor([1.5]),
+    # Numero de fila negativo o fuera del indice
+    "/alumnos/search?q=alumno&after=" + codificar_cursor([0, "alumno", -5, "alumno"]),
+    "/alumnos/search?q=alumno&after=" + codificar_cursor([0, "alumno", 10 ** 6, "alumno"]),
+    "/alumnos/search?q=alumno&after=" + codificar_cursor([False, "alumno", 0, "alumno"]),
+    # El termino del cursor tiene que ser de la busqueda
+    "/alumnos/search?q=alumno&after=" + codificar_cursor([0, "perez", 0, "perez"]),
+])
+def test_cursor_invalido(ruta):
+    async def correr(cliente):
+        return await cliente.get(ruta)
+
+    respuesta = con_cliente(correr)
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"] == "Invalid cursor"
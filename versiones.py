@@ -0,0 +1,307 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from email.utils import formatdate, parsedate_to_datetime
+
+import orjson
+from fastapi import HTTPException, Request, Response
+
+from cache import CACHE_URL
+from consultas import CONSULTAS, PARTES
+from formatos import VARY, variante
+
+logger = logging.getLogger(__name__)
+
+# Cada version anota que filas cambio (las claves que pasa tabla_modificada), asi un indice en
+# memoria que quedo atras relee solo esas filas. Se guardan las ultimas CAMBIOS_GUARDADOS por
+# tabla; una escritura de mas de CAMBIOS_MAXIMO_CLAVES filas se anota sin claves (recarga entera)
+CAMBIOS_GUARDADOS = int(os.getenv("VERSIONES_CAMBIOS", "1000"))
+CAMBIOS_MAXIMO_CLAVES = int(os.getenv("VERSIONES_CAMBIOS_CLAVES", "1000"))
+
+
+def _anotables(claves):
+    if claves is None:
+        return None
+    claves = list(dict.fromkeys(claves))
+    return claves if len(claves) <= CAMBIOS_MAXIMO_CLAVES else None
+
+
+# Claves de las versiones desde+1..hasta, o None si falta alguna (ya se descarto) o si alguna
+# escritura no dijo que filas toco
+def _juntar(anotados, desde, hasta):
+    claves = set()
+    vistas = 0
+    for version, cambiadas in anotados:
+        if desde < version <= hasta:
+            if cambiadas is None:
+                return None
+            claves.update(cambiadas)
+            vistas += 1
+    return claves if vistas == hasta - desde else None
+
+
+# Version por tabla en memoria del proceso. El epoch cambia en cada arranque para que
+# un ETag emitido antes de reiniciar nunca coincida con uno nuevo
+class VersionesLocal:
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.inicio = time.time()
+        self.tablas = {}
+        self.anotados = {}
+
+    async def actual(self, tabla):
+        return self.tablas.get(tabla, (0, self.inicio))
+
+    async def incrementar(self, tabla, claves=None):
+        version, _ = self.tablas.get(tabla, (0, self.inicio))
+        self.tablas[tabla] = (version + 1, time.time())
+        self.anotados.setdefault(tabla, deque(maxlen=CAMBIOS_GUARDADOS)).append((version + 1, _anotables(claves)))
+        return version + 1
+
+    async def cambios(self, tabla, desde, hasta):
+        return _juntar(self.anotados.get(tabla, ()), desde, hasta)
+
+
+# Versiones compartidas en redis, para que todos los workers den el mismo ETag
+class VersionesRedis:
+    def __init__(self, url, prefijo="version:", prefijo_cambios="cambios:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.prefijo = prefijo
+        self.prefijo_cambios = prefijo_cambios
+        self.epoch = "r"
+
+    async def actual(self, tabla):
+        clave = self.prefijo + tabla
+        version, modificado = await self.redis.hmget(clave, "v", "t")
+        if modificado is None:
+            await self.redis.hsetnx(clave, "t", time.time())
+            return int(version or 0), time.time()
+        return int(version or 0), float(modificado)
+
+    # Las claves van a una lista en la misma transaccion que el HINCRBY, asi la posicion i de la
+    # lista es siempre la version actual - i
+    async def incrementar(self, tabla, claves=None):
+        clave = self.prefijo + tabla
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(clave, "v", 1)
+            pipe.hset(clave, "t", time.time())
+            pipe.lpush(self.prefijo_cambios + tabla, orjson.dumps(_anotables(claves)))
+            pipe.ltrim(self.prefijo_cambios + tabla, 0, CAMBIOS_GUARDADOS - 1)
+            version, *_ = await pipe.execute()
+        return version
+
+    async def cambios(self, tabla, desde, hasta):
+        # Primero solo las ultimas; si en el medio hubo mas escrituras, la lista entera
+        cuantos = min(hasta - desde + 64, CAMBIOS_GUARDADOS)
+        while True:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hget(self.prefijo + tabla, "v")
+                pipe.lrange(self.prefijo_cambios + tabla, 0, cuantos - 1)
+                actual, anotados = await pipe.execute()
+            actual = int(actual or 0)
+            if actual - desde <= len(anotados) or len(anotados) < cuantos or cuantos >= CAMBIOS_GUARDADOS:
+                break
+            cuantos = CAMBIOS_GUARDADOS
+        return _juntar(
+            ((actual - i, orjson.loads(datos)) for i, datos in enumerate(anotados) if desde < actual - i <= hasta), desde, hasta
+        )
+
+
+def crear_versiones(url=CACHE_URL):
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return VersionesRedis(url)
+    return VersionesLocal()
+
+
+versiones_tablas = crear_versiones()
+
+# --workers N (uvicorn, fastapi run, gunicorn) o -w N (gunicorn) en una lista de argumentos
+def _workers_en(argumentos):
+    for i, argumento in enumerate(argumentos):
+        nombre, igual, valor = argumento.partition("=")
+        if nombre in ("--workers", "-w"):
+            valor = valor if igual else (argumentos[i + 1] if i + 1 < len(argumentos) else "")
+        elif argumento.startswith("-w") and argumento[2:].isdigit():
+            valor = argumento[2:]
+        else:
+            continue
+        if valor.isdigit():
+            return int(valor)
+    return None
+
+
+# Workers que lanzo el servidor. Con --workers/-w la app corre en procesos hijos, asi que se mira
+# la linea de comando del padre (/proc, solo Linux) y GUNICORN_CMD_ARGS. None si no se sabe
+def workers_del_servidor():
+    argumentos = os.getenv("GUNICORN_CMD_ARGS", "").split()
+    try:
+        with open(f"/proc/{os.getppid()}/cmdline", "rb") as archivo:
+            argumentos += archivo.read().decode(errors="replace").split("\0")
+    except OSError:
+        pass
+    return _workers_en(argumentos)
+
+
+# Procesos que atienden la app: WEB_CONCURRENCY (uvicorn y gunicorn lo toman como cantidad de
+# workers por defecto) o lo que diga la linea de comando del servidor, lo que sea mayor
+WORKERS = max(int(os.getenv("WEB_CONCURRENCY", "1")), workers_del_servidor() or 1)
+
+
+# Para el lifespan de main.py. Con las versiones en memoria, un worker que no atendio la escritura
+# sigue con la version vieja y contesta 304 (y su cache) con datos viejos: no se arranca. Los
+# workers se cuentan por WEB_CONCURRENCY y por --workers/-w del proceso padre; un process manager
+# que lance varias copias de la app de otra forma no se detecta
+def revisar_workers(workers=WORKERS, versiones=versiones_tablas):
+    if workers > 1 and isinstance(versiones, VersionesLocal):
+        raise RuntimeError(
+            f"Hay {workers} workers (WEB_CONCURRENCY o --workers) y las versiones estan en memoria de "
+            "cada proceso: configurar CACHE_URL=redis://... o correr un solo worker"
+        )
+
+
+def _no_modificado(request, etag, modificado):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidatos = [valor.strip() for valor in if_none_match.split(",")]
+        return etag in candidatos or "*" in candidatos
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(modificado) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# Dependencia para GET condicional. El ETag sale de las versiones de las tablas que lee el
+# endpoint y de la query string, asi que un 304 se contesta sin tocar la base ni serializar.
+# negociado=True para las rutas con formatos.Formato: el formato y la compresion elegidos por
+# Accept / Accept-Encoding tambien van en el ETag
+class Condicional:
+    def __init__(self, *tablas, negociado=False):
+        self.tablas = tablas
+        self.negociado = negociado
+
+    async def __call__(self, request: Request, response: Response):
+        partes = [versiones_tablas.epoch]
+        modificado = 0.0
+        for tabla in self.tablas:
+            version, cambio = await versiones_tablas.actual(tabla)
+            partes.append(f"{tabla}.{version}")
+            modificado = max(modificado, cambio)
+        partes.append(str(sorted(request.query_params.multi_items())))
+        if self.negociado:
+            partes.append(variante(request))
+        etag = '"' + hashlib.blake2b("|".join(partes).encode(), digest_size=12).hexdigest() + '"'
+
+        cabeceras = {
+            "ETag": etag,
+            "Last-Modified": formatdate(modificado, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if self.negociado:
+            cabeceras["Vary"] = VARY
+        if _no_modificado(request, etag, modificado):
+            raise HTTPException(status_code=304, headers=cabeceras)
+        response.headers.update(cabeceras)
+
+
+# Filas por parte en la carga completa de un indice; entre parte y parte se cede el event loop
+CARGA_PARTE = int(os.getenv("INDICES_CARGA_PARTE", "500"))
+# Armar los indices en memoria al arrancar (en segundo plano) y no en el primer request que los usa
+INDICES_AL_ARRANCAR = os.getenv("INDICES_AL_ARRANCAR", "1") == "1"
+
+
+# Base para los indices en memoria que se arman desde la base (turnos, inscripciones, ...).
+# Guarda la version de cada tabla con la que se construyo; si otra escritura (de este u otro
+# worker) la cambio, la proxima consulta relee solo las filas anotadas con aplicar(), o lo
+# reconstruye entero con cargar() si los cambios ya no estan o son demasiados
+class IndiceVersionado:
+    tablas = ()
+
+    def __init__(self):
+        self.versiones = None
+        self._lock = None
+
+    async def _versiones_actuales(self):
+        return {tabla: (await versiones_tablas.actual(tabla))[0] for tabla in self.tablas}
+
+    async def cargar(self, db):
+        raise NotImplementedError
+
+    # Por defecto se recarga entero; los indices grandes releen solo las claves de cada tabla
+    async def aplicar(self, db, cambios):
+        await self.cargar(db)
+
+    # Para cargar(): las filas de una consulta registrada con consultas._partes, de a CARGA_PARTE
+    # por PK. Cada parte es una sentencia corta, sin un cursor abierto durante toda la carga (en
+    # SQLite un lector abierto frena a los que escriben), y entre parte y parte se cede el event loop
+    async def por_partes(self, db, nombre):
+        parametros = {"limite": CARGA_PARTE}
+        sentencia = CONSULTAS[nombre]
+        while True:
+            parte = (await db.execute(sentencia, parametros)).fetchall()
+            if parte:
+                yield parte
+            if len(parte) < CARGA_PARTE:
+                return
+            parametros = {"limite": CARGA_PARTE, **{f"after_{i}": valor for i, valor in enumerate(parte[-1][:PARTES[nombre]])}}
+            sentencia = CONSULTAS[f"{nombre}_siguiente"]
+            await asyncio.sleep(0)
+
+    # {tabla: claves cambiadas} desde la version del indice hasta actuales, o None para recargar
+    async def _cambios(self, actuales):
+        if self.versiones is None:
+            return None
+        cambios = {}
+        for tabla in self.tablas:
+            claves = await versiones_tablas.cambios(tabla, self.versiones[tabla], actuales[tabla])
+            if claves is None:
+                return None
+            cambios[tabla] = claves
+        if sum(map(len, cambios.values())) > CAMBIOS_MAXIMO_CLAVES:
+            return None
+        return cambios
+
+    async def asegurar(self, db):
+        if self.versiones == await self._versiones_actuales():
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Las versiones se leen antes que los datos: si algo cambia en el medio, se reconstruye de nuevo
+            actuales = await self._versiones_actuales()
+            if self.versiones != actuales:
+                cambios = await self._cambios(actuales)
+                if cambios is None:
+                    await self.cargar(db)
+                else:
+                    await self.aplicar(db, cambios)
+                self.versiones = actuales
+
+    # Despues de aplicar en el lugar una escritura propia: si el indice estaba en la version
+    # anterior queda al dia; si no, la proxima consulta aplica lo que falte (esta escritura incluida)
+    def confirmar(self, tabla, version):
+        if self.versiones is not None and self.versiones.get(tabla) == version - 1:
+            self.versiones[tabla] = version
+
+
+async def _precargar(indice, sesiones):
+    try:
+        async with sesiones() as db:
+            await indice.asegurar(db)
+    except Exception:
+        logger.exception("No se pudo precargar el indice %s", type(indice).__name__)
+
+
+# Para el lifespan de main.py: arma los indices en una tarea aparte, asi el arranque no los espera,
+# todos a la vez y cada uno con su sesion. Un request que llegue antes espera en asegurar() a que
+# termine el suyo, sin frenar al resto
+async def precargar(indices, sesiones):
+    await asyncio.gather(*(_precargar(indice, sesiones) for indice in indices))
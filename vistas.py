@@ -0,0 +1,94 @@
+from serializacion import formatear_hora
+
+
+# Vistas desnormalizadas armadas desde un solo join (consultas clase.roster y alumnos.clases).
+# Las filas vienen ordenadas, asi que se agrupan en una pasada: cada clase, alumno o
+# equipamiento aparece una vez en la respuesta aunque el join lo repita en varias filas
+
+# Tablas que lee cada vista: para el ETag y para decidir si puede ir a una replica
+TABLAS_VISTAS = ("clase", "instructores", "actividades", "turnos", "alumno_clase", "alumnos", "equipamiento")
+
+# Objeto anidado -> (clave en la respuesta, columna del cursor)
+INSTRUCTOR = (("ci", "instructor_ci"), ("nombre", "instructor_nombre"), ("apellido", "instructor_apellido"))
+ACTIVIDAD = (("id", "actividad_id"), ("descripcion", "actividad_descripcion"), ("costo", "actividad_costo"))
+TURNO = (("id", "turno_id"), ("hora_inicio", "hora_inicio"), ("hora_fin", "hora_fin"))
+EQUIPAMIENTO = (("id", "equipamiento_id"), ("descripcion", "equipamiento_descripcion"), ("costo", "equipamiento_costo"))
+ALUMNO_ROSTER = (("ci", "alumno_ci"), ("nombre", "alumno_nombre"), ("apellido", "alumno_apellido"), ("correo", "alumno_correo"))
+ALUMNO = tuple((columna, columna) for columna in ("ci", "nombre", "apellido", "telefono", "fecha_nacimiento", "correo"))
+
+
+# Devuelve una funcion fila -> dict que lee por posicion; las posiciones se buscan una sola vez
+def _extractor(columnas, campos):
+    posiciones = {columna: i for i, columna in enumerate(columnas)}
+    pares = [(clave, posiciones[columna]) for clave, columna in campos]
+    return lambda fila: {clave: fila[i] for clave, i in pares}
+
+
+class _Clase:
+    def __init__(self, columnas):
+        posiciones = {columna: i for i, columna in enumerate(columnas)}
+        self.id = posiciones["id"]
+        self.dictada = posiciones["dictada"]
+        self.instructor = _extractor(columnas, INSTRUCTOR)
+        self.actividad = _extractor(columnas, ACTIVIDAD)
+        self.turno = _extractor(columnas, TURNO)
+        self.equipamiento = _extractor(columnas, EQUIPAMIENTO)
+        self.equipamiento_id = posiciones["equipamiento_id"]
+
+    def __call__(self, fila):
+        turno = self.turno(fila)
+        turno["hora_inicio"] = formatear_hora(turno["hora_inicio"])
+        turno["hora_fin"] = formatear_hora(turno["hora_fin"])
+        return {
+            "id": fila[self.id],
+            # MySQL devuelve dictada como 0/1
+            "dictada": bool(fila[self.dictada]),
+            "instructor": self.instructor(fila),
+            "actividad": self.actividad(fila),
+            "turno": turno,
+        }
+
+
+# Una clase con sus alumnos y el equipamiento de cada uno. None si la clase no existe
+def armar_roster(columnas, filas):
+    if not filas:
+        return None
+    columnas = tuple(columnas)
+    clase = _Clase(columnas)
+    alumno = _extractor(columnas, ALUMNO_ROSTER)
+    ci = columnas.index("alumno_ci")
+
+    roster = clase(filas[0])
+    alumnos = []
+    actual = None
+    for fila in filas:
+        if fila[ci] is None:
+            continue
+        if actual is None or actual["ci"] != fila[ci]:
+            actual = alumno(fila)
+            actual["equipamiento"] = []
+            alumnos.append(actual)
+        actual["equipamiento"].append(clase.equipamiento(fila))
+    roster["alumnos"] = alumnos
+    return roster
+
+
+# Un alumno con sus clases (ordenadas por hora) y el equipamiento de cada una. None si el alumno no existe
+def armar_clases_alumno(columnas, filas):
+    if not filas:
+        return None
+    columnas = tuple(columnas)
+    clase = _Clase(columnas)
+    id_clase = clase.id
+
+    clases = []
+    actual = None
+    for fila in filas:
+        if fila[id_clase] is None:
+            continue
+        if actual is None or actual["id"] != fila[id_clase]:
+            actual = clase(fila)
+            actual["equipamiento"] = []
+            clases.append(actual)
+        actual["equipamiento"].append(clase.equipamiento(fila))
+    return {"alumno": _extractor(columnas, ALUMNO)(filas[0]), "clases": clases}